@@ -21,6 +21,20 @@ echo "🚀 Starting Integrated Deployment & Security Sync..."
 PROJECT_DIR="/home/softivite/thinkce"
 CLOUDFLARE_CONF="/etc/nginx/cloudflare_ips.conf"
 VENV_PATH="$PROJECT_DIR/venv"
+PUBLISH_DIR="$PROJECT_DIR/public"
+# "wsgi" runs sync gunicorn workers (fastest per request while nginx buffers
+# clients); "asgi" runs the async views on uvicorn workers, where one process
+# holds hundreds of slow connections. Compare with `manage.py loadtest --serve wsgi,asgi`.
+SERVER_MODE="${SERVER_MODE:-wsgi}"
+# The manage.py steps below need the settings the services get from .env
+# (ALLOWED_HOSTS, the database, EDGE_CACHE_ENABLED for the headers nginx adds
+# to pre-rendered pages, ...).
+if [ -f "$PROJECT_DIR/.env" ]; then
+    set -a
+    . "$PROJECT_DIR/.env"
+    set +a
+fi
+export EDGE_CACHE_ENABLED="${EDGE_CACHE_ENABLED:-False}"
 
 # 1. Pull latest code
 echo "📥 [1/6] Pulling latest changes from git..."
@@ -43,16 +57,24 @@ python manage.py migrate --noinput
 # 4. Static Assets
 echo "🎨 [4/6] Collecting static files..."
 python manage.py collectstatic --noinput
+python manage.py build_critical_css --host thinkce.org
+python manage.py build_image_derivatives
+python manage.py export_static_site --force --output "$PUBLISH_DIR" --host thinkce.org
 
 # 5. Permissions Management
 echo "🔐 [5/8] Setting production permissions..."
 sudo chown -R softivite:www-data "$PROJECT_DIR/media"
 sudo chown -R softivite:www-data "$PROJECT_DIR/static"
+mkdir -p "$PROJECT_DIR/var"
+sudo chown -R softivite:www-data "$PROJECT_DIR/var"
+sudo chown -R softivite:www-data "$PUBLISH_DIR"
 sudo chown softivite:www-data "$PROJECT_DIR/db.sqlite3"
 sudo chown softivite:www-data "$PROJECT_DIR"
 
 sudo chmod -R 775 "$PROJECT_DIR/media"
 sudo chmod -R 775 "$PROJECT_DIR/static"
+sudo chmod -R 775 "$PROJECT_DIR/var"
+sudo chmod -R 775 "$PUBLISH_DIR"
 sudo chmod -R 775 "../"
 
 sudo chmod 664 "$PROJECT_DIR/db.sqlite3"
@@ -98,9 +120,24 @@ fi
 
 # 8. Nginx Configuration Setup (SSL Enabled)
 echo "⚙️ [8/9] Updating Nginx configuration (HTTPS)..."
+# 103 Early Hints (main/preload.py): gunicorn only sends them on HTTP/1.1
+# requests, and only nginx 1.29+ passes them on (older versions can't handle
+# an interim response), so the proxy settings depend on the version.
+NGINX_VERSION="$(nginx -v 2>&1 | sed -n 's|.*nginx/\([0-9.]*\).*|\1|p')"
+if printf '1.29.0\n%s\n' "$NGINX_VERSION" | sort -V -C; then
+    # Only Cloudflare connects here, and it forwards interim responses
+    EARLY_HINTS_CONF="proxy_http_version 1.1;
+        early_hints 1;"
+else
+    echo "ℹ️  nginx $NGINX_VERSION is older than 1.29: no 103 Early Hints (Link headers still go out)"
+    EARLY_HINTS_CONF="# 103 Early Hints need nginx 1.29+"
+fi
 cat <<EOF > temp_nginx.conf
+# Cache-Control/Cache-Tag per pre-rendered page (written by export_static_site)
+include $PUBLISH_DIR/.edge-cache.map;
+
 upstream thinkce_app {
-    server http://localhost:5050;
+    server 127.0.0.1:5050;
 }
 
 server {
@@ -129,19 +166,46 @@ server {
 
     location /static/ {
         alias /var/www/thinkce/static/;
+        # Filenames are content-hashed by collectstatic, so they never change
+        gzip_static on;
+        # brotli_static on;  # enable when the ngx_brotli module is installed
+        expires max;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+        add_header X-Content-Type-Options "nosniff" always;
     }
 
     location /media/ {
         alias /var/www/thinkce/media/;
     }
 
+    # Pre-rendered pages (export_static_site) for anonymous GETs; POSTs,
+    # logged-in users and pending flash messages go to Django.
     location / {
+        error_page 418 = @django;
+        if (\$request_method !~ ^(GET|HEAD)\$) { return 418; }
+        if (\$http_cookie ~* "(sessionid|messages)=") { return 418; }
+        root $PUBLISH_DIR;
+        try_files \$uri/index.html @django;
+        # Edge cache policy and purge tags, as Django sends them (empty when off)
+        add_header Cache-Control \$thinkce_edge_cache_control;
+        add_header Cache-Tag \$thinkce_cache_tag;
+        # A location with its own add_header doesn't inherit the server's
+        add_header X-Frame-Options "SAMEORIGIN" always;
+        add_header X-XSS-Protection "1; mode=block" always;
+        add_header X-Content-Type-Options "nosniff" always;
+        add_header Referrer-Policy "no-referrer-when-downgrade" always;
+        add_header Content-Security-Policy "default-src 'self' https: data: 'unsafe-inline' 'unsafe-eval';" always;
+        add_header Strict-Transport-Security "max-age=31536000; includeSubDomains; preload" always;
+    }
+
+    location @django {
         proxy_pass http://thinkce_app;
         proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
         proxy_set_header X-Forwarded-Proto \$scheme;
         proxy_set_header Host \$http_host;
         proxy_redirect off;
         real_ip_header CF-Connecting-IP;
+        $EARLY_HINTS_CONF
     }
 }
 EOF
@@ -150,7 +214,16 @@ sudo mv temp_nginx.conf /etc/nginx/sites-available/thinkce
 echo "✅ Nginx SSL config updated."
 
 # 9. Gunicorn Systemd Service
-echo "⚙️ [9/10] Configuring Gunicorn systemd service..."
+echo "⚙️ [9/10] Configuring Gunicorn systemd service ($SERVER_MODE)..."
+# The ASGI entry point also routes the async views and turns off persistent
+# database connections (Django's advice under ASGI); both are set here too.
+if [ "$SERVER_MODE" = "asgi" ]; then
+    SERVER_CMD="gunicorn --workers 3 --worker-class uvicorn_worker.UvicornWorker --bind 127.0.0.1:5050 thinkcesite.asgi:application"
+    SERVER_ENV="ASYNC_VIEWS=True DB_CONN_MAX_AGE=0"
+else
+    SERVER_CMD="gunicorn --workers 3 --bind 127.0.0.1:5050 thinkcesite.wsgi:application"
+    SERVER_ENV="ASYNC_VIEWS=False"
+fi
 cat <<EOF > temp_service.service
 [Unit]
 Description=Gunicorn instance to serve ThinkCE
@@ -161,20 +234,145 @@ User=softivite
 Group=www-data
 WorkingDirectory=$PROJECT_DIR
 RuntimeDirectory=thinkce
+# Requests come through nginx, which only admits Cloudflare (.env can override)
+Environment=THROTTLE_TRUST_CF_HEADER=True $SERVER_ENV
 EnvironmentFile=$PROJECT_DIR/.env
-ExecStart=$VENV_PATH/bin/gunicorn --workers 3 --bind 0.0.0.0:5050 thinkcesite.wsgi:application
+ExecStart=$VENV_PATH/bin/$SERVER_CMD
 
 [Install]
 WantedBy=multi-user.target
 EOF
 
 sudo mv temp_service.service /etc/systemd/system/thinkce.service
+
+# Outbox worker: delivers contact/appointment notifications outside the request cycle
+cat <<EOF > temp_outbox.service
+[Unit]
+Description=ThinkCE email outbox worker
+After=network.target
+
+[Service]
+User=softivite
+Group=www-data
+WorkingDirectory=$PROJECT_DIR
+EnvironmentFile=$PROJECT_DIR/.env
+ExecStart=$VENV_PATH/bin/python manage.py send_outbox
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+sudo mv temp_outbox.service /etc/systemd/system/thinkce-outbox.service
+
+# Static export watcher: re-renders pre-rendered pages after admin edits
+cat <<EOF > temp_export.service
+[Unit]
+Description=ThinkCE static page exporter
+After=network.target
+
+[Service]
+User=softivite
+Group=www-data
+WorkingDirectory=$PROJECT_DIR
+EnvironmentFile=$PROJECT_DIR/.env
+ExecStart=$VENV_PATH/bin/python manage.py export_static_site --watch --output $PUBLISH_DIR --host thinkce.org
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+sudo mv temp_export.service /etc/systemd/system/thinkce-export.service
+
+# Write-buffer flusher: batches journaled submissions into the database
+# (idles when WRITE_BUFFER_ENABLED is off, drains leftovers after turning it off)
+cat <<EOF > temp_journal.service
+[Unit]
+Description=ThinkCE write-buffer flusher
+After=network.target
+
+[Service]
+User=softivite
+Group=www-data
+WorkingDirectory=$PROJECT_DIR
+EnvironmentFile=$PROJECT_DIR/.env
+ExecStart=$VENV_PATH/bin/python manage.py flush_journal
+Restart=always
+RestartSec=1
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+sudo mv temp_journal.service /etc/systemd/system/thinkce-journal.service
+
+# Image worker: builds the resized derivatives of images uploaded in the admin
+cat <<EOF > temp_images.service
+[Unit]
+Description=ThinkCE image derivative builder
+After=network.target
+
+[Service]
+User=softivite
+Group=www-data
+WorkingDirectory=$PROJECT_DIR
+EnvironmentFile=$PROJECT_DIR/.env
+ExecStart=$VENV_PATH/bin/python manage.py build_image_derivatives --watch --workers 1
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+sudo mv temp_images.service /etc/systemd/system/thinkce-images.service
+
+# Edge purger: purges the Cloudflare cache tags of models edited in the admin,
+# and the whole zone whenever it (re)starts, as after this deploy
+# (idles when EDGE_CACHE_ENABLED is off)
+cat <<EOF > temp_edge.service
+[Unit]
+Description=ThinkCE edge cache purger
+After=network.target
+
+[Service]
+User=softivite
+Group=www-data
+WorkingDirectory=$PROJECT_DIR
+EnvironmentFile=$PROJECT_DIR/.env
+ExecStartPre=$VENV_PATH/bin/python manage.py purge_edge_cache --everything
+ExecStart=$VENV_PATH/bin/python manage.py purge_edge_cache
+Restart=always
+RestartSec=5
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+sudo mv temp_edge.service /etc/systemd/system/thinkce-edge.service
 # 10. Service Refresh
 echo "♻️ [10/10] Restarting Application Services..."
 sudo systemctl daemon-reload
 sudo systemctl enable thinkce.service
 sudo systemctl restart thinkce.service
+# Cached pages and fragments outlive the workers. Their keys carry the deploy
+# token, so the old code's entries are unreachable already; this frees the space.
+python manage.py shell -c 'from django.core.cache import cache; cache.clear()'
+sudo systemctl enable thinkce-outbox.service
+sudo systemctl restart thinkce-outbox.service
+sudo systemctl enable thinkce-export.service
+sudo systemctl restart thinkce-export.service
+sudo systemctl enable thinkce-journal.service
+sudo systemctl restart thinkce-journal.service
+sudo systemctl enable thinkce-images.service
+sudo systemctl restart thinkce-images.service
 sudo nginx -t && sudo systemctl reload nginx
+# After nginx, so the edge refills from the new pages and headers
+sudo systemctl enable thinkce-edge.service
+sudo systemctl restart thinkce-edge.service
 
 echo "✨ ThinkCE is now updated, secured (HTTPS), and configured!"
 
@@ -197,7 +395,14 @@ To complete the security setup, please ensure the following:
 3. DNS & Proxying:
    - Ensure all A/CNAME records for thinkce.org are "Proxied" (Orange Cloud).
 
-4. Origin Cloaking (Active):
+4. Edge Caching (optional, EDGE_CACHE_ENABLED=True in .env):
+   - Set CLOUDFLARE_ZONE_ID and CLOUDFLARE_API_TOKEN (Zone > Cache Purge) in .env.
+   - Add a Cache Rule for thinkce.org: when the Cookie header contains neither
+     "sessionid=" nor "messages=", "Eligible for cache" with Edge TTL
+     "Use cache-control header if present"; otherwise "Bypass cache".
+   - Admin edits are then purged by tag within seconds (thinkce-edge.service).
+
+5. Origin Cloaking (Active):
    - Direct access to your server IP on port 80/443 will be blocked for anyone
      not using Cloudflare IPs.
 
@@ -1,23 +1,102 @@
+import csv
+import itertools
+import json
+
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from unfold.admin import ModelAdmin
+from unfold.decorators import action
+from unfold.paginator import InfinitePaginator
 from .models import (
     ContactSubmission, Company, Testimonial, Appointment, TeamMember,
     NewsletterSubscriber, SEOPageSettings, SiteConfiguration, SocialNetwork, Stat,
-    HeroCarouselItem
+    HeroCarouselItem, OutboundEmail, NewsletterCampaign
 )
+from .paginators import CachedCountPaginator
 
 # Custom Admin Branding
 admin.site.site_header = "ThinkCE Administration"
 admin.site.site_title = "ThinkCE Admin Portal"
 admin.site.index_title = "Welcome to ThinkCE Portal"
 
+class KeysetChangelistMixin:
+    """
+    Adds a "Load older" link to changelists that continues after the last row
+    shown (``WHERE (key) < (last key)``) instead of using a deep OFFSET, and
+    avoids the extra unfiltered COUNT(*) per page load.
+    """
+    keyset_fields = ()  # Descending sort fields; the primary key breaks ties
+    keyset_param = 'before'
+    change_list_template = 'admin/main/keyset_change_list.html'
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+    def changelist_view(self, request, extra_context=None):
+        cursor = request.GET.get(self.keyset_param)
+        if cursor is not None:
+            # Hide the parameter from ChangeList, which rejects unknown lookups.
+            request.GET = request.GET.copy()
+            del request.GET[self.keyset_param]
+            request.keyset_cursor = cursor
+        response = super().changelist_view(request, extra_context)
+
+        cl = getattr(response, 'context_data', {}).get('cl')
+        if cl is not None and ORDER_VAR not in cl.params and len(cl.result_list) == cl.list_per_page:
+            last = cl.result_list[len(cl.result_list) - 1]
+            values = [getattr(last, name) for name in self.keyset_fields] + [last.pk]
+            cursor = '~'.join(value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values)
+            response.context_data['keyset_older_url'] = cl.get_query_string({self.keyset_param: cursor}, [PAGE_VAR])
+        return response
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        cursor = getattr(request, 'keyset_cursor', None)
+        if cursor:
+            try:
+                queryset = queryset.filter(self._keyset_filter(cursor))
+            except (ValueError, ValidationError):
+                raise IncorrectLookupParameters(f'Invalid {self.keyset_param} cursor')
+        return queryset
+
+    def _keyset_filter(self, cursor):
+        names = list(self.keyset_fields) + ['pk']
+        raw = cursor.split('~')
+        if len(raw) != len(names):
+            raise ValueError(cursor)
+        opts = self.model._meta
+        values = [
+            (opts.pk if name == 'pk' else opts.get_field(name)).to_python(value)
+            for name, value in zip(names, raw)
+        ]
+        # (a, b, pk) < (x, y, z)  ==  a < x OR (a = x AND b < y) OR ...
+        condition = Q()
+        for index, name in enumerate(names):
+            equal = dict(zip(names[:index], values[:index]))
+            condition |= Q(**equal, **{f'{name}__lt': values[index]})
+        # The redundant a <= x bound lets SQLite seek the index instead of
+        # scanning it from the top.
+        return Q(**{f'{names[0]}__lte': values[0]}) & condition
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if getattr(request, 'keyset_cursor', None):
+            # Past the first pages nobody needs an exact total.
+            return InfinitePaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+
+
 @admin.register(ContactSubmission)
-class ContactSubmissionAdmin(ModelAdmin):
+class ContactSubmissionAdmin(KeysetChangelistMixin, ModelAdmin):
     list_display = ('name', 'email', 'subject', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('name', 'email', 'subject')
     readonly_fields = ('created_at',)
-    ordering = ('-created_at',)
+    ordering = ('-created_at', '-pk')
+    keyset_fields = ('created_at',)
 
 @admin.register(Company)
 class CompanyAdmin(ModelAdmin):
@@ -31,11 +110,12 @@ class TestimonialAdmin(ModelAdmin):
     search_fields = ('client_name', 'message')
 
 @admin.register(Appointment)
-class AppointmentAdmin(ModelAdmin):
+class AppointmentAdmin(KeysetChangelistMixin, ModelAdmin):
     list_display = ('name', 'service', 'date', 'time', 'email', 'created_at')
     list_filter = ('service', 'date', 'created_at')
     search_fields = ('name', 'email', 'message')
-    ordering = ('-date', '-time')
+    ordering = ('-date', '-time', '-pk')
+    keyset_fields = ('date', 'time')
 
 @admin.register(TeamMember)
 class TeamMemberAdmin(ModelAdmin):
@@ -43,11 +123,57 @@ class TeamMemberAdmin(ModelAdmin):
     list_editable = ('order',)
     search_fields = ('name', 'role')
 
+class Echo:
+    """File-like object whose write() just returns the value, for streaming csv."""
+    def write(self, value):
+        return value
+
+
 @admin.register(NewsletterSubscriber)
 class NewsletterSubscriberAdmin(ModelAdmin):
     list_display = ('email', 'created_at')
     search_fields = ('email',)
     ordering = ('-created_at',)
+    actions_list = ['export_csv', 'export_jsonl']
+
+    def _export_rows(self):
+        # iterator() streams from the cursor instead of caching the queryset
+        return NewsletterSubscriber.objects.order_by('pk').values_list('email', 'created_at').iterator(chunk_size=2000)
+
+    def _stream(self, lines, batch=1000):
+        # One write per batch of lines rather than per row
+        lines = iter(lines)
+        while chunk := ''.join(itertools.islice(lines, batch)):
+            yield chunk
+
+    @action(description="Export CSV", url_path="export-csv", permissions=["view"])
+    def export_csv(self, request):
+        writer = csv.writer(Echo())
+        rows = itertools.chain(
+            [writer.writerow(['email', 'created_at'])],
+            (writer.writerow([email, created_at.isoformat()]) for email, created_at in self._export_rows()),
+        )
+        response = StreamingHttpResponse(self._stream(rows), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="newsletter-subscribers.csv"'
+        return response
+
+    @action(description="Export JSONL", url_path="export-jsonl", permissions=["view"])
+    def export_jsonl(self, request):
+        rows = (
+            json.dumps({'email': email, 'created_at': created_at.isoformat()}) + '\n'
+            for email, created_at in self._export_rows()
+        )
+        response = StreamingHttpResponse(self._stream(rows), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="newsletter-subscribers.jsonl"'
+        return response
+
+@admin.register(NewsletterCampaign)
+class NewsletterCampaignAdmin(ModelAdmin):
+    list_display = ('subject', 'status', 'sent_count', 'failed_count', 'started_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    readonly_fields = ('last_subscriber_id', 'sent_count', 'failed_count', 'created_at', 'started_at', 'finished_at')
+
 @admin.register(SEOPageSettings)
 class SEOPageSettingsAdmin(ModelAdmin):
     list_display = ('page', 'title')
@@ -73,3 +199,19 @@ class SocialNetworkAdmin(ModelAdmin):
 class StatAdmin(ModelAdmin):
     list_display = ('label', 'number', 'order')
     list_editable = ('order',)
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'recipients')
+    readonly_fields = ('created_at', 'sent_at', 'attempts', 'last_error')
+    actions = ['retry_now']
+
+    @admin.action(description="Retry selected emails now")
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=OutboundEmail.STATUS_SENT).update(
+            status=OutboundEmail.STATUS_PENDING, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} email(s) queued for delivery.")
@@ -0,0 +1,141 @@
+"""
+Async versions of the public views, for uvicorn workers (ASGI).
+
+``main.urls`` routes these instead of ``main.views`` when ``ASYNC_VIEWS`` is
+on, which the ASGI entry point makes the default. Under WSGI an async view
+costs an ``async_to_sync`` event loop per request and gains nothing, so the
+sync views stay the default there.
+
+Reads and single-row writes use the async ORM (``async for``, ``aget``,
+``asave``), and the pages render on the event loop: the querysets and the
+site chrome are fetched beforehand and flash messages live in a cookie, so
+the render doesn't query. Booking an appointment is the one transaction (it
+claims the slot), so ``submit_appointment`` still runs in a worker thread.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError
+from django.db.models import QuerySet
+from django.shortcuts import redirect, render
+
+from . import journal, slots
+from .caching import cache_public_page, conditional_page
+from .context_processors import aget_site_chrome
+from .edge import edge_cache
+from .forms import AppointmentForm, ContactForm, NewsletterForm
+from .models import OutboundEmail
+from .throttling import throttle
+from .views import (
+    about_context, availability_days, availability_json, companies_context, home_context,
+    submit_appointment, subscribe_message,
+)
+
+
+async def _fetch(context):
+    """Evaluate the querysets in ``context`` with the async ORM."""
+    return {
+        key: [obj async for obj in value] if isinstance(value, QuerySet) else value
+        for key, value in context.items()
+    }
+
+
+async def arender(request, template_name, context=None):
+    request.site_chrome = await aget_site_chrome()
+    return render(request, template_name, await _fetch(context or {}))
+
+
+@edge_cache('home')
+@conditional_page
+@cache_public_page
+async def home(request):
+    return await arender(request, 'main/home.html', home_context())
+
+
+@edge_cache('companies')
+@conditional_page
+@cache_public_page
+async def companies(request):
+    return await arender(request, 'main/companies.html', companies_context())
+
+
+@edge_cache('services')
+@conditional_page
+@cache_public_page
+async def services(request):
+    return await arender(request, 'main/services.html')
+
+
+@edge_cache('about')
+@conditional_page
+@cache_public_page
+async def about(request):
+    return await arender(request, 'main/about.html', about_context())
+
+
+async def submit_contact(form):
+    if not form.is_valid():
+        return False
+    if settings.WRITE_BUFFER_ENABLED:
+        await sync_to_async(journal.append, thread_sensitive=False)('contact', form.cleaned_data)
+        return True
+    # Two autocommitted INSERTs rather than one transaction: a failure in
+    # between leaves a submission without its notification, which staff
+    # still see in the admin.
+    submission = form.instance
+    await submission.asave()
+    await OutboundEmail.build(*submission.notification(), [settings.CONTACT_EMAIL]).asave()
+    return True
+
+
+@edge_cache('contact')
+@throttle('contact')
+async def contact(request):
+    if request.method == 'POST':
+        form = ContactForm(request.POST)
+        if await submit_contact(form):
+            messages.success(request, 'Thank you! Your message has been sent successfully.')
+            return redirect('contact')
+    else:
+        form = ContactForm()
+
+    return await arender(request, 'main/contact.html', {'form': form})
+
+
+@edge_cache('appointment')
+@throttle('appointment')
+async def appointment(request):
+    if request.method == 'POST':
+        form = AppointmentForm(request.POST)
+        if await sync_to_async(submit_appointment)(form):
+            messages.success(request, 'Appointment request received! We will confirm shortly.')
+            return redirect('appointment')
+    else:
+        form = AppointmentForm()
+
+    return await arender(request, 'main/appointment.html', {'form': form})
+
+
+async def appointment_availability(request):
+    """Free appointment slots for the next ``days`` days (JSON)."""
+    return availability_json(await slots.aavailability(availability_days(request)))
+
+
+async def save_subscriber(form):
+    if not form.is_valid():
+        return False
+    if settings.WRITE_BUFFER_ENABLED:
+        await sync_to_async(journal.append, thread_sensitive=False)('subscribe', form.cleaned_data)
+        return True
+    try:
+        await form.instance.asave()
+    except IntegrityError:
+        return False  # Already registered
+    return True
+
+
+@throttle('subscribe')
+async def subscribe(request):
+    if request.method == 'POST':
+        subscribe_message(request, await save_subscriber(NewsletterForm(request.POST, check_unique=False)))
+    return redirect(request.META.get('HTTP_REFERER', 'home'))
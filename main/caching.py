@@ -0,0 +1,218 @@
+"""
+Full-page caching for the public marketing views.
+
+Anonymous GET responses are stored under a key built from the request URL
+and the content versions of every model the page renders, so saving any of
+those models in the admin makes the old entry unreachable. CSRF tokens are
+swapped for a placeholder before storing and filled in per request. Keys
+also carry a token of the deployed templates and static files, since the
+shared cache outlives deploys.
+
+The same versions give each page a strong ``ETag`` and a ``Last-Modified``
+(see ``conditional_page``), so revalidations are answered with a 304 before
+the view or the cache is touched.
+"""
+import hashlib
+import re
+from datetime import datetime, timezone
+from functools import wraps
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control
+from django.utils.timezone import localdate
+from django.views.decorators.http import condition
+
+from . import versions
+from .context_processors import CHROME_LABELS
+from .models import Company, HeroCarouselItem, TeamMember, Testimonial
+
+# Models rendered by each public page, on top of the site-wide chrome.
+PAGE_DEPENDENCIES = {
+    'home': [Testimonial, TeamMember, HeroCarouselItem],
+    'about': [TeamMember],
+    'services': [],
+    'companies': [Company],
+    'contact': [],
+    'appointment': [],
+}
+
+# Pages whose markup also depends on today's date (the booking date picker's
+# min/max), so their version changes at midnight as well
+DATED_PAGES = {'appointment'}
+
+CSRF_PLACEHOLDER = '__CSRF_TOKEN__'
+TEMPLATE_DIR = Path(__file__).resolve().parent / 'templates'
+_build_state = {}
+_csrf_input = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def strip_csrf_tokens(content, replacement=CSRF_PLACEHOLDER):
+    """Replace the value of every CSRF hidden input in ``content``."""
+    return _csrf_input.sub(rf'\g<1>{replacement}\g<2>', content)
+
+
+def page_labels(url_name):
+    return CHROME_LABELS + [model._meta.label_lower for model in PAGE_DEPENDENCIES.get(url_name, [])]
+
+
+def page_version(url_name):
+    version = versions.get_version(*page_labels(url_name))
+    if url_name in DATED_PAGES:
+        return f'{version}-{localdate().isoformat()}'
+    return version
+
+
+def page_last_modified(url_name):
+    """When any model rendered by the page last changed, as an aware datetime."""
+    updated = versions.last_updated(*page_labels(url_name))
+    if updated is None:
+        return None
+    return datetime.fromtimestamp(updated, tz=timezone.utc)
+
+
+def is_anonymous(request):
+    # Checking the cookies rather than request.user avoids a session lookup.
+    return (
+        settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and CookieStorage.cookie_name not in request.COOKIES
+    )
+
+
+def _cache_key(request):
+    url_name = request.resolver_match.url_name
+    url = request.build_absolute_uri()
+    digest = hashlib.md5(url.encode()).hexdigest()
+    return f'page:{url_name}:{page_version(url_name)}:{deploy_token()}:{digest}'
+
+
+def _is_cacheable(request):
+    return settings.PAGE_CACHE_ENABLED and request.method == 'GET' and is_anonymous(request)
+
+
+def _cached_response(request, cached):
+    content = cached['content'].replace(CSRF_PLACEHOLDER, get_token(request))
+    response = HttpResponse(content, content_type=cached['content_type'])
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def _cache_entry(response):
+    """The cache entry for ``response``, or None when it must not be shared."""
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return None
+    response['X-Page-Cache'] = 'miss'
+    content = strip_csrf_tokens(response.content.decode(response.charset))
+    return {'content': content, 'content_type': response['Content-Type']}
+
+
+def cache_public_page(view_func):
+    """Serve anonymous GETs of ``view_func`` (sync or async) from the page cache."""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped(request, *args, **kwargs):
+            if not _is_cacheable(request):
+                return await view_func(request, *args, **kwargs)
+            key = _cache_key(request)
+            cached = await cache.aget(key)
+            if cached is not None:
+                return _cached_response(request, cached)
+            response = await view_func(request, *args, **kwargs)
+            entry = _cache_entry(response)
+            if entry is not None:
+                await cache.aset(key, entry, settings.PAGE_CACHE_TIMEOUT)
+            return response
+        return _wrapped
+
+    @wraps(view_func)
+    def _wrapped(request, *args, **kwargs):
+        if not _is_cacheable(request):
+            return view_func(request, *args, **kwargs)
+        key = _cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            return _cached_response(request, cached)
+        response = view_func(request, *args, **kwargs)
+        entry = _cache_entry(response)
+        if entry is not None:
+            cache.set(key, entry, settings.PAGE_CACHE_TIMEOUT)
+        return response
+    return _wrapped
+
+
+def _build():
+    """``(token, mtime)`` of the deployed templates and static files, computed once per worker."""
+    if 'result' not in _build_state:
+        digest = hashlib.sha256(getattr(staticfiles_storage, 'manifest_hash', '').encode())
+        mtime = 0.0
+        for path in sorted(TEMPLATE_DIR.rglob('*')):
+            if path.is_file():
+                digest.update(path.read_bytes())
+                mtime = max(mtime, path.stat().st_mtime)
+        _build_state['result'] = (digest.hexdigest()[:12], mtime)
+    return _build_state['result']
+
+
+def deploy_token():
+    """Changes with the deployed templates and static files.
+
+    Part of every page and fragment cache key: the shared cache outlives
+    deploys, and content versions alone would keep serving what the old
+    templates rendered until the next admin edit.
+    """
+    return _build()[0]
+
+
+def _page_etag(request, *args, **kwargs):
+    if not settings.CONDITIONAL_GET_ENABLED or not is_anonymous(request):
+        return None
+    url_name = request.resolver_match.url_name
+    # The footer shows the current year.
+    return f'"{url_name}-{page_version(url_name)}-{deploy_token()}-{datetime.now(timezone.utc).year}"'
+
+
+def _page_last_modified(request, *args, **kwargs):
+    if not settings.CONDITIONAL_GET_ENABLED or not is_anonymous(request):
+        return None
+    now = datetime.now(timezone.utc)
+    times = [
+        page_last_modified(request.resolver_match.url_name),
+        datetime.fromtimestamp(_build()[1], tz=timezone.utc),
+        datetime(now.year, 1, 1, tzinfo=timezone.utc),
+    ]
+    return max(t for t in times if t is not None)
+
+
+def _must_revalidate(response):
+    # Without this, browsers would reuse the page for a while on the
+    # strength of Last-Modified alone and miss admin edits.
+    if response.has_header('ETag'):
+        patch_cache_control(response, max_age=0, must_revalidate=True)
+    return response
+
+
+def conditional_page(view_func):
+    """
+    Give anonymous responses of ``view_func`` (sync or async) an ``ETag`` and
+    ``Last-Modified`` built from content versions and the deployed code, and
+    answer matching ``If-None-Match``/``If-Modified-Since`` with a 304
+    without running it. Visitors with a session or flash messages are left
+    alone, like in ``cache_public_page``.
+    """
+    view = condition(etag_func=_page_etag, last_modified_func=_page_last_modified)(view_func)
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def _wrapped(request, *args, **kwargs):
+            return _must_revalidate(await view(request, *args, **kwargs))
+        return _wrapped
+
+    @wraps(view)
+    def _wrapped(request, *args, **kwargs):
+        return _must_revalidate(view(request, *args, **kwargs))
+    return _wrapped
@@ -1,20 +1,55 @@
+from . import metrics, versions
 from .models import SEOPageSettings, SiteConfiguration, SocialNetwork, Stat
-from django.urls import resolve
 
+CHROME_LABELS = [model._meta.label_lower for model in (SEOPageSettings, SiteConfiguration, SocialNetwork, Stat)]
+
+# Process-local snapshot of the site-wide data, rebuilt whenever one of the
+# content versions above changes (see main.signals).
+_chrome = {'version': None, 'data': None}
+
+
+def _build_chrome():
+    return {
+        'seo_by_page': {seo.page: seo for seo in SEOPageSettings.objects.all()},
+        'site_config': SiteConfiguration.objects.first(),
+        'social_networks': list(SocialNetwork.objects.all()),
+        'stats': list(Stat.objects.all()),
+    }
+
+
+def get_site_chrome():
+    version = versions.get_version(*CHROME_LABELS)
+    if _chrome['version'] != version or _chrome['data'] is None:
+        _chrome['data'] = _build_chrome()
+        _chrome['version'] = version
+    return _chrome['data']
+
+
+async def aget_site_chrome():
+    """``get_site_chrome`` for async views, read with the async ORM."""
+    version = versions.get_version(*CHROME_LABELS)
+    if _chrome['version'] != version or _chrome['data'] is None:
+        _chrome['data'] = {
+            'seo_by_page': {seo.page: seo async for seo in SEOPageSettings.objects.all()},
+            'site_config': await SiteConfiguration.objects.afirst(),
+            'social_networks': [network async for network in SocialNetwork.objects.all()],
+            'stats': [stat async for stat in Stat.objects.all()],
+        }
+        _chrome['version'] = version
+    return _chrome['data']
+
+
+@metrics.timed('context')
 def seo_settings(request):
-    try:
-        current_url_name = resolve(request.path_info).url_name
-        seo = SEOPageSettings.objects.filter(page=current_url_name).first()
-    except:
-        seo = None
-        
-    site_config = SiteConfiguration.objects.first()
-    social_networks = SocialNetwork.objects.all()
-    stats = Stat.objects.all()
-    
+    # Async views fetch the chrome before rendering on the event loop, where
+    # this can't query.
+    chrome = getattr(request, 'site_chrome', None) or get_site_chrome()
+    match = getattr(request, 'resolver_match', None)
+    seo = chrome['seo_by_page'].get(match.url_name) if match else None
+
     return {
         'seo': seo,
-        'site_config': site_config,
-        'social_networks': social_networks,
-        'stats': stats
+        'site_config': chrome['site_config'],
+        'social_networks': chrome['social_networks'],
+        'stats': chrome['stats'],
     }
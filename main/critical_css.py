@@ -0,0 +1,223 @@
+"""
+Critical CSS for the first paint of each public page.
+
+``manage.py build_critical_css`` renders every page and keeps the rules of
+``style.css`` that can apply to what is above the fold: the header and the
+first section of ``<main>``. The result is inlined in ``<head>`` by the
+``{% critical_css %}`` tag while the full stylesheet loads without blocking.
+
+Matching is deliberately generous: a selector is kept when every tag, class,
+id and attribute it names occurs in the above-the-fold markup, ignoring
+pseudo-classes and combinators. Results are stored in
+``CRITICAL_CSS_FILE`` together with a hash of the stylesheet and the page's
+templates, so the extraction only reruns when one of them changes.
+
+Content never enters the hash, so above-the-fold markup that depends on
+it is covered by ``VARIANTS``: the page is also rendered with each of them
+and the rules for all of the renderings are kept, whatever the database
+held at build time.
+"""
+import hashlib
+import json
+import os
+import re
+from html.parser import HTMLParser
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template.loader import get_template
+
+# Bump when the extraction itself changes, to invalidate stored results.
+ALGORITHM_VERSION = 2
+STYLESHEET = 'main/css/style.css'
+PAGES = ['home', 'about', 'services', 'companies', 'contact', 'appointment']
+SHARED_TEMPLATES = ['main/base.html', 'main/includes/picture.html']
+
+
+
+def _sample_carousel():
+    from .models import HeroCarouselItem
+    return [HeroCarouselItem(title='Sample', subtitle='Sample', image='hero/critical-css-sample.jpg')]
+
+
+# Context overrides each page is also rendered with (values are called at
+# build time): the home hero is either picture slides or the fallback slide.
+VARIANTS = {
+    'home': [{'carousel_items': _sample_carousel}, {'carousel_items': list}],
+}
+
+_state = {'stamp': None, 'pages': {}}
+
+_comment = re.compile(r'/\*.*?\*/', re.S)
+_pseudo = re.compile(r'::?[a-zA-Z-]+(\([^)]*\))?')
+_attribute = re.compile(r'\[\s*([^\]=~|^$*\s]+)[^\]]*\]')
+_animation = re.compile(r'animation(?:-name)?\s*:\s*([^;}]+)')
+
+
+def source_hash(url_name):
+    """Hash of everything the critical CSS of ``url_name`` is computed from."""
+    digest = hashlib.sha256(str(ALGORITHM_VERSION).encode())
+    paths = [finders.find(STYLESHEET)]
+    paths += [get_template(name).origin.name for name in [*SHARED_TEMPLATES, f'main/{url_name}.html']]
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class _AboveTheFold(HTMLParser):
+    """Collects the tags, classes, ids and attributes of the header and the first section."""
+
+    def __init__(self):
+        super().__init__()
+        self.tags, self.classes, self.ids = {'html', 'body', 'main'}, set(), set()
+        self.attrs = {'data-theme'}  # set on <html> by theme-toggle.js for dark mode
+        self.depth = 0  # nesting depth inside a region being collected
+        self.in_main = False
+        self.seen_section = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'main':
+            self.in_main = True
+        starts_region = not self.depth and (
+            tag == 'header' or (self.in_main and tag == 'section' and not self.seen_section)
+        )
+        if starts_region and tag == 'section':
+            self.seen_section = True
+        if self.depth or starts_region or tag in ('html', 'body'):
+            self.collect(tag, attrs)
+        if self.depth or starts_region:
+            if tag not in ('img', 'input', 'br', 'hr', 'meta', 'link', 'source', 'use'):
+                self.depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if self.depth:
+            self.collect(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self.depth and tag not in ('img', 'input', 'br', 'hr', 'meta', 'link', 'source', 'use'):
+            self.depth -= 1
+        if tag == 'main':
+            self.in_main = False
+
+    def collect(self, tag, attrs):
+        self.tags.add(tag)
+        for name, value in attrs:
+            self.attrs.add(name)
+            if name == 'class' and value:
+                self.classes.update(value.split())
+            elif name == 'id' and value:
+                self.ids.add(value)
+
+
+def _parse(css):
+    """Split a stylesheet into ``(prelude, body)`` pairs; grouping at-rules nest."""
+    nodes, i = [], 0
+    while i < len(css):
+        brace = css.find('{', i)
+        semicolon = css.find(';', i)
+        if brace == -1:
+            break
+        if semicolon != -1 and semicolon < brace and css[i:semicolon].strip().startswith('@'):
+            nodes.append((css[i:semicolon].strip(), None))  # @import, @charset
+            i = semicolon + 1
+            continue
+        depth, j = 1, brace + 1
+        while depth and j < len(css):
+            depth += {'{': 1, '}': -1}.get(css[j], 0)
+            j += 1
+        prelude, body = css[i:brace].strip(), css[brace + 1:j - 1]
+        if prelude.startswith(('@media', '@supports')):
+            nodes.append((prelude, _parse(body)))
+        else:
+            nodes.append((prelude, body.strip()))
+        i = j
+    return nodes
+
+
+def _selector_matches(selector, html):
+    selector = _pseudo.sub('', selector)
+    if any(name not in html.attrs for name in _attribute.findall(selector)):
+        return False
+    selector = _attribute.sub('', selector)
+    for part in re.split(r'[\s>+~]+', selector.strip()):
+        tag = re.match(r'[a-zA-Z][\w-]*', part)
+        if tag and tag.group().lower() not in html.tags:
+            return False
+        if any(name not in html.classes for name in re.findall(r'\.([\w-]+)', part)):
+            return False
+        if any(name not in html.ids for name in re.findall(r'#([\w-]+)', part)):
+            return False
+    return True
+
+
+def _minify(text):
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', re.sub(r'\s+', ' ', text))
+    return re.sub(r':\s+', ':', text).replace(';}', '}').strip()
+
+
+def _select(nodes, html, animations):
+    kept = []
+    for prelude, body in nodes:
+        if body is None or prelude.startswith('@font-face'):
+            kept.append(prelude + ';' if body is None else f'{prelude}{{{body}}}')
+        elif isinstance(body, list):
+            inner = _select(body, html, animations)
+            if inner:
+                kept.append(f'{prelude}{{{"".join(inner)}}}')
+        elif prelude.startswith('@'):
+            continue  # @keyframes are added once we know which are used
+        else:
+            selectors = [s.strip() for s in prelude.split(',') if _selector_matches(s, html)]
+            if selectors:
+                kept.append(f'{",".join(selectors)}{{{body}}}')
+                for value in _animation.findall(body):
+                    animations.update(value.replace(',', ' ').split())
+    return kept
+
+
+def extract(css, *page_htmls):
+    """The rules of ``css`` that can apply above the fold of any of ``page_htmls``."""
+    html = _AboveTheFold()
+    for page_html in page_htmls:
+        html.in_main = html.seen_section = False
+        html.feed(page_html)
+    nodes = _parse(_comment.sub('', css))
+    animations = set()
+    kept = _select(nodes, html, animations)
+    for prelude, body in nodes:
+        if prelude.startswith('@keyframes') and prelude.split()[1] in animations:
+            kept.append(f'{prelude}{{{body}}}')
+    return _minify(''.join(kept))
+
+
+def load():
+    """``{url_name: {'hash': ..., 'css': ...}}`` as last written by the build step."""
+    path = str(settings.CRITICAL_CSS_FILE)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {}
+    stamp = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+    if stamp != _state['stamp']:
+        try:
+            with open(path) as f:
+                _state['pages'] = json.load(f)
+        except ValueError:
+            _state['pages'] = {}
+        _state['stamp'] = stamp
+    return _state['pages']
+
+
+def save(pages):
+    path = str(settings.CRITICAL_CSS_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(pages, f)
+    os.replace(tmp, path)
+
+
+def for_page(url_name):
+    entry = load().get(url_name)
+    return entry['css'] if entry else ''
@@ -0,0 +1,113 @@
+"""
+Cloudflare edge caching of the public pages.
+
+Anonymous GETs of a view decorated with ``edge_cache(scope)`` may be kept by
+shared caches for ``EDGE_CACHE_TTLS[scope]`` seconds (``s-maxage``) while
+browsers still revalidate every time. A ``Cache-Tag`` header lists the
+content version labels of the models the response renders. As on the
+pre-rendered pages, the CSRF tokens are blanked and no CSRF cookie is set,
+so one copy suits every visitor; main.js fetches a token from ``/csrf/``
+when a form is submitted.
+
+Purging happens outside the request cycle. ``manage.py purge_edge_cache``
+watches the content versions. Once the changed models have been quiet for
+``EDGE_PURGE_DEBOUNCE`` seconds (or after ``EDGE_PURGE_MAX_DELAY`` at most)
+it purges their tags in batched API calls, through the client named by
+``EDGE_PURGE_CLIENT``.
+"""
+import json
+import logging
+import urllib.error
+import urllib.request
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.utils.module_loading import import_string
+
+from .caching import is_anonymous, page_labels, strip_csrf_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class PurgeError(Exception):
+    pass
+
+
+class CloudflarePurgeClient:
+    """Purges through the Cloudflare API (or a stand-in at ``EDGE_PURGE_API_BASE``)."""
+
+    def __init__(self):
+        self.url = f'{settings.EDGE_PURGE_API_BASE.rstrip("/")}/zones/{settings.CLOUDFLARE_ZONE_ID}/purge_cache'
+
+    def purge_tags(self, tags):
+        self._post({'tags': list(tags)})
+
+    def purge_everything(self):
+        self._post({'purge_everything': True})
+
+    def _post(self, payload):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode(), method='POST',
+            headers={'Authorization': f'Bearer {settings.CLOUDFLARE_API_TOKEN}', 'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=settings.EDGE_PURGE_TIMEOUT) as response:
+                result = json.load(response)
+        except urllib.error.HTTPError as e:
+            raise PurgeError(f'HTTP {e.code}: {e.read()[:500].decode(errors="replace")}') from e
+        except (OSError, ValueError) as e:
+            raise PurgeError(str(e)) from e
+        if not result.get('success'):
+            raise PurgeError(f'Purge rejected: {result.get("errors")}')
+
+
+class LoggingPurgeClient:
+    """Only logs what would be purged; for sites that aren't behind Cloudflare."""
+
+    def purge_tags(self, tags):
+        logger.info('Edge purge of tags: %s', ', '.join(tags))
+
+    def purge_everything(self):
+        logger.info('Edge purge of everything')
+
+
+def get_purge_client():
+    return import_string(settings.EDGE_PURGE_CLIENT)()
+
+
+def _mark(request, response, scope, labels):
+    if not (
+        settings.EDGE_CACHE_ENABLED and request.method in ('GET', 'HEAD')
+        and response.status_code in (200, 304) and is_anonymous(request)
+    ):
+        return response
+    if response.status_code == 200 and not response.streaming:
+        response.content = strip_csrf_tokens(response.content.decode(response.charset), '')
+    # The blank-token copy is shared, so it must not hand out this visitor's cookie.
+    request.META['CSRF_COOKIE_NEEDS_UPDATE'] = False
+    patch_cache_control(response, public=True, max_age=0, must_revalidate=True,
+                        s_maxage=settings.EDGE_CACHE_TTLS[scope])
+    response['Cache-Tag'] = ','.join(labels or page_labels(scope))
+    return response
+
+
+def edge_cache(scope, *labels):
+    """Let the edge cache anonymous responses of the decorated view (sync or async).
+
+    ``labels`` default to the models the ``scope`` page renders (see
+    ``caching.PAGE_DEPENDENCIES``).
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _wrapped(request, *args, **kwargs):
+                return _mark(request, await view_func(request, *args, **kwargs), scope, labels)
+            return _wrapped
+
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            return _mark(request, view_func(request, *args, **kwargs), scope, labels)
+        return _wrapped
+    return decorator
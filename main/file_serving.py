@@ -0,0 +1,231 @@
+"""
+Serving of STATIC_ROOT and MEDIA_ROOT from the application itself.
+
+Behind nginx both are served before a request reaches Django. Without it,
+as in a single gunicorn container, ``FileServingMiddleware`` answers them:
+files are looked up in an in-memory index (built as they are requested and
+re-checked with one ``stat`` unless their name is content-hashed), sent with
+``FileResponse`` so gunicorn can hand them to ``os.sendfile``, and support
+ETag/Last-Modified revalidation and single byte ranges. Hashed static files
+(the collectstatic manifest) are cached as ``immutable``; anything else for
+``SERVE_FILES_MAX_AGE`` seconds. The ``.br``/``.gz`` siblings written by
+``main.storage`` are served to clients that accept them.
+"""
+import mimetypes
+import os
+import stat
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Content-Encoding of the precompressed siblings, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+# The index is cleared rather than grown past this (media can be large)
+MAX_ENTRIES = 10000
+
+
+class FileIndex:
+    """URL-relative names under ``root`` -> what a response needs to know about them."""
+
+    def __init__(self, root, immutable_names=()):
+        self.root = str(root)
+        self.immutable_names = frozenset(immutable_names)
+        self.entries = {}
+
+    def lookup(self, name):
+        entry = self.entries.get(name)
+        if entry is not None and entry['immutable']:
+            return entry
+        try:
+            path = safe_join(self.root, name)
+            st = os.stat(path)
+        except (SuspiciousFileOperation, OSError, ValueError):
+            self.entries.pop(name, None)
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        if entry is not None and (entry['size'], entry['mtime']) == (st.st_size, int(st.st_mtime)):
+            return entry
+        if len(self.entries) >= MAX_ENTRIES:
+            self.entries.clear()
+        entry = self.entries[name] = self._entry(name, path, st)
+        return entry
+
+    def _entry(self, name, path, st):
+        mtime = int(st.st_mtime)
+        content_type, encoding = mimetypes.guess_type(name)
+        if encoding:
+            # A file that is itself compressed (.gz download), not a variant
+            content_type = 'application/octet-stream'
+        variants = {}
+        for coding, suffix in ENCODINGS:
+            try:
+                variant = os.stat(path + suffix)
+            except OSError:
+                continue
+            # A sibling older than the file was compressed from a previous version
+            if variant.st_mtime >= st.st_mtime and variant.st_size < st.st_size:
+                variants[coding] = (path + suffix, variant.st_size)
+        return {
+            'path': path,
+            'size': st.st_size,
+            'mtime': mtime,
+            'etag': f'"{mtime:x}-{st.st_size:x}"',
+            'content_type': content_type or 'application/octet-stream',
+            'immutable': name in self.immutable_names,
+            'variants': variants,
+        }
+
+
+def _prefix(url):
+    """The path part of STATIC_URL/MEDIA_URL, or None when it is on another host."""
+    if not url:
+        return None
+    parts = urlsplit(url)
+    if parts.netloc:
+        return None
+    return '/' + parts.path.strip('/') + '/'
+
+
+def _hashed_names():
+    try:
+        return set(staticfiles_storage.hashed_files.values())
+    except AttributeError:  # Not a manifest storage
+        return set()
+
+
+def get_indexes():
+    """(URL prefix, FileIndex) for static and media files that are served locally."""
+    indexes = []
+    if settings.STATIC_ROOT and (prefix := _prefix(settings.STATIC_URL)):
+        indexes.append((prefix, FileIndex(settings.STATIC_ROOT, _hashed_names())))
+    if settings.MEDIA_ROOT and (prefix := _prefix(settings.MEDIA_URL)):
+        indexes.append((prefix, FileIndex(settings.MEDIA_ROOT)))
+    return indexes
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q=') and q[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _byte_range(request, entry):
+    """(start, end) of a satisfiable single Range, None to send everything, or False (416)."""
+    header = request.headers.get('Range', '')
+    if not header.startswith('bytes=') or ',' in header:
+        # Multiple ranges are allowed to get the whole file instead
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != entry['etag'] and if_range != http_date(entry['mtime']):
+        return None
+    first, _, last = header[6:].strip().partition('-')
+    size = entry['size']
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+class _FileRange:
+    """A file limited to ``length`` bytes from ``start``.
+
+    gunicorn sends it with ``os.sendfile`` from the current offset for
+    Content-Length bytes; other servers read it in blocks.
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.file = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def _cache_headers(response, entry, etag):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(entry['mtime'])
+    if entry['immutable']:
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.SERVE_FILES_MAX_AGE)
+    if entry['variants']:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+def serve(request, entry):
+    """The response to a GET or HEAD of the indexed file ``entry``."""
+    path, size, coding, etag = entry['path'], entry['size'], None, entry['etag']
+    byte_range = _byte_range(request, entry) if 'Range' in request.headers else None
+    if byte_range is None:
+        accepted = _accepted_encodings(request)
+        for candidate, (variant_path, variant_size) in entry['variants'].items():
+            if candidate in accepted:
+                # Each encoding is its own representation, with its own strong ETag
+                path, size, coding = variant_path, variant_size, candidate
+                etag = f'{etag[:-1]}-{candidate}"'
+                break
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=entry['mtime'])
+    if not_modified is not None:
+        return _cache_headers(not_modified, entry, etag)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is not None:
+        # Ranges are always of the identity encoding, which is what media players ask for
+        start, end = byte_range
+        size = end - start + 1
+    if request.method == 'HEAD':
+        # Headers only; gunicorn would drop (and warn about) a body
+        response = HttpResponse(content_type=entry['content_type'], status=200 if byte_range is None else 206)
+    elif byte_range is not None:
+        response = FileResponse(_FileRange(open(path, 'rb'), start, size),
+                                content_type=entry['content_type'], status=206)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=entry['content_type'])
+        response.headers.pop('Content-Disposition', None)
+    if byte_range is not None:
+        response['Content-Range'] = f'bytes {start}-{end}/{entry["size"]}'
+    elif coding:
+        response['Content-Encoding'] = coding
+    response['Content-Length'] = size
+    response['Accept-Ranges'] = 'bytes'
+    return _cache_headers(response, entry, etag)
@@ -1,4 +1,9 @@
+from datetime import timedelta
+
 from django import forms
+from django.conf import settings
+from django.utils import timezone
+from . import slots
 from .models import ContactSubmission, Appointment, NewsletterSubscriber
 
 class ContactForm(forms.ModelForm):
@@ -22,11 +27,46 @@ class AppointmentForm(forms.ModelForm):
             'phone': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Phone Number (Optional)'}),
             'service': forms.Select(attrs={'class': 'form-control'}),
             'date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
-            'time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time'}),
+            'time': forms.TimeInput(attrs={'class': 'form-control', 'type': 'time', 'list': 'appointment-slots'}),
             'message': forms.Textarea(attrs={'class': 'form-control', 'placeholder': 'Additional Details (Optional)', 'rows': 3}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        today = timezone.localdate()
+        self.fields['date'].widget.attrs.update({
+            'min': today.isoformat(),
+            'max': (today + timedelta(days=settings.APPOINTMENT_BOOKING_DAYS - 1)).isoformat(),
+        })
+        self.fields['time'].widget.attrs['step'] = settings.APPOINTMENT_SLOT_MINUTES * 60
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date, time = cleaned_data.get('date'), cleaned_data.get('time')
+        if date is None or time is None:
+            return cleaned_data
+        now = timezone.localtime()
+        if date < now.date() or (date == now.date() and time <= now.time()):
+            raise forms.ValidationError('Please choose a time in the future.')
+        if date >= now.date() + timedelta(days=settings.APPOINTMENT_BOOKING_DAYS):
+            raise forms.ValidationError(f'Appointments can be booked up to {settings.APPOINTMENT_BOOKING_DAYS} days ahead.')
+        if not slots.is_slot(date, time):
+            raise forms.ValidationError('Please choose one of the available time slots.')
+        return cleaned_data
+
 class NewsletterForm(forms.ModelForm):
+    def __init__(self, *args, check_unique=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.check_unique = check_unique
+
+    def clean_email(self):
+        return NewsletterSubscriber.normalize_email(self.cleaned_data['email'])
+
+    def validate_unique(self):
+        # The async view can't query here; it leaves duplicates to the INSERT
+        if self.check_unique:
+            super().validate_unique()
+
     class Meta:
         model = NewsletterSubscriber
         fields = ['email']
@@ -0,0 +1,147 @@
+"""
+Resized WebP/AVIF/JPEG derivatives of uploaded images.
+
+Derivatives are written next to each other under ``derivatives/`` in the
+default storage, together with a small JSON manifest listing the widths that
+were generated (an image is never upscaled). Templates read the manifest via
+``ResponsiveImage`` to emit ``srcset``; when it is missing they fall back to
+the original upload. ``manage.py build_image_derivatives --watch`` builds
+them for new uploads outside the request cycle.
+"""
+import json
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+DERIVATIVE_DIR = 'derivatives'
+
+# ext -> (Pillow format, mime type, save options), best compression first.
+DERIVATIVE_FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 50}),
+    'webp': ('WEBP', 'image/webp', {'quality': 75, 'method': 6}),
+    'jpg': ('JPEG', 'image/jpeg', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+
+_manifests = {}
+
+
+def _formats():
+    return {ext: spec for ext, spec in DERIVATIVE_FORMATS.items() if ext != 'avif' or features.check('avif')}
+
+
+def derivative_name(name, width, ext):
+    root, _ = os.path.splitext(name)
+    return f'{DERIVATIVE_DIR}/{root}-{width}w.{ext}'
+
+
+def manifest_name(name):
+    root, _ = os.path.splitext(name)
+    return f'{DERIVATIVE_DIR}/{root}.json'
+
+
+def get_manifest(name):
+    """Return ``{'widths': [...], 'formats': [...], 'size': [w, h]}`` or None."""
+    if name in _manifests:
+        return _manifests[name]
+    path = manifest_name(name)
+    if not default_storage.exists(path):
+        return None
+    with default_storage.open(path) as f:
+        manifest = json.load(f)
+    _manifests[name] = manifest
+    return manifest
+
+
+def generate_derivatives(name, force=False):
+    """Write every derivative of the stored image ``name``; return the manifest."""
+    if not force and get_manifest(name) is not None:
+        return get_manifest(name)
+
+    with default_storage.open(name) as f:
+        original = ImageOps.exif_transpose(Image.open(f))
+        original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'A' in original.getbands() else 'RGB')
+
+    formats = _formats()
+    widths = sorted({min(width, original.width) for width in settings.IMAGE_DERIVATIVE_WIDTHS})
+    for width in widths:
+        height = round(original.height * width / original.width)
+        resized = original.resize((width, height), Image.LANCZOS) if width != original.width else original
+        for ext, (fmt, _, options) in formats.items():
+            image = resized.convert('RGB') if fmt == 'JPEG' else resized
+            buffer = BytesIO()
+            image.save(buffer, fmt, **options)
+            target = derivative_name(name, width, ext)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(buffer.getvalue()))
+
+    manifest = {'widths': widths, 'formats': list(formats), 'size': [original.width, original.height]}
+    path = manifest_name(name)
+    if default_storage.exists(path):
+        default_storage.delete(path)
+    default_storage.save(path, ContentFile(json.dumps(manifest).encode()))
+    _manifests[name] = manifest
+    return manifest
+
+
+def delete_derivatives(name):
+    """Delete the derivatives and the manifest of the stored image ``name``."""
+    manifest = get_manifest(name)
+    _manifests.pop(name, None)
+    targets = [manifest_name(name)]
+    if manifest is not None:
+        targets += [derivative_name(name, width, ext) for width in manifest['widths'] for ext in manifest['formats']]
+    for target in targets:
+        if default_storage.exists(target):
+            default_storage.delete(target)
+
+
+class ResponsiveImage:
+    """Template-facing view of an ImageField and its derivatives."""
+
+    def __init__(self, field_file):
+        self.file = field_file
+        self.manifest = get_manifest(field_file.name) if field_file else None
+
+    def __bool__(self):
+        return bool(self.file)
+
+    def _srcset(self, ext):
+        return ', '.join(
+            f'{default_storage.url(derivative_name(self.file.name, width, ext))} {width}w'
+            for width in self.manifest['widths']
+        )
+
+    @property
+    def sources(self):
+        """``(mime type, srcset)`` pairs for ``<source>`` elements."""
+        if not self.manifest:
+            return []
+        return [
+            (DERIVATIVE_FORMATS[ext][1], self._srcset(ext))
+            for ext in self.manifest['formats'] if ext != 'jpg'
+        ]
+
+    @property
+    def srcset(self):
+        return self._srcset('jpg') if self.manifest else ''
+
+    @property
+    def src(self):
+        if not self.manifest:
+            return self.file.url
+        return default_storage.url(derivative_name(self.file.name, self.manifest['widths'][-1], 'jpg'))
+
+    @property
+    def width(self):
+        return self.manifest['size'][0] if self.manifest else None
+
+    @property
+    def height(self):
+        return self.manifest['size'][1] if self.manifest else None
@@ -0,0 +1,207 @@
+"""
+Group-commit write buffer for form submissions.
+
+With ``WRITE_BUFFER_ENABLED`` the contact and subscribe views don't write to
+the database themselves: the validated submission is appended as one JSON
+line to a journal segment under ``VAR_DIR/journal`` and the user gets their
+response straight away. ``manage.py flush_journal`` tails the segments and
+inserts whatever has accumulated in one transaction every few milliseconds.
+
+Each worker appends to its own segment, ``<pid>-<period>.jsonl``, and starts
+a new one every ``WRITE_BUFFER_SEGMENT_SECONDS``. The flusher records how far
+it got in each segment (``JournalCheckpoint``) in the same transaction as the
+rows, so after a crash of either side every line is inserted exactly once.
+A line only counts once its newline is on disk, so a torn write is ignored
+until the rest arrives. Lines survive a worker crash in the page cache; set
+``WRITE_BUFFER_FSYNC`` to also survive a power cut, at the cost of an fsync
+per submission.
+
+A line that can't be decoded into a known kind of record, or whose record
+the database refuses, is moved to ``journal/quarantine/<segment>`` and
+logged, and the checkpoint goes past it, so one bad line doesn't hold up
+everything queued behind it. A refused batch is retried record by record to
+find the culprits.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, transaction
+
+from .models import ContactSubmission, JournalCheckpoint, NewsletterSubscriber, OutboundEmail
+
+logger = logging.getLogger(__name__)
+_state = {'path': None, 'fd': None}
+_lock = threading.Lock()
+# Flusher side: segment name -> offset, as committed to JournalCheckpoint.
+_checkpoints = None
+_swept = 0.0
+
+
+def _journal_dir():
+    return os.path.join(settings.VAR_DIR, 'journal')
+
+
+def _segment_path():
+    period = int(time.time() // settings.WRITE_BUFFER_SEGMENT_SECONDS)
+    return os.path.join(_journal_dir(), f'{os.getpid()}-{period}.jsonl')
+
+
+def append(kind, data):
+    """Durably queue one ``kind`` record (see ``HANDLERS``) for the flusher."""
+    line = json.dumps({'kind': kind, 'data': data}, separators=(',', ':')) + '\n'
+    path = _segment_path()
+    with _lock:
+        if path != _state['path']:
+            if _state['fd'] is not None:
+                os.close(_state['fd'])
+            os.makedirs(_journal_dir(), exist_ok=True)
+            _state['fd'] = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+            _state['path'] = path
+        os.write(_state['fd'], line.encode())
+        if settings.WRITE_BUFFER_FSYNC:
+            os.fsync(_state['fd'])
+
+
+def _store_contact(rows):
+    submissions = ContactSubmission.objects.bulk_create(ContactSubmission(**data) for data in rows)
+    OutboundEmail.objects.bulk_create(
+        OutboundEmail.build(*submission.notification(), [settings.CONTACT_EMAIL]) for submission in submissions
+    )
+
+
+def _store_subscribe(rows):
+    # The same address may be queued twice before either reaches the table.
+    NewsletterSubscriber.objects.bulk_create((NewsletterSubscriber(**data) for data in rows), ignore_conflicts=True)
+
+
+HANDLERS = {
+    'contact': _store_contact,
+    'subscribe': _store_subscribe,
+}
+
+# What a record the database can't take raises (a missing or unknown field,
+# a value of the wrong type); anything else, such as a locked database, is
+# retried with the whole batch.
+RECORD_ERRORS = (DataError, IntegrityError, TypeError, ValueError, ValidationError)
+
+
+def _decode(line):
+    """The record on ``line``, or None if it isn't one the flusher can store."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or record.get('kind') not in HANDLERS or not isinstance(record.get('data'), dict):
+        return None
+    return record
+
+
+def _quarantine(path, offset, line, reason):
+    name = os.path.basename(path)
+    logger.error('Quarantined the journal line at %s:%d (%s): %r', name, offset, reason, line[:200])
+    directory = os.path.join(_journal_dir(), 'quarantine')
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), 'ab') as f:
+        f.write(line)
+
+
+def _read_lines(path, offset, limit):
+    """
+    Complete lines of ``path`` after ``offset``; returns ``(entries, new
+    offset)``, an entry being ``(path, offset, line, record)``.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        entries = []
+        while len(entries) < limit:
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                break  # End of file, or a line still being written
+            record = _decode(line)
+            if record is None:
+                # Copied aside before the checkpoint passes it; a crash in
+                # between only copies it twice.
+                _quarantine(path, offset, line, 'not a record')
+            else:
+                entries.append((path, offset, line, record))
+            offset += len(line)
+    return entries, offset
+
+
+def _store(entries):
+    pending = {}
+    for _, _, _, record in entries:
+        pending.setdefault(record['kind'], []).append(record['data'])
+    for kind, rows in pending.items():
+        HANDLERS[kind](rows)
+
+
+def _store_each(entries):
+    """Store ``entries`` one by one, quarantining those the database refuses."""
+    for path, offset, line, record in entries:
+        try:
+            with transaction.atomic():
+                HANDLERS[record['kind']]([record['data']])
+        except RECORD_ERRORS as e:
+            _quarantine(path, offset, line, f'{type(e).__name__}: {e}')
+
+
+def flush(batch_size):
+    """Insert up to ``batch_size`` queued records in one transaction; returns the count."""
+    global _checkpoints, _swept
+    try:
+        names = sorted(name for name in os.listdir(_journal_dir()) if name.endswith('.jsonl'))
+    except FileNotFoundError:
+        return 0
+    if _checkpoints is None:
+        _checkpoints = dict(JournalCheckpoint.objects.values_list('segment', 'offset'))
+
+    entries, offsets = [], {}
+    for name in names:
+        if len(entries) >= batch_size:
+            break
+        offset = _checkpoints.get(name, 0)
+        path = os.path.join(_journal_dir(), name)
+        if os.path.getsize(path) <= offset:
+            continue
+        read, new_offset = _read_lines(path, offset, batch_size - len(entries))
+        if new_offset != offset:
+            offsets[name] = new_offset
+        entries += read
+
+    if offsets:
+        try:
+            _commit(entries, offsets, _store)
+        except RECORD_ERRORS:
+            _commit(entries, offsets, _store_each)
+        _checkpoints.update(offsets)
+    elif time.time() - _swept > settings.WRITE_BUFFER_SEGMENT_SECONDS:
+        _remove_finished(names)
+        _swept = time.time()
+    return len(entries)
+
+
+def _commit(entries, offsets, store):
+    with transaction.atomic():
+        store(entries)
+        for name, offset in offsets.items():
+            JournalCheckpoint.objects.update_or_create(segment=name, defaults={'offset': offset})
+
+
+def _remove_finished(names):
+    # Writers never go back to a segment once its period is over, so a fully
+    # flushed segment from two periods ago can go. The file goes first: a
+    # checkpoint without its file is harmless, the reverse would replay it.
+    cutoff = time.time() - 2 * settings.WRITE_BUFFER_SEGMENT_SECONDS
+    for name in names:
+        path = os.path.join(_journal_dir(), name)
+        st = os.stat(path)
+        if st.st_mtime < cutoff and _checkpoints.get(name, 0) >= st.st_size:
+            os.remove(path)
+            if _checkpoints.pop(name, None) is not None:
+                JournalCheckpoint.objects.filter(segment=name).delete()
@@ -0,0 +1,222 @@
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import date, time as dtime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment,
+)
+from django.urls import reverse
+
+from main import urls as main_urls, versions
+from main.models import (
+    Appointment, Company, ContactSubmission, NewsletterSubscriber, TeamMember, Testimonial,
+)
+
+BUDGETS_FILE = Path(__file__).resolve().parents[2] / 'benchmarks' / 'budgets.json'
+EXTRA_PATHS = ['/sitemap.xml', '/robots.txt']
+LATENCY_FLOOR_MS = 25
+# Routes in main/urls.py that are not part of the public site (unsubscribe
+# links come from emails, with a token).
+PRIVATE_URL_NAMES = {'prometheus_metrics', 'unsubscribe'}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks every public URL in-process and checks latency, query and size budgets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,1000,100000',
+                            help='Comma-separated row counts for testimonials/team members/submissions')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per URL')
+        parser.add_argument('--budgets', default=str(BUDGETS_FILE), help='JSON file with the committed budgets')
+        parser.add_argument('--latency-tolerance', type=float, default=0.5,
+                            help='Allowed fractional slowdown over the p95 budget (machines differ)')
+        parser.add_argument('--page-cache', action='store_true',
+                            help='Measure with the page and fragment caches on (hides per-view query regressions)')
+        parser.add_argument('--write-budgets', action='store_true',
+                            help='Record the current results as the new budgets instead of checking them')
+        parser.add_argument('--output', help='Also write the raw results to this JSON file')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        workdir = tempfile.mkdtemp(prefix='thinkce-bench-')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # Caches and runtime state live in the workdir, so results don't depend
+        # on what this machine last built, cached or rendered. Fragment caching
+        # follows the page cache: either hides per-view queries and sizes.
+        overrides = override_settings(
+            PAGE_CACHE_ENABLED=options['page_cache'],
+            FRAGMENT_CACHE_ENABLED=options['page_cache'],
+            VAR_DIR=Path(workdir),
+            CONTENT_VERSIONS_FILE=Path(workdir) / 'content_versions.json',
+            CRITICAL_CSS_FILE=Path(workdir) / 'critical_css.json',
+            THROTTLE_DB=Path(workdir) / 'throttle.sqlite3',
+            CACHES={'default': {**settings.CACHES['default'], 'LOCATION': Path(workdir) / 'cache.sqlite3'}},
+            MEDIA_ROOT=workdir,
+            STORAGES={**settings.STORAGES, 'staticfiles': {
+                'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+            }},
+        )
+        overrides.enable()
+        try:
+            results = {}
+            seeded = 0
+            for size in sorted(sizes):
+                self.seed(seeded, size)
+                seeded = size
+                results[str(size)] = self.run_size(size, options['iterations'])
+        finally:
+            overrides.disable()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+        if options['write_budgets']:
+            self.write_budgets(options['budgets'], results)
+        else:
+            self.check_budgets(options['budgets'], results, options['latency_tolerance'])
+
+    def urls(self):
+        paths = []
+        for pattern in main_urls.urlpatterns:
+            if pattern.name in PRIVATE_URL_NAMES:
+                continue
+            paths.append((pattern.name, reverse(pattern.name)))
+        paths.extend((path, path) for path in EXTRA_PATHS)
+        return paths
+
+    def seed(self, start, end):
+        """Grow the benchmark data set from ``start`` to ``end`` rows per model."""
+        if start == 0:
+            import seed_core
+            seed_core.seed()
+            Company.objects.bulk_create(
+                Company(name=f'Company {i}', tagline='Tagline', description='Description',
+                        features='One, Two, Three', website_url='https://example.com')
+                for i in range(3)
+            )
+
+        count = end - start
+        self.stdout.write(f'Seeding {count} rows per model (total {end})...')
+        batch = 2000
+        Testimonial.objects.bulk_create((
+            Testimonial(client_name=f'Client {i}', role='CEO', company_name='Example', message='Great work.',
+                        author_initials='CL')
+            for i in range(start, end)
+        ), batch_size=batch)
+        TeamMember.objects.bulk_create((
+            TeamMember(name=f'Member {i}', role='Engineer', order=i) for i in range(start, end)
+        ), batch_size=batch)
+        ContactSubmission.objects.bulk_create((
+            ContactSubmission(name=f'Sender {i}', email=f'sender{i}@example.com', subject='Hello', message='Hi')
+            for i in range(start, end)
+        ), batch_size=batch)
+        Appointment.objects.bulk_create((
+            Appointment(name=f'Client {i}', email=f'client{i}@example.com', phone='555', service='consulting',
+                        date=date(2020, 1, 1) + timedelta(days=i // 48), time=dtime(i % 48 // 2, i % 2 * 30))
+            for i in range(start, end)
+        ), batch_size=batch)
+        NewsletterSubscriber.objects.bulk_create((
+            NewsletterSubscriber(email=f'reader{i}@example.com') for i in range(start, end)
+        ), batch_size=batch)
+        # bulk_create sends no signals; move the versions on like admin saves would
+        versions.bump(*(model._meta.label_lower for model in (
+            Company, Testimonial, TeamMember, ContactSubmission, Appointment, NewsletterSubscriber,
+        )))
+
+    def run_size(self, size, iterations):
+        client = Client()
+        results = {}
+        self.stdout.write(f'\n{size} rows')
+        self.stdout.write(f"{'url':<22}{'status':>7}{'queries':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'bytes':>11}")
+        for name, path in self.urls():
+            client.get(path)  # warm up per-process caches
+            timings = []
+            queries = 0
+            for _ in range(iterations):
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    response = client.get(path)
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries = max(queries, len(ctx))
+            body = b''.join(response) if response.streaming else response.content
+            row = {
+                'status': response.status_code,
+                'queries': queries,
+                'p50_ms': round(statistics.median(timings), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'p99_ms': round(percentile(timings, 99), 2),
+                'bytes': len(body),
+            }
+            results[name] = row
+            self.stdout.write(
+                f"{name:<22}{row['status']:>7}{row['queries']:>9}{row['p50_ms']:>10}"
+                f"{row['p95_ms']:>10}{row['p99_ms']:>10}{row['bytes']:>11}"
+            )
+        return results
+
+    def write_budgets(self, path, results):
+        # Queries are exact; latency and size get headroom for noise. Very
+        # fast views get a floor so a single GC pause doesn't fail the run.
+        budgets = {
+            size: {
+                name: {
+                    'queries': row['queries'],
+                    'p95_ms': round(max(row['p95_ms'] * 2, LATENCY_FLOOR_MS), 1),
+                    'bytes': int(row['bytes'] * 1.1) + 1024,
+                }
+                for name, row in rows.items()
+            }
+            for size, rows in results.items()
+        }
+        existing = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                existing = json.load(f)
+        existing.update(budgets)
+        with open(path, 'w') as f:
+            json.dump(existing, f, indent=2, sort_keys=True)
+            f.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'Budgets written to {path}'))
+
+    def check_budgets(self, path, results, tolerance):
+        with open(path) as f:
+            budgets = json.load(f)
+
+        failures = []
+        for size, rows in results.items():
+            for name, row in rows.items():
+                budget = budgets.get(size, {}).get(name)
+                if budget is None:
+                    failures.append(f'[{size}] {name}: no budget recorded')
+                    continue
+                if row['queries'] > budget['queries']:
+                    failures.append(f"[{size}] {name}: {row['queries']} queries > budget {budget['queries']}")
+                if row['p95_ms'] > budget['p95_ms'] * (1 + tolerance):
+                    failures.append(f"[{size}] {name}: p95 {row['p95_ms']}ms > budget {budget['p95_ms']}ms")
+                if row['bytes'] > budget['bytes']:
+                    failures.append(f"[{size}] {name}: {row['bytes']} bytes > budget {budget['bytes']}")
+
+        if failures:
+            raise CommandError('Performance budgets exceeded:\n  ' + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS('All performance budgets met.'))
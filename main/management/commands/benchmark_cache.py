@@ -0,0 +1,104 @@
+import multiprocessing
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'main.sqlite_cache.SQLiteCache',
+}
+
+
+def _make_cache(name, workdir):
+    location = {'locmem': 'benchmark', 'file': str(Path(workdir) / 'file'),
+                'sqlite': str(Path(workdir) / 'cache.sqlite3')}[name]
+    return import_string(BACKENDS[name])(location, {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': 10 ** 6}})
+
+
+def _worker(name, workdir, worker, workers, options, barrier, results):
+    cache = _make_cache(name, workdir)
+    value = 'x' * options['value_size']
+    keys = [f'key:{i}' for i in range(options['keys'])]
+    own = keys[worker::workers]
+
+    barrier.wait()
+    started = time.perf_counter()
+    for key in own:
+        cache.set(key, value)
+    set_time = time.perf_counter() - started
+
+    barrier.wait()  # every worker has written its share
+    random.Random(worker).shuffle(keys)
+    started = time.perf_counter()
+    hits = sum(cache.get(key) is not None for key in keys)
+    get_time = time.perf_counter() - started
+
+    barrier.wait()
+    started = time.perf_counter()
+    for _ in range(options['increments']):
+        cache.incr('counter')
+    incr_time = time.perf_counter() - started
+
+    barrier.wait()
+    results.put({
+        'set': (len(own), set_time), 'get': (len(keys), get_time), 'hits': hits,
+        'incr': (options['increments'], incr_time), 'counter': cache.get('counter'),
+    })
+
+
+class Command(BaseCommand):
+    help = 'Compares the shared SQLite cache with the LocMem and file-based caches across worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', default=','.join(BACKENDS), help='Comma-separated: locmem, file, sqlite')
+        parser.add_argument('--workers', type=int, default=4, help='Processes sharing the cache, like gunicorn workers')
+        parser.add_argument('--keys', type=int, default=2000, help='Distinct keys written')
+        parser.add_argument('--value-size', type=int, default=4096, help='Bytes per cached value')
+        parser.add_argument('--increments', type=int, default=500, help='incr() calls per worker on one counter')
+
+    def handle(self, *args, **options):
+        names = options['backends'].split(',')
+        for name in names:
+            if name not in BACKENDS:
+                raise CommandError(f'Unknown backend {name!r}; choose from {", ".join(BACKENDS)}')
+        workers = options['workers']
+        context = multiprocessing.get_context('fork')
+
+        self.stdout.write(
+            f"{'backend':<8}{'set/s':>10}{'get/s':>10}{'hit rate':>10}{'incr/s':>10}{'lost incr':>11}"
+        )
+        for name in names:
+            workdir = tempfile.mkdtemp(prefix='thinkce-cache-bench-')
+            try:
+                # Each worker starts with the counter at 0 in its own view of the cache.
+                _make_cache(name, workdir).set('counter', 0)
+                barrier, results = context.Barrier(workers), context.Queue()
+                processes = [
+                    context.Process(target=_worker, args=(name, workdir, i, workers, options, barrier, results))
+                    for i in range(workers)
+                ]
+                for process in processes:
+                    process.start()
+                rows = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+            def rate(op):
+                # Aggregate throughput: every worker runs at the same time.
+                return sum(row[op][0] / row[op][1] for row in rows if row[op][1])
+
+            hit_rate = sum(row['hits'] for row in rows) / sum(row['get'][0] for row in rows)
+            expected = workers * options['increments']
+            lost = expected - max(row['counter'] for row in rows)
+            self.stdout.write(
+                f'{name:<8}{rate("set"):>10.0f}{rate("get"):>10.0f}{hit_rate:>10.0%}'
+                f'{rate("incr"):>10.0f}{lost:>11}'
+            )
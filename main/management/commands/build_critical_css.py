@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+from django.template.loader import render_to_string
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from main import critical_css
+
+
+class Command(BaseCommand):
+    help = "Extracts the above-the-fold rules of style.css for each public page, to be inlined in its <head>"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default=settings.ALLOWED_HOSTS[0], help='Host name the pages are rendered for')
+        parser.add_argument('--force', action='store_true', help='Rebuild pages whose templates and CSS have not changed')
+
+    def handle(self, *args, **options):
+        # Pages are rendered in-process for --host, whatever ALLOWED_HOSTS says.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, options['host']]):
+            self.build(options)
+
+    def build(self, options):
+        with open(finders.find(critical_css.STYLESHEET), encoding='utf-8') as f:
+            css = f.read()
+        client = Client(HTTP_HOST=options['host'])
+        pages = dict(critical_css.load())
+        changed = False
+        for name in critical_css.PAGES:
+            digest = critical_css.source_hash(name)
+            if not options['force'] and pages.get(name, {}).get('hash') == digest:
+                continue
+            response = client.get(reverse(name), secure=True)
+            if response.status_code != 200:
+                raise CommandError(f'{reverse(name)} returned {response.status_code}')
+            extracted = critical_css.extract(
+                css, response.content.decode(response.charset), *self.variants(name, response.wsgi_request),
+            )
+            pages[name] = {'hash': digest, 'css': extracted}
+            changed = True
+            self.stdout.write(f'{name}: {len(extracted.encode())} bytes of critical CSS')
+        if changed:
+            critical_css.save(pages)
+        else:
+            self.stdout.write('Critical CSS is up to date')
+
+    def variants(self, name, request):
+        # Uncached, or the fragments would be the real content (or cache the samples).
+        with override_settings(FRAGMENT_CACHE_ENABLED=False):
+            for overrides in critical_css.VARIANTS.get(name, []):
+                context = {key: value() for key, value in overrides.items()}
+                yield render_to_string(f'main/{name}.html', context, request)
@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main import versions
+from main.images import generate_derivatives, get_manifest
+from main.models import Company, HeroCarouselItem, TeamMember
+
+IMAGE_MODELS = (Company, TeamMember, HeroCarouselItem)
+
+
+class Command(BaseCommand):
+    help = 'Generates resized WebP/AVIF/JPEG derivatives for every uploaded image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Size of the process pool (default: CPU count)')
+        parser.add_argument('--force', action='store_true', help='Rebuild derivatives that already exist')
+        parser.add_argument('--watch', action='store_true',
+                            help='Keep running and build the derivatives of images uploaded in the admin')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between checks in --watch mode')
+
+    def handle(self, *args, **options):
+        self.version = versions.get_version(*self.labels())
+        self.build_all(options)
+        while options['watch']:
+            time.sleep(options['interval'])
+            self.build_new()
+
+    def labels(self):
+        return [model._meta.label_lower for model in IMAGE_MODELS]
+
+    def build_all(self, options):
+        names = set()
+        for model in IMAGE_MODELS:
+            names.update(name for name in model.objects.values_list('image', flat=True) if name)
+
+        self.stdout.write(f'Building derivatives for {len(names)} images...')
+        # Forked workers must not share the parent's SQLite connection.
+        connections.close_all()
+        started = time.monotonic()
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(generate_derivatives, name, options['force']): name for name in sorted(names)}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    manifest = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(self.style.ERROR(f'{name}: {e}'))
+                else:
+                    self.stdout.write(f"{name}: {', '.join(map(str, manifest['widths']))}")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Done in {elapsed:.1f}s ({failed} failed)'))
+
+    def build_new(self):
+        """Build the derivatives missing since the image models last changed."""
+        version = versions.get_version(*self.labels())
+        if version == self.version:
+            return
+        self.version = version
+        built = set()
+        for model in IMAGE_MODELS:
+            for name in set(model.objects.exclude(image='').values_list('image', flat=True)):
+                if get_manifest(name) is not None:
+                    continue
+                try:
+                    manifest = generate_derivatives(name)
+                except (OSError, ValueError) as e:
+                    self.stderr.write(self.style.ERROR(f'{name}: {e}'))
+                    continue
+                self.stdout.write(f"{name}: {', '.join(map(str, manifest['widths']))}")
+                built.add(model._meta.label_lower)
+        if built:
+            # Pages rendered in the meantime fell back to the originals.
+            versions.bump(*sorted(built))
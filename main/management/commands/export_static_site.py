@@ -0,0 +1,102 @@
+import json
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import resolve
+
+from main.caching import page_labels, page_version, strip_csrf_tokens
+from main.sitemaps import StaticViewSitemap
+
+MANIFEST_NAME = '.export-manifest.json'
+# nginx map (included by the site config) giving each exported page the
+# edge cache headers Django would have sent, see main/edge.py
+EDGE_MAP_NAME = '.edge-cache.map'
+
+
+class Command(BaseCommand):
+    help = 'Pre-renders every sitemap page to HTML files that nginx can serve directly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.STATIC_EXPORT_DIR), help='Publish directory')
+        parser.add_argument('--host', default=settings.ALLOWED_HOSTS[0], help='Host name the pages are rendered for')
+        parser.add_argument('--insecure', action='store_true', help='Render http:// instead of https:// URLs')
+        parser.add_argument('--force', action='store_true', help='Re-render pages whose content has not changed')
+        parser.add_argument('--watch', action='store_true', help='Keep running and re-export pages as content changes')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between checks in --watch mode')
+
+    def handle(self, *args, **options):
+        # Pages are rendered in-process for --host, whatever ALLOWED_HOSTS says.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, options['host']]):
+            self.run(options)
+
+    def run(self, options):
+        self.output = options['output']
+        os.makedirs(self.output, exist_ok=True)
+        self.client = Client(HTTP_HOST=options['host'])
+        self.secure = not options['insecure']
+
+        self.write_edge_map()
+        self.export(force=options['force'])
+        while options['watch']:
+            time.sleep(options['interval'])
+            self.export()
+
+    def export(self, force=False):
+        manifest_path = os.path.join(self.output, MANIFEST_NAME)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            manifest = {}
+
+        changed = False
+        sitemap = StaticViewSitemap()
+        for item in sitemap.items():
+            url = sitemap.location(item)
+            version = page_version(resolve(url).url_name)
+            target = self.target_path(url)
+            if not force and manifest.get(url) == version and os.path.exists(target):
+                continue
+
+            response = self.client.get(url, secure=self.secure)
+            if response.status_code != 200:
+                raise CommandError(f'{url} returned {response.status_code}')
+            # Visitors fetch their own token from /csrf/ (see main.js)
+            html = strip_csrf_tokens(response.content.decode(response.charset), '')
+            self.write_atomic(target, html.encode())
+
+            manifest[url] = version
+            changed = True
+            self.stdout.write(f'Exported {url} -> {os.path.relpath(target, self.output)}')
+
+        if changed:
+            self.write_atomic(manifest_path, json.dumps(manifest, indent=2).encode())
+
+    def write_edge_map(self):
+        control, tags = [], []
+        if settings.EDGE_CACHE_ENABLED:
+            sitemap = StaticViewSitemap()
+            for item in sitemap.items():
+                pattern = f'"~^{re.escape(sitemap.location(item))}(\\?|$)"'
+                ttl = settings.EDGE_CACHE_TTLS[item]
+                control.append(f'    {pattern} "public, max-age=0, must-revalidate, s-maxage={ttl}";')
+                tags.append(f'    {pattern} "{",".join(page_labels(item))}";')
+        lines = [
+            'map $request_uri $thinkce_edge_cache_control {', '    default "";', *control, '}',
+            'map $request_uri $thinkce_cache_tag {', '    default "";', *tags, '}',
+        ]
+        self.write_atomic(os.path.join(self.output, EDGE_MAP_NAME), ('\n'.join(lines) + '\n').encode())
+
+    def target_path(self, url):
+        return os.path.join(self.output, url.strip('/'), 'index.html')
+
+    def write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
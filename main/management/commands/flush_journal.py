@@ -0,0 +1,52 @@
+import os
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main import journal
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows dev machines
+    fcntl = None
+
+
+class Command(BaseCommand):
+    help = 'Copies journaled contact/subscribe submissions into the database in batched transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.WRITE_BUFFER_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=settings.WRITE_BUFFER_FLUSH_INTERVAL,
+                            help='Seconds to wait for more rows between flushes')
+        parser.add_argument('--once', action='store_true', help='Flush everything queued and exit')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        # Checkpoints are cached in memory, so only one flusher may run.
+        os.makedirs(os.path.join(settings.VAR_DIR, 'journal'), exist_ok=True)
+        lock = open(os.path.join(settings.VAR_DIR, 'journal', '.flush.lock'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise CommandError('Another flush_journal is already running')
+
+        total = 0
+        while not self.stopping:
+            count = journal.flush(options['batch_size'])
+            total += count
+            if count == options['batch_size']:
+                continue  # Behind; flush the next batch straight away
+            if options['once'] and not count:
+                break
+            time.sleep(options['interval'])
+        if options['once']:
+            self.stdout.write(self.style.SUCCESS(f'Flushed {total} submissions'))
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,93 @@
+import csv
+import json
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+
+from main.models import NewsletterSubscriber
+
+
+class Command(BaseCommand):
+    help = 'Bulk-imports newsletter subscribers from a CSV, JSONL or plain text file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl', 'txt'],
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--column', default='email', help='CSV column / JSON key holding the address')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl', 'txt'):
+            raise CommandError(f'Cannot tell the format of {path}; pass --format')
+
+        self.inserted = self.duplicates = self.invalid = 0
+        started = time.monotonic()
+        with open(path, newline='', encoding='utf-8') as f:
+            chunk = set()
+            for raw in self.read(f, fmt, options['column']):
+                email = self.normalize(raw)
+                if email is None:
+                    self.invalid += 1
+                elif email in chunk:
+                    self.duplicates += 1
+                else:
+                    chunk.add(email)
+                    if len(chunk) >= options['chunk_size']:
+                        self.flush(chunk)
+                        chunk = set()
+                        self.report(started)
+            self.flush(chunk)
+
+        self.report(started, final=True)
+
+    def read(self, f, fmt, column):
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            if column not in (reader.fieldnames or []):
+                raise CommandError(f'CSV has no "{column}" column')
+            for row in reader:
+                yield row[column]
+        elif fmt == 'jsonl':
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line).get(column, '')
+                    except (ValueError, AttributeError):
+                        yield ''
+        else:
+            yield from f
+
+    def normalize(self, raw):
+        email = NewsletterSubscriber.normalize_email(raw or '')
+        if len(email) > NewsletterSubscriber._meta.get_field('email').max_length:
+            return None
+        try:
+            validate_email(email)
+        except ValidationError:
+            return None
+        return email
+
+    def flush(self, chunk):
+        if not chunk:
+            return
+        existing = set(NewsletterSubscriber.objects.filter(email__in=chunk).values_list('email', flat=True))
+        new = [NewsletterSubscriber(email=email) for email in chunk - existing]
+        # ignore_conflicts covers addresses added concurrently by the signup form
+        NewsletterSubscriber.objects.bulk_create(new, ignore_conflicts=True)
+        self.inserted += len(new)
+        self.duplicates += len(existing)
+
+    def report(self, started, final=False):
+        processed = self.inserted + self.duplicates + self.invalid
+        elapsed = max(time.monotonic() - started, 1e-6)
+        line = (
+            f'{processed} processed: {self.inserted} inserted, {self.duplicates} duplicate, '
+            f'{self.invalid} invalid ({processed / elapsed:.0f} rows/s)'
+        )
+        self.stdout.write(self.style.SUCCESS(line) if final else line)
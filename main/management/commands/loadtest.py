@@ -0,0 +1,138 @@
+import asyncio
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = '/,/about/,/services/,/companies/,/contact/,/appointment/'
+
+SERVER_COMMANDS = {
+    'wsgi': ['thinkcesite.wsgi:application'],
+    'asgi': ['--worker-class', 'uvicorn_worker.UvicornWorker', 'thinkcesite.asgi:application'],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures throughput of a running server under concurrent (and optionally slow) clients, '
+        'or starts the sync and async gunicorn deployments itself and compares them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:5050')
+        parser.add_argument('--serve', help='Comma-separated deployments to start and compare: wsgi, asgi')
+        parser.add_argument('--workers', type=int, default=3, help='Gunicorn workers for --serve')
+        parser.add_argument('--paths', default=DEFAULT_PATHS, help='Comma-separated paths to request in turn')
+        parser.add_argument('--concurrency', type=int, default=50, help='Simultaneous clients')
+        parser.add_argument('--slow-clients', type=int, default=0,
+                            help='Extra clients that trickle their request headers for the whole run')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per run')
+
+    def handle(self, *args, **options):
+        paths = [path.strip() for path in options['paths'].split(',') if path.strip()]
+        if options['serve']:
+            for mode in options['serve'].split(','):
+                if mode not in SERVER_COMMANDS:
+                    raise CommandError(f'Unknown deployment {mode!r}; choose from {", ".join(SERVER_COMMANDS)}')
+                with self.server(mode, options['workers']) as url:
+                    self.report(mode, asyncio.run(self.run(url, paths, options)))
+        elif options['url']:
+            self.report(options['url'], asyncio.run(self.run(options['url'], paths, options)))
+        else:
+            raise CommandError('Pass --url or --serve')
+
+    @contextmanager
+    def server(self, mode, workers):
+        """Start a gunicorn deployment on a free local port and yield its URL."""
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        process = subprocess.Popen([
+            sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+            '--log-level', 'warning', *SERVER_COMMANDS[mode],
+        ])
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline or process.poll() is not None:
+                        raise CommandError(f'The {mode} server did not start')
+                    time.sleep(0.2)
+            self.stdout.write(f'Started {mode} server with {workers} workers on port {port}')
+            yield f'http://127.0.0.1:{port}'
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait(timeout=30)
+
+    async def run(self, url, paths, options):
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        deadline = time.monotonic() + options['duration']
+        latencies, errors = [], []
+
+        async def client(offset):
+            i = offset
+            while time.monotonic() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    status = await self.fetch(host, port, parts.netloc, path)
+                except OSError as e:
+                    errors.append(str(e))
+                    continue
+                if status >= 400:
+                    errors.append(f'{path}: HTTP {status}')
+                else:
+                    latencies.append(time.perf_counter() - started)
+
+        async def slow_client():
+            # Sends one header line per second and never finishes the request.
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                writer.write(f'GET / HTTP/1.1\r\nHost: {parts.netloc}\r\n'.encode())
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(1)
+                    writer.write(b'X-Slow: 1\r\n')
+                    await writer.drain()
+                writer.close()
+            except OSError:
+                pass
+
+        started = time.monotonic()
+        await asyncio.gather(
+            *(client(i) for i in range(options['concurrency'])),
+            *(slow_client() for _ in range(options['slow_clients'])),
+        )
+        return {'elapsed': time.monotonic() - started, 'latencies': latencies, 'errors': errors}
+
+    async def fetch(self, host, port, netloc, path):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: {netloc}\r\nConnection: close\r\n\r\n'.encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+        finally:
+            writer.close()
+        return int(status_line.split()[1])
+
+    def report(self, label, result):
+        latencies = sorted(result['latencies'])
+        if not latencies:
+            raise CommandError(f'{label}: no successful requests ({len(result["errors"])} errors)')
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+        self.stdout.write(
+            f'{label:<8} {len(latencies) / result["elapsed"]:8.1f} req/s  '
+            f'p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  '
+            f'{len(latencies)} ok  {len(result["errors"])} errors'
+        )
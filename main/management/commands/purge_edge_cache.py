@@ -0,0 +1,124 @@
+import json
+import os
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main import versions
+from main.caching import page_labels, page_version
+from main.edge import PurgeError, get_purge_client
+from main.sitemaps import StaticViewSitemap
+
+from .export_static_site import MANIFEST_NAME
+
+
+class Command(BaseCommand):
+    help = (
+        'Purges the edge cache tags of models edited in the admin, debounced and batched '
+        '(runs as a service), or everything with --everything'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--everything', action='store_true', help='Purge the whole zone and exit (after deploys)')
+        parser.add_argument('--once', action='store_true', help='Purge pending changes without debouncing and exit')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds between looks at the versions')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        if not settings.EDGE_CACHE_ENABLED:
+            self.stdout.write('Edge caching is off (EDGE_CACHE_ENABLED); nothing to purge')
+            # Idle rather than exit, so the service isn't restarted in a loop.
+            while not (self.stopping or options['everything'] or options['once']):
+                time.sleep(options['interval'])
+            return
+
+        self.client = get_purge_client()
+        if options['everything']:
+            try:
+                self.client.purge_everything()
+            except PurgeError as e:
+                raise CommandError(f'Purge failed: {e}')
+            self.save_state({label: entry['version'] for label, entry in versions.get_versions().items()})
+            self.stdout.write('Purged everything')
+            return
+
+        purged = self.load_state()
+        pending = {}  # label -> when the change was first seen
+        retry_at = 0.0
+        while not self.stopping:
+            now = time.time()
+            current = versions.get_versions()
+            for label, entry in current.items():
+                if entry['version'] != purged.get(label):
+                    pending.setdefault(label, now)
+
+            if pending and now >= retry_at:
+                quiet = now - max(current[label]['updated'] for label in pending) >= settings.EDGE_PURGE_DEBOUNCE
+                overdue = now - min(pending.values()) >= settings.EDGE_PURGE_MAX_DELAY
+                if options['once'] or overdue or (quiet and self.export_caught_up(pending)):
+                    labels = sorted(pending)
+                    try:
+                        self.purge(labels)
+                    except PurgeError as e:
+                        if options['once']:
+                            raise CommandError(f'Purge of {", ".join(labels)} failed: {e}')
+                        self.stderr.write(self.style.WARNING(f'Purge of {", ".join(labels)} failed: {e}'))
+                        retry_at = now + settings.EDGE_PURGE_DEBOUNCE * 5
+                    else:
+                        for label in labels:
+                            purged[label] = current[label]['version']
+                        self.save_state(purged)
+                        pending.clear()
+
+            if options['once'] and not pending:
+                break
+            time.sleep(options['interval'])
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def purge(self, labels):
+        size = settings.EDGE_PURGE_BATCH_SIZE
+        for i in range(0, len(labels), size):
+            self.client.purge_tags(labels[i:i + size])
+        self.stdout.write(f'Purged {", ".join(labels)}')
+
+    def export_caught_up(self, labels):
+        """Whether the pre-rendered copies of the affected pages are current.
+
+        nginx serves those to the edge on a miss, so purging before
+        export_static_site has rewritten them would re-cache the old page.
+        """
+        try:
+            with open(os.path.join(settings.STATIC_EXPORT_DIR, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return True  # Not exporting
+        sitemap = StaticViewSitemap()
+        return all(
+            manifest.get(sitemap.location(item)) == page_version(item)
+            for item in sitemap.items() if set(labels) & set(page_labels(item))
+        )
+
+    def load_state(self):
+        try:
+            with open(settings.EDGE_PURGE_STATE_FILE) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            # First run: the edge can only hold what the current versions rendered.
+            purged = {label: entry['version'] for label, entry in versions.get_versions().items()}
+            self.save_state(purged)
+            return purged
+
+    def save_state(self, purged):
+        path = str(settings.EDGE_PURGE_STATE_FILE)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(purged, f)
+        os.replace(tmp, path)
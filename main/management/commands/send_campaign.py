@@ -0,0 +1,183 @@
+import smtplib
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import escape
+
+from main.models import NewsletterCampaign, NewsletterSubscriber
+
+
+class Command(BaseCommand):
+    help = 'Sends a newsletter campaign to all subscribers, throttled and resumable'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id', type=int)
+        parser.add_argument('--rate', type=float, default=settings.NEWSLETTER_SEND_RATE,
+                            help='Maximum messages per second (0 = unthrottled)')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Subscribers per batch; progress is checkpointed after each one')
+        parser.add_argument('--messages-per-connection', type=int, default=100,
+                            help='Reconnect to the SMTP server after this many messages')
+        parser.add_argument('--force', action='store_true',
+                            help='Take over a campaign left "sending" by a run that was killed')
+
+    def handle(self, *args, **options):
+        try:
+            campaign = NewsletterCampaign.objects.get(pk=options['campaign_id'])
+        except NewsletterCampaign.DoesNotExist:
+            raise CommandError(f"Campaign {options['campaign_id']} does not exist")
+        if campaign.status == NewsletterCampaign.STATUS_COMPLETED:
+            raise CommandError(f'"{campaign}" has already been sent')
+
+        # Claim the campaign with a compare-and-set on its status, so a second
+        # run (cron overlap, two admins) can't send it at the same time.
+        claimable = [NewsletterCampaign.STATUS_DRAFT, NewsletterCampaign.STATUS_PAUSED]
+        if options['force']:
+            claimable.append(NewsletterCampaign.STATUS_SENDING)
+        claimed = NewsletterCampaign.objects.filter(pk=campaign.pk, status__in=claimable).update(
+            status=NewsletterCampaign.STATUS_SENDING,
+            started_at=Coalesce('started_at', Value(timezone.now())),
+        )
+        if not claimed:
+            raise CommandError(
+                f'"{campaign}" is being sent by another run; if that run was killed, '
+                f'rerun with --force to take it over'
+            )
+        campaign.refresh_from_db()
+        if campaign.last_subscriber_id:
+            self.stdout.write(f'Resuming "{campaign}" after subscriber #{campaign.last_subscriber_id}')
+
+        self.interval = 1 / options['rate'] if options['rate'] else 0
+        self.next_send = time.monotonic()
+        self.per_connection = options['messages_per_connection']
+        self.connection = None
+        self.connection_uses = 0
+
+        started = time.monotonic()
+        self.sent = self.failed = 0
+        status = NewsletterCampaign.STATUS_PAUSED
+        try:
+            while True:
+                # Keyset pagination: cheap at any depth, unlike OFFSET
+                batch = list(
+                    NewsletterSubscriber.objects
+                    .filter(pk__gt=campaign.last_subscriber_id)
+                    .order_by('pk')
+                    .values_list('pk', 'email')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+
+                batch_sent = batch_failed = 0
+                last_pk = campaign.last_subscriber_id
+                for pk, email in batch:
+                    ok = self.deliver(campaign, pk, email)
+                    if ok is None:
+                        # The SMTP server is unreachable: keep the checkpoint on the last
+                        # recipient that was dealt with, so a rerun starts with this one.
+                        self.checkpoint(campaign, last_pk, batch_sent, batch_failed)
+                        raise CommandError(
+                            f'Paused "{campaign}" after {settings.NEWSLETTER_MAX_CONNECTION_ERRORS} connection '
+                            f'errors in a row; rerun to resume with {email}'
+                        )
+                    if ok:
+                        batch_sent += 1
+                    else:
+                        batch_failed += 1
+                    last_pk = pk
+
+                self.checkpoint(campaign, last_pk, batch_sent, batch_failed)
+                processed = self.sent + self.failed
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'{processed} processed, {self.failed} failed ({processed / elapsed:.1f} msg/s)')
+            status = NewsletterCampaign.STATUS_COMPLETED
+        finally:
+            self.close()
+            # Anything but getting to the end (an outage, Ctrl-C, a crash) leaves
+            # the campaign paused at its checkpoint, claimable by the next run.
+            NewsletterCampaign.objects.filter(pk=campaign.pk).update(
+                status=status,
+                finished_at=timezone.now() if status == NewsletterCampaign.STATUS_COMPLETED else None,
+            )
+
+        campaign.refresh_from_db()
+        processed = self.sent + self.failed
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'"{campaign}": {campaign.sent_count} sent, {campaign.failed_count} failed in total; '
+            f'this run {processed} messages in {elapsed:.1f}s ({processed / max(elapsed, 1e-6):.1f} msg/s)'
+        ))
+
+    def checkpoint(self, campaign, last_pk, sent, failed):
+        campaign.last_subscriber_id = last_pk
+        campaign.sent_count += sent
+        campaign.failed_count += failed
+        campaign.save(update_fields=['last_subscriber_id', 'sent_count', 'failed_count'])
+        self.sent += sent
+        self.failed += failed
+
+    def deliver(self, campaign, pk, email):
+        """True if sent, False if the message was refused, None if the server stays unreachable."""
+        message = self.message(campaign, pk, email)
+        # The first retry is immediate, on a fresh connection: servers drop idle
+        # sessions. After that, back off until the outage looks like one.
+        for attempt in range(settings.NEWSLETTER_MAX_CONNECTION_ERRORS):
+            if attempt > 1:
+                time.sleep(settings.NEWSLETTER_RETRY_DELAY * 2 ** (attempt - 2))
+            self.throttle()
+            try:
+                message.connection = self.get_connection()
+                message.send()
+                return True
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as e:
+                # This message or address was rejected; the connection is fine.
+                self.stderr.write(f'{email}: refused ({e})')
+                return False
+            except Exception as e:
+                self.close()
+                self.stderr.write(f'{email}: {type(e).__name__}: {e}')
+        return None
+
+    def message(self, campaign, pk, email):
+        token = NewsletterSubscriber.unsubscribe_token(pk)
+        url = settings.SITE_URL.rstrip('/') + reverse('unsubscribe', args=[token])
+        body = f'{campaign.body}\n\n--\nUnsubscribe: {url}\n'
+        message = EmailMultiAlternatives(campaign.subject, body, settings.DEFAULT_FROM_EMAIL, [email], headers={
+            'List-Unsubscribe': f'<{url}>',
+            'List-Unsubscribe-Post': 'List-Unsubscribe=One-Click',
+        })
+        if campaign.html_body:
+            footer = f'<p style="font-size:12px"><a href="{escape(url)}">Unsubscribe</a></p>'
+            html, tag, tail = campaign.html_body.rpartition('</body>')
+            message.attach_alternative(f'{html}{footer}{tag}{tail}' if tag else campaign.html_body + footer, 'text/html')
+        return message
+
+    def throttle(self):
+        now = time.monotonic()
+        if self.next_send > now:
+            time.sleep(self.next_send - now)
+        self.next_send = max(self.next_send, now) + self.interval
+
+    def get_connection(self):
+        if self.connection is not None and self.connection_uses >= self.per_connection:
+            self.close()
+        if self.connection is None:
+            self.connection = get_connection(fail_silently=False)
+            self.connection.open()
+        self.connection_uses += 1
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+        self.connection = None
+        self.connection_uses = 0
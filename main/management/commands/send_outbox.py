@@ -0,0 +1,130 @@
+import signal
+import smtplib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main.models import OutboundEmail
+
+# Rejections of one message; anything else means the server or the session is gone.
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+# Sent rows are deleted in chunks of this many, to keep each write short
+PRUNE_CHUNK_SIZE = 1000
+PRUNE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued OutboundEmail rows over a single pooled SMTP connection and prunes sent ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.OUTBOX_BATCH_SIZE)
+        parser.add_argument('--interval', type=float, default=settings.OUTBOX_POLL_INTERVAL,
+                            help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the due messages and exit')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        connection = None
+        outages = 0
+        pruned_at = 0.0
+        while not self.stopping:
+            if time.monotonic() - pruned_at >= PRUNE_INTERVAL:
+                self.prune()
+                pruned_at = time.monotonic()
+
+            batch = list(
+                OutboundEmail.objects
+                .filter(status=OutboundEmail.STATUS_PENDING, next_attempt_at__lte=timezone.now())
+                .order_by('next_attempt_at', 'id')[:options['batch_size']]
+            )
+            if not batch:
+                # Don't hold the SMTP session open while idle.
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            for i, email in enumerate(batch):
+                if self.stopping:
+                    break
+                try:
+                    if connection is None:
+                        connection = get_connection(fail_silently=False)
+                        connection.open()
+                    connection.send_messages([email.to_message(connection)])
+                except Exception as e:
+                    self.record_failure(email, e)
+                    # The session may be unusable; reconnect for the next message.
+                    if connection is not None:
+                        try:
+                            connection.close()
+                        except Exception:
+                            pass
+                        connection = None
+                    if isinstance(e, MESSAGE_ERRORS):
+                        continue
+                    # The server is unreachable: don't burn an attempt of every
+                    # queued message on it. Put the rest of the batch off and back
+                    # off the worker, doubling while the outage lasts.
+                    outages += 1
+                    delay = min(settings.OUTBOX_RETRY_DELAY * 2 ** (outages - 1), settings.OUTBOX_MAX_RETRY_DELAY)
+                    OutboundEmail.objects.filter(pk__in=[rest.pk for rest in batch[i + 1:]]).update(
+                        next_attempt_at=timezone.now() + timedelta(seconds=delay),
+                    )
+                    self.stderr.write(self.style.WARNING(f'SMTP server unavailable; retrying in {delay}s'))
+                    if options['once']:
+                        self.stopping = True
+                    else:
+                        self.sleep(delay)
+                    break
+                else:
+                    outages = 0
+                    email.status = OutboundEmail.STATUS_SENT
+                    email.sent_at = timezone.now()
+                    email.attempts += 1
+                    email.last_error = ''
+                    email.save(update_fields=['status', 'sent_at', 'attempts', 'last_error'])
+
+        if connection is not None:
+            connection.close()
+
+    def sleep(self, seconds):
+        """time.sleep that returns early on SIGTERM/SIGINT."""
+        until = time.monotonic() + seconds
+        while not self.stopping and time.monotonic() < until:
+            time.sleep(min(1.0, until - time.monotonic()))
+
+    def prune(self):
+        """Delete sent messages older than OUTBOX_RETENTION_DAYS; dead ones are kept for inspection."""
+        cutoff = timezone.now() - timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+        old = OutboundEmail.objects.filter(status=OutboundEmail.STATUS_SENT, sent_at__lt=cutoff)
+        deleted = 0
+        while pks := list(old.values_list('pk', flat=True)[:PRUNE_CHUNK_SIZE]):
+            deleted += OutboundEmail.objects.filter(pk__in=pks).delete()[0]
+        if deleted:
+            self.stdout.write(f'Pruned {deleted} sent messages')
+
+    def record_failure(self, email, error):
+        email.attempts += 1
+        email.last_error = f'{type(error).__name__}: {error}'
+        if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            email.status = OutboundEmail.STATUS_DEAD
+            self.stderr.write(self.style.ERROR(f'Giving up on outbox #{email.pk}: {email.last_error}'))
+        else:
+            delay = min(settings.OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1), settings.OUTBOX_MAX_RETRY_DELAY)
+            email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+            self.stderr.write(self.style.WARNING(f'Outbox #{email.pk} failed, retrying in {delay}s: {email.last_error}'))
+        email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+    def stop(self, signum, frame):
+        self.stopping = True
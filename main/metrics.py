@@ -0,0 +1,204 @@
+"""
+Per-request timings and rolling latency histograms.
+
+``ServerTimingMiddleware`` (main.middleware) collects, for each request,
+the SQL count/time, template render time and context processor time. It
+adds them to this worker's histograms and, with ``METRICS_SERVER_TIMING``
+(development only by default), reports them in a ``Server-Timing`` header. Each worker flushes its histograms to ``VAR_DIR/metrics/<pid>.json``
+at most once per ``METRICS_FLUSH_INTERVAL``; ``collect()`` sums the files of
+all workers for the admin dashboard and the Prometheus endpoint.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+# Upper bounds in milliseconds, Prometheus-style (cumulative on export).
+BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Histogram name -> help text, also the Prometheus metric suffix.
+HISTOGRAMS = {
+    'request': 'Total time spent in the view and middleware',
+    'db': 'Time spent executing SQL queries',
+    'template': 'Time spent rendering templates, excluding context processors',
+    'context': 'Time spent in context processors',
+}
+
+_current = ContextVar('request_timings', default=None)
+_lock = threading.Lock()
+_local = {'histograms': {}, 'queries': {}, 'flushed': 0.0}
+
+
+def new_timings():
+    timings = {'db': 0.0, 'queries': 0, 'template': 0.0, 'context': 0.0}
+    return timings, _current.set(timings)
+
+
+def reset_timings(token):
+    _current.reset(token)
+
+
+@contextmanager
+def measure(name):
+    """Add the wall time of the block to the current request's ``name`` timing."""
+    timings = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] += time.perf_counter() - started
+
+
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def _wrapped(*args, **kwargs):
+            with measure(name):
+                return func(*args, **kwargs)
+        return _wrapped
+    return decorator
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """``connection.execute_wrapper`` hook counting queries and their time."""
+    timings = _current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if timings is not None:
+            timings['db'] += time.perf_counter() - started
+            timings['queries'] += 1
+
+
+def _new_histogram():
+    return {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+
+
+def _observe(histogram, value_ms):
+    for index, bound in enumerate(BUCKETS):
+        if value_ms <= bound:
+            break
+    else:
+        index = len(BUCKETS)
+    histogram['buckets'][index] += 1
+    histogram['sum'] += value_ms
+    histogram['count'] += 1
+
+
+def record(view, timings):
+    with _lock:
+        views = _local['histograms'].setdefault(view, {name: _new_histogram() for name in HISTOGRAMS})
+        for name in HISTOGRAMS:
+            _observe(views[name], timings[name] * 1000)
+        _local['queries'][view] = _local['queries'].get(view, 0) + timings['queries']
+        if time.monotonic() - _local['flushed'] >= settings.METRICS_FLUSH_INTERVAL:
+            _flush()
+
+
+def _metrics_dir():
+    return os.path.join(str(settings.VAR_DIR), 'metrics')
+
+
+def _flush():
+    directory = _metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump({'histograms': _local['histograms'], 'queries': _local['queries']}, f)
+    os.replace(f'{path}.tmp', path)
+    _local['flushed'] = time.monotonic()
+
+
+def collect():
+    """Sum the histograms of every worker that reported recently."""
+    with _lock:
+        _flush()
+    histograms, queries = {}, {}
+    directory = _metrics_dir()
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            if time.time() - os.path.getmtime(path) > settings.METRICS_RETENTION:
+                os.remove(path)  # a worker that has gone away
+                continue
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for view, views in data['histograms'].items():
+            merged = histograms.setdefault(view, {name: _new_histogram() for name in HISTOGRAMS})
+            for name, histogram in views.items():
+                target = merged[name]
+                target['buckets'] = [a + b for a, b in zip(target['buckets'], histogram['buckets'])]
+                target['sum'] += histogram['sum']
+                target['count'] += histogram['count']
+        for view, count in data['queries'].items():
+            queries[view] = queries.get(view, 0) + count
+    return histograms, queries
+
+
+def quantile(histogram, q):
+    """Estimate a quantile (in ms) from bucket counts, as Prometheus does."""
+    if not histogram['count']:
+        return None
+    rank = q * histogram['count']
+    seen = 0
+    for index, count in enumerate(histogram['buckets']):
+        if count and seen + count >= rank:
+            if index == len(BUCKETS):
+                return BUCKETS[-1]
+            lower = BUCKETS[index - 1] if index else 0
+            return lower + (BUCKETS[index] - lower) * (rank - seen) / count
+        seen += count
+    return BUCKETS[-1]
+
+
+def summary():
+    """Rows for the admin dashboard, slowest views first."""
+    histograms, queries = collect()
+    rows = []
+    for view, views in histograms.items():
+        requests = views['request']['count']
+        rows.append({
+            'view': view,
+            'requests': requests,
+            'p50': quantile(views['request'], 0.5),
+            'p95': quantile(views['request'], 0.95),
+            'p99': quantile(views['request'], 0.99),
+            'avg_db': views['db']['sum'] / requests if requests else 0,
+            'avg_queries': queries.get(view, 0) / requests if requests else 0,
+            'avg_template': views['template']['sum'] / requests if requests else 0,
+            'avg_context': views['context']['sum'] / requests if requests else 0,
+        })
+    return sorted(rows, key=lambda row: row['p95'] or 0, reverse=True)
+
+
+def prometheus_text():
+    histograms, queries = collect()
+    lines = []
+    for name, help_text in HISTOGRAMS.items():
+        metric = f'thinkce_{name}_duration_milliseconds'
+        lines.append(f'# HELP {metric} {help_text}.')
+        lines.append(f'# TYPE {metric} histogram')
+        for view, views in sorted(histograms.items()):
+            histogram = views[name]
+            cumulative = 0
+            for bound, count in zip(list(BUCKETS) + ['+Inf'], histogram['buckets']):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{view="{view}"}} {histogram["sum"]:.3f}')
+            lines.append(f'{metric}_count{{view="{view}"}} {histogram["count"]}')
+    lines.append('# HELP thinkce_db_queries_total SQL queries executed.')
+    lines.append('# TYPE thinkce_db_queries_total counter')
+    for view, count in sorted(queries.items()):
+        lines.append(f'thinkce_db_queries_total{{view="{view}"}} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,165 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+
+from . import file_serving, metrics, preload
+
+
+class ServerTimingMiddleware:
+    """
+    Measures each request (SQL, templates, context processors), feeds the
+    per-view histograms behind the admin metrics page and the Prometheus
+    endpoint and, with ``METRICS_SERVER_TIMING``, reports the numbers in a
+    ``Server-Timing`` header.
+
+    Works under both WSGI and ASGI. Queries are counted by the execute
+    wrapper every connection gets when it opens (see main.signals), which
+    follows the request into the threads sync code runs in.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = metrics.new_timings()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.reset_timings(token)
+        return self.finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        timings, token = metrics.new_timings()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.reset_timings(token)
+        return self.finish(request, response, timings, started)
+
+    def finish(self, request, response, timings, started):
+        timings['request'] = time.perf_counter() - started
+        # Context processors run inside the template render.
+        timings['template'] = max(0.0, timings['template'] - timings['context'])
+
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={timings["db"] * 1000:.2f};desc="{timings["queries"]} queries"',
+                f'tpl;dur={timings["template"] * 1000:.2f};desc="Templates"',
+                f'ctx;dur={timings["context"] * 1000:.2f};desc="Context processors"',
+                f'total;dur={timings["request"] * 1000:.2f}',
+            ])
+
+        match = request.resolver_match
+        metrics.record(match.view_name if match else 'unresolved', timings)
+        return response
+
+
+class PreloadHintsMiddleware:
+    """
+    Announces each public page's critical resources (see main.preload) in
+    ``Link: rel=preload`` headers, and ahead of time in a 103 Early Hints
+    response when the WSGI server supports ``wsgi.early_hints``.
+
+    The view is resolved up front because the hints have to go out before
+    it runs. Under ASGI only the ``Link`` headers are sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def url_name(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        try:
+            return resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        links = preload.links(self.url_name(request))
+        early_hints = request.META.get('wsgi.early_hints')
+        if links and early_hints and settings.PRELOAD_EARLY_HINTS:
+            early_hints([('Link', link) for link in links])
+        return self.add_links(self.get_response(request), links)
+
+    async def __acall__(self, request):
+        url_name = self.url_name(request)
+        if url_name == 'home' and not preload.hero_is_current():
+            links = await sync_to_async(preload.links)(url_name)
+        else:
+            links = preload.links(url_name)
+        return self.add_links(await self.get_response(request), links)
+
+    def add_links(self, response, links):
+        if links and response.status_code == 200:
+            response.headers.setdefault('Link', ', '.join(links))
+        return response
+
+
+class FileServingMiddleware:
+    """
+    Serves GETs of STATIC_ROOT and MEDIA_ROOT files (see main.file_serving),
+    for deployments without nginx in front. Everything else, including
+    missing files, goes on to the views.
+
+    First in MIDDLEWARE so file requests skip the timing, preload hints and
+    sessions. Left out when ``SERVE_FILES`` is off.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SERVE_FILES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.indexes = file_serving.get_indexes()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def match(self, request):
+        """(index, name) when ``request`` is for a served file, before touching the disk."""
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        path = request.path_info
+        for prefix, index in self.indexes:
+            if path.startswith(prefix):
+                return index, path[len(prefix):]
+        return None
+
+    def serve(self, request, index, name):
+        entry = index.lookup(name)
+        return None if entry is None else file_serving.serve(request, entry)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        match = self.match(request)
+        if match is not None and (response := self.serve(request, *match)) is not None:
+            return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        match = self.match(request)
+        if match is not None:
+            # stat() and open() block, so they run in a worker thread
+            response = await sync_to_async(self.serve, thread_sensitive=False)(request, *match)
+            if response is not None:
+                return response
+        return await self.get_response(request)
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:23
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+from main.slots import slots_for
+
+
+def move_double_bookings(apps, schema_editor):
+    """
+    Take every booking that shares a slot with an earlier one out of it, so
+    the unique constraint can be added. A booking still ahead is moved to a
+    later free slot of the same day, as the booking form would accept; one
+    without such a slot (a past or fully booked day) is cancelled. Either
+    way APPOINTMENT_EMAIL is told, for the staff to follow up with the client.
+    """
+    Appointment = apps.get_model('main', 'Appointment')
+    OutboundEmail = apps.get_model('main', 'OutboundEmail')
+    now = timezone.localtime()
+    last_day = now.date() + timedelta(days=settings.APPOINTMENT_BOOKING_DAYS - 1)
+    taken, later = set(), []
+    for pk, date, time in Appointment.objects.order_by('date', 'time', 'created_at', 'pk').values_list(
+            'pk', 'date', 'time'):
+        if (date, time) in taken:
+            later.append(pk)
+        taken.add((date, time))
+    for appt in Appointment.objects.filter(pk__in=later).order_by('date', 'time', 'created_at', 'pk'):
+        free = []
+        if appt.date <= last_day:
+            free = [
+                time for time in slots_for(appt.date)
+                if time > appt.time and (appt.date, time) not in taken
+                and timezone.make_aware(datetime.combine(appt.date, time)) > now
+            ]
+        details = (f"Client: {appt.name}\nEmail: {appt.email}\nPhone: {appt.phone}\nService: {appt.service}\n"
+                   f"Booked for: {appt.date} {appt.time:%H:%M}\n\nNotes:\n{appt.message}")
+        if free:
+            note = f'[Moved from {appt.date} {appt.time:%H:%M}: the slot was double-booked]'
+            subject = f'Double-booked appointment moved to {appt.date} {free[0]:%H:%M}: {appt.name}'
+            appt.time = free[0]
+            appt.message = f'{note}\n{appt.message}' if appt.message else note
+            appt.save(update_fields=['time', 'message'])
+            taken.add((appt.date, appt.time))
+        else:
+            subject = f'Double-booked appointment cancelled: {appt.name}'
+            appt.delete()
+        OutboundEmail.objects.create(
+            subject=subject,
+            body=f'{details}\n\nThe slot was booked twice; please confirm with the client.',
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipients=settings.APPOINTMENT_EMAIL,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_appointment_main_appoin_date_e0bed9_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='main_appoin_date_e0bed9_idx',
+        ),
+        migrations.RunPython(move_double_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(fields=('date', 'time'), name='unique_appointment_slot', violation_error_message='This time slot has already been booked.'),
+        ),
+    ]
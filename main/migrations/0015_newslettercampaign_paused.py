@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_contentversion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='newslettercampaign',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Draft'), ('sending', 'Sending'), ('paused', 'Paused'), ('completed', 'Completed')], default='draft', max_length=10),
+        ),
+    ]
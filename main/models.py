@@ -1,4 +1,19 @@
+from django.conf import settings
+from django.core import signing
+from django.core.mail import EmailMessage
 from django.db import models
+from django.utils import timezone
+
+from .images import ResponsiveImage
+
+
+class ResponsiveImageMixin:
+    """Gives templates access to the resized derivatives of ``image``."""
+
+    @property
+    def responsive_image(self):
+        return ResponsiveImage(self.image)
+
 
 class ContactSubmission(models.Model):
     name = models.CharField(max_length=100)
@@ -7,10 +22,19 @@ class ContactSubmission(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['-created_at'])]
+
     def __str__(self):
         return f"{self.subject} - {self.email}"
 
-class Company(models.Model):
+    def notification(self):
+        """Subject and body of the email sent to CONTACT_EMAIL."""
+        subject = f"New Contact Submission: {self.subject}"
+        message = f"From: {self.name}\nEmail: {self.email}\n\nMessage:\n{self.message}"
+        return subject, message
+
+class Company(ResponsiveImageMixin, models.Model):
     name = models.CharField(max_length=100)
     tagline = models.CharField(max_length=200, blank=True)
     description = models.TextField()
@@ -58,11 +82,28 @@ class Appointment(models.Model):
 
     class Meta:
         ordering = ['-date', '-time']
+        # One booking per slot; the constraint's index also serves the admin
+        # ordering (scanned backwards) and the availability range queries.
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'time'], name='unique_appointment_slot',
+                                    violation_error_message='This time slot has already been booked.'),
+        ]
+        # Match the admin's service/created_at filters
+        indexes = [
+            models.Index(fields=['service', '-date', '-time']),
+            models.Index(fields=['created_at']),
+        ]
 
     def __str__(self):
         return f"Appointment: {self.name} - {self.date}"
 
-class TeamMember(models.Model):
+    def notification(self):
+        """Subject and body of the email sent to APPOINTMENT_EMAIL."""
+        subject = f"New Appointment Request: {self.name}"
+        message = f"Client: {self.name}\nEmail: {self.email}\nPhone: {self.phone}\nService: {self.service}\nDate: {self.date}\nTime: {self.time}\n\nNotes:\n{self.message}"
+        return subject, message
+
+class TeamMember(ResponsiveImageMixin, models.Model):
     name = models.CharField(max_length=100)
     role = models.CharField(max_length=100)
     image = models.ImageField(upload_to='team/', blank=True, null=True)
@@ -78,11 +119,65 @@ class TeamMember(models.Model):
         return self.name
 
 class NewsletterSubscriber(models.Model):
+    UNSUBSCRIBE_SALT = 'main.newsletter.unsubscribe'
+
     email = models.EmailField(unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.email
+
+    @staticmethod
+    def normalize_email(email):
+        """The form every address is stored in (signup form and imports alike), so each is listed once."""
+        return email.strip().lower()
+
+    @classmethod
+    def unsubscribe_token(cls, pk):
+        """A signed, non-expiring token for the unsubscribe link of subscriber ``pk``."""
+        return signing.dumps(pk, salt=cls.UNSUBSCRIBE_SALT)
+
+    @classmethod
+    def from_unsubscribe_token(cls, token):
+        """The subscriber ``token`` was made for, or None (bad token or already gone)."""
+        try:
+            pk = signing.loads(token, salt=cls.UNSUBSCRIBE_SALT)
+        except signing.BadSignature:
+            return None
+        return cls.objects.filter(pk=pk).first()
+
+class NewsletterCampaign(models.Model):
+    STATUS_DRAFT = 'draft'
+    STATUS_SENDING = 'sending'
+    STATUS_PAUSED = 'paused'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (STATUS_DRAFT, 'Draft'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_PAUSED, 'Paused'),
+        (STATUS_COMPLETED, 'Completed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField(help_text="Plain-text version of the newsletter")
+    html_body = models.TextField(blank=True, help_text="Optional HTML version")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_DRAFT)
+    # Checkpoint: subscribers are sent to in primary key order, so a crashed
+    # run resumes after the last subscriber of the last finished batch, and
+    # a paused one after the last subscriber it got through to.
+    last_subscriber_id = models.BigIntegerField(default=0, editable=False)
+    sent_count = models.PositiveIntegerField(default=0, editable=False)
+    failed_count = models.PositiveIntegerField(default=0, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, editable=False)
+    finished_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.subject
+
 class SEOPageSettings(models.Model):
     PAGE_CHOICES = [
         ('home', 'Home'),
@@ -154,7 +249,7 @@ class Stat(models.Model):
     def __str__(self):
         return f"{self.number} - {self.label}"
 
-class HeroCarouselItem(models.Model):
+class HeroCarouselItem(ResponsiveImageMixin, models.Model):
     title = models.CharField(max_length=200, help_text="Supports HTML. e.g. Building the Future.<br><span class='gradi-text'>Together.</span>")
     subtitle = models.TextField()
     image = models.ImageField(upload_to='hero/')
@@ -170,3 +265,72 @@ class HeroCarouselItem(models.Model):
 
     def __str__(self):
         return self.title.replace('<br>', ' ').replace('<span class=\'gradi-text\'>', '').replace('</span>', '')
+
+
+class OutboundEmail(models.Model):
+    """A notification waiting to be delivered by the send_outbox worker."""
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_DEAD, 'Dead'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.TextField(help_text="Comma-separated addresses")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+        verbose_name = "Outbound Email"
+
+    def __str__(self):
+        return f"{self.subject} ({self.get_status_display()})"
+
+    @classmethod
+    def build(cls, subject, body, recipients, from_email=None):
+        """An unsaved message, for bulk_create or asave."""
+        return cls(
+            subject=subject,
+            body=body,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipients=','.join(recipients),
+        )
+
+    @classmethod
+    def enqueue(cls, subject, body, recipients, from_email=None):
+        email = cls.build(subject, body, recipients, from_email)
+        email.save()
+        return email
+
+    def to_message(self, connection=None):
+        return EmailMessage(self.subject, self.body, self.from_email, self.recipients.split(','), connection=connection)
+
+
+class ContentVersion(models.Model):
+    """A model's content version counter, when CONTENT_VERSIONS_BACKEND is 'database' (see main.versions)."""
+    label = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated = models.FloatField()
+
+    def __str__(self):
+        return f"{self.label} v{self.version}"
+
+
+class JournalCheckpoint(models.Model):
+    """How far flush_journal has copied a write-buffer segment into the database."""
+    segment = models.CharField(max_length=100, unique=True)
+    offset = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.segment} @ {self.offset}"
@@ -0,0 +1,23 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that caches ``COUNT(*)`` per query for a short while, so large
+    changelists don't re-count millions of rows on every page load.
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        key = 'changelist-count:' + hashlib.md5(f'{query.model._meta.label}:{query}'.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.CHANGELIST_COUNT_CACHE_TIMEOUT)
+        return count
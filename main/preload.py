@@ -0,0 +1,80 @@
+"""
+Critical resources of each public page, announced before the HTML arrives.
+
+``PreloadHintsMiddleware`` turns these into ``Link`` headers on the response
+and, when the server offers ``wsgi.early_hints`` (gunicorn), into an HTTP 103
+Early Hints response sent before the view runs, so the browser starts on the
+stylesheet, fonts and home hero image while the page is being rendered.
+Cloudflare also caches the ``Link`` headers to send its own Early Hints.
+"""
+from django.templatetags.static import static
+
+from . import critical_css, versions
+from .models import HeroCarouselItem
+
+FONTS_ORIGIN = 'https://fonts.gstatic.com'
+FONTS_STYLESHEET = (
+    'https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700'
+    '&family=Outfit:wght@300;400;500;600;700;800&display=swap'
+)
+HERO_LABEL = 'main.herocarouselitem'
+HERO_SIZES = '100vw'
+
+# The first active carousel slide, as of HERO_LABEL's content version.
+_hero = {'version': None, 'links': []}
+
+
+def _link(url, rel='preload', **params):
+    parts = [f'<{url}>', f'rel={rel}']
+    for name, value in params.items():
+        name = name.replace('_', '')
+        parts.append(name if value is True else f'{name}="{value}"')
+    return '; '.join(parts)
+
+
+def _common_links():
+    return [
+        _link(static('main/css/style.css'), as_='style'),
+        _link(FONTS_ORIGIN, rel='preconnect', crossorigin=True),
+        _link(FONTS_STYLESHEET, as_='style'),
+    ]
+
+
+def _hero_links():
+    item = HeroCarouselItem.objects.filter(is_active=True).exclude(image='').only('image').first()
+    if item is None:
+        # home.html falls back to a static background image.
+        return [_link(static('main/images/hero_home.png'), as_='image', fetchpriority='high')]
+    image = item.responsive_image
+    if image.sources:
+        # Browsers that can't decode the best format skip the preload rather
+        # than fetch a file the <picture> won't use.
+        mime, srcset = image.sources[0]
+        return [_link(image.src, as_='image', imagesrcset=srcset, imagesizes=HERO_SIZES, type=mime,
+                      fetchpriority='high')]
+    if image.srcset:
+        return [_link(image.src, as_='image', imagesrcset=image.srcset, imagesizes=HERO_SIZES,
+                      fetchpriority='high')]
+    return [_link(image.src, as_='image', fetchpriority='high')]
+
+
+def hero_is_current():
+    return _hero['version'] == versions.get_version(HERO_LABEL)
+
+
+def links(url_name):
+    """``Link`` header values for the page ``url_name``; [] for other views.
+
+    Only queries the database when the home hero has changed since the last
+    call (see ``hero_is_current``).
+    """
+    if url_name not in critical_css.PAGES:
+        return []
+    result = _common_links()
+    if url_name == 'home':
+        version = versions.get_version(HERO_LABEL)
+        if _hero['version'] != version:
+            _hero['links'] = _hero_links()
+            _hero['version'] = version
+        result += _hero['links']
+    return result
@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from . import images, metrics, slots, versions
+from .models import (
+    Appointment, Company, HeroCarouselItem, SEOPageSettings, SiteConfiguration, SocialNetwork, Stat, TeamMember,
+    Testimonial,
+)
+
+# Models whose rows are cached across requests; saving or deleting one bumps
+# its content version so every worker drops the stale copy.
+VERSIONED_MODELS = [
+    SEOPageSettings, SiteConfiguration, SocialNetwork, Stat,
+    Company, Testimonial, TeamMember, HeroCarouselItem,
+]
+
+
+def bump_content_version(sender, **kwargs):
+    label = sender._meta.label_lower
+    transaction.on_commit(lambda: versions.bump(label))
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_content_version, sender=model, dispatch_uid=f'version_{model.__name__}_save')
+    post_delete.connect(bump_content_version, sender=model, dispatch_uid=f'version_{model.__name__}_delete')
+
+
+# Bookings only show in the slot availability, which has its own cache.
+def invalidate_slots(sender, **kwargs):
+    transaction.on_commit(slots.invalidate)
+
+
+post_save.connect(invalidate_slots, sender=Appointment, dispatch_uid='slots_appointment_save')
+post_delete.connect(invalidate_slots, sender=Appointment, dispatch_uid='slots_appointment_delete')
+
+
+# Derivatives are built by `manage.py build_image_derivatives --watch`, not
+# here in the admin's request; pages fall back to the original until then.
+# Those of an image that is replaced or deleted go once nothing uses it.
+IMAGE_MODELS = (Company, TeamMember, HeroCarouselItem)
+
+
+def remember_stored_image(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._stored_image = None
+    else:
+        instance._stored_image = sender.objects.filter(pk=instance.pk).values_list('image', flat=True).first()
+
+
+def delete_unused_derivatives(name):
+    def delete():
+        if not any(model.objects.filter(image=name).exists() for model in IMAGE_MODELS):
+            images.delete_derivatives(name)
+    transaction.on_commit(delete)
+
+
+def delete_replaced_derivatives(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_image', None)
+    if stored and stored != instance.image.name:
+        delete_unused_derivatives(stored)
+
+
+def delete_removed_derivatives(sender, instance, **kwargs):
+    if instance.image:
+        delete_unused_derivatives(instance.image.name)
+
+
+for model in IMAGE_MODELS:
+    pre_save.connect(remember_stored_image, sender=model, dispatch_uid=f'derivatives_{model.__name__}_pre_save')
+    post_save.connect(delete_replaced_derivatives, sender=model, dispatch_uid=f'derivatives_{model.__name__}_save')
+    post_delete.connect(delete_removed_derivatives, sender=model, dispatch_uid=f'derivatives_{model.__name__}_delete')
+
+
+def install_query_metrics(sender, connection, **kwargs):
+    # Requests measured by ServerTimingMiddleware count their queries here.
+    if metrics.db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.db_execute_wrapper)
+
+
+connection_created.connect(install_query_metrics, dispatch_uid='query_metrics')
@@ -0,0 +1,46 @@
+from urllib.parse import urljoin
+
+from django.contrib.sitemaps import Sitemap
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+from .caching import page_labels, page_last_modified
+from .models import Company, HeroCarouselItem, SEOPageSettings, TeamMember
+
+# Uploaded images shown on each page, listed as image sitemap entries
+# (search engines read at most 1,000 per URL).
+MAX_IMAGES_PER_URL = 1000
+PAGE_IMAGES = {
+    'home': [HeroCarouselItem.objects.filter(is_active=True), TeamMember.objects.all()],
+    'about': [TeamMember.objects.all()],
+    'companies': [Company.objects.all()],
+}
+
+
+class StaticViewSitemap(Sitemap):
+    priority = 0.5
+
+    def items(self):
+        return ['home', 'about', 'services', 'companies', 'contact', 'appointment']
+
+    def location(self, item):
+        return reverse(item)
+
+    def lastmod(self, item):
+        # The content versions record when each model was last saved.
+        return page_last_modified(item)
+
+    def labels(self):
+        """Content version labels of every model the sitemap depends on."""
+        return sorted({label for item in self.items() for label in page_labels(item)})
+
+    def get_urls(self, page=1, site=None, protocol=None):
+        urls = super().get_urls(page=page, site=site, protocol=protocol)
+        og_images = dict(SEOPageSettings.objects.exclude(og_image='').values_list('page', 'og_image'))
+        for url in urls:
+            names = [og_images.get(url['item'])]
+            for queryset in PAGE_IMAGES.get(url['item'], []):
+                names.extend(queryset.exclude(image='').values_list('image', flat=True)[:MAX_IMAGES_PER_URL])
+            names = [name for name in names if name][:MAX_IMAGES_PER_URL]
+            url['images'] = [urljoin(url['location'], default_storage.url(name)) for name in names]
+        return urls
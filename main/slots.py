@@ -0,0 +1,106 @@
+"""
+Appointment slots.
+
+Business hours and the slot length come from settings; a slot is a
+``(date, time)`` pair, and the unique constraint on ``Appointment`` keeps a
+slot to a single booking. Availability for a date range is answered with one
+range query over that constraint's index and cached under a slot generation
+that every booking replaces (see main.signals). Bookings aren't rendered
+into any page, so they stay out of the content versions and the edge purges.
+"""
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Appointment
+
+GENERATION_KEY = 'slots:generation'
+
+
+def _parse(value):
+    return datetime.strptime(value, '%H:%M').time()
+
+
+def slots_for(day):
+    """Return the bookable start times on ``day`` (empty when closed)."""
+    hours = settings.APPOINTMENT_BUSINESS_HOURS.get(day.weekday())
+    if not hours:
+        return []
+    step = timedelta(minutes=settings.APPOINTMENT_SLOT_MINUTES)
+    start = datetime.combine(day, _parse(hours[0]))
+    end = datetime.combine(day, _parse(hours[1]))
+    slots = []
+    while start + step <= end:
+        slots.append(start.time())
+        start += step
+    return slots
+
+
+def is_slot(day, time):
+    return time in slots_for(day)
+
+
+def _booked_rows(start, days):
+    end = start + timedelta(days=days - 1)
+    return Appointment.objects.filter(date__range=(start, end)).order_by().values_list('date', 'time')
+
+
+def invalidate():
+    """Drop the cached availability of every worker."""
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def _cache_key(generation, start, days):
+    return f'slots:{generation}:{start.isoformat()}:{days}'
+
+
+def _free(start, days, rows):
+    booked = {}
+    for day, time in rows:
+        booked.setdefault(day, set()).add(time)
+    free = {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        taken = booked.get(day, ())
+        free[day] = [time for time in slots_for(day) if time not in taken]
+    return free
+
+
+def _drop_started(free, now):
+    today = free.get(now.date())
+    if today:
+        free = dict(free)
+        free[now.date()] = [time for time in today if time > now.time()]
+    return free
+
+
+def availability(days):
+    """
+    Return ``{date: [free times]}`` for today and the following days.
+
+    The cached map is shared by every request made on the same day; slots
+    that have already started today are dropped on the way out.
+    """
+    now = timezone.localtime()
+    start = now.date()
+    key = _cache_key(cache.get_or_set(GENERATION_KEY, time.time_ns, None), start, days)
+    free = cache.get(key)
+    if free is None:
+        free = _free(start, days, _booked_rows(start, days))
+        cache.set(key, free, settings.APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT)
+    return _drop_started(free, now)
+
+
+async def aavailability(days):
+    """``availability`` for async views, read with the async ORM."""
+    now = timezone.localtime()
+    start = now.date()
+    key = _cache_key(await cache.aget_or_set(GENERATION_KEY, time.time_ns, None), start, days)
+    free = await cache.aget(key)
+    if free is None:
+        free = _free(start, days, [row async for row in _booked_rows(start, days)])
+        await cache.aset(key, free, settings.APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT)
+    return _drop_started(free, now)
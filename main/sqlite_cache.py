@@ -0,0 +1,246 @@
+"""
+Cache backend shared by every worker on the host, stored in a SQLite file.
+
+The default LocMem cache is per process: each gunicorn worker warms its own
+copy of every page and fragment. This backend keeps one copy in a WAL-mode
+SQLite file under ``VAR_DIR``, read through a memory map, so a page rendered
+by one worker is served from the cache by all of them and ``delete``/
+``clear`` take effect everywhere.
+
+Entries are evicted least recently used first once the cache holds more than
+``OPTIONS['MAX_SIZE']`` bytes or ``MAX_ENTRIES`` entries, down to
+``1 - 1/CULL_FREQUENCY`` of the bound. To keep reads from taking the write
+lock, an entry's access time is only refreshed once per
+``ACCESS_RESOLUTION`` seconds. Integers are stored as SQLite integers so
+``incr`` is a single atomic UPDATE.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+ACCESS_RESOLUTION = 60  # seconds
+SQLITE_INT_RANGE = range(-2 ** 63, 2 ** 63)
+
+_local = threading.local()
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, accessed REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+    # Running totals, kept by triggers so a size check is a single-row read.
+    'CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 1), entries INTEGER, bytes INTEGER)',
+    'INSERT OR IGNORE INTO stats VALUES (1, 0, 0)',
+    'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN'
+    ' UPDATE stats SET entries = entries + 1, bytes = bytes + length(NEW.key) + length(NEW.value); END',
+    'CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF value ON cache BEGIN'
+    ' UPDATE stats SET bytes = bytes + length(NEW.value) - length(OLD.value); END',
+    'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN'
+    ' UPDATE stats SET entries = entries - 1, bytes = bytes - length(OLD.key) - length(OLD.value); END',
+]
+
+UPSERT = (
+    'INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+    'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, accessed = excluded.accessed'
+)
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = str(location)
+        options = params.get('OPTIONS', {})
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+
+    def _connection(self):
+        # One connection per thread and process; Django may create several
+        # instances of the backend per thread (one per async context).
+        conns = getattr(_local, 'conns', None)
+        if conns is None or _local.pid != os.getpid():
+            conns = _local.conns = {}
+            _local.pid = os.getpid()
+        conn = conns.get(self._path)
+        if conn is None:
+            os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+            # Losing cache entries in a crash is harmless, so skip fsyncs.
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(f'PRAGMA mmap_size={2 * self._max_size}')
+            conn.execute('BEGIN IMMEDIATE')
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.execute('COMMIT')
+            conns[self._path] = conn
+        return conn
+
+    def _encode(self, value):
+        if type(value) is int and value in SQLITE_INT_RANGE:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _decode(self, value):
+        return value if type(value) is int else pickle.loads(value)
+
+    def _write(self, conn, statement, params):
+        """Run ``statement`` in a write transaction, evicting if the cache grew too big."""
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.execute(statement, params)
+            self._cull(conn)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return cursor.rowcount
+
+    def _cull(self, conn):
+        entries, size = conn.execute('SELECT entries, bytes FROM stats').fetchone()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        if self._cull_frequency == 0:
+            conn.execute('DELETE FROM cache')
+            return
+        now = time.time()
+        conn.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        entries, size = conn.execute('SELECT entries, bytes FROM stats').fetchone()
+        keep = 1 - 1 / self._cull_frequency
+        excess_entries = entries - int(self._max_entries * keep)
+        excess_bytes = size - int(self._max_size * keep)
+        if excess_entries <= 0 and excess_bytes <= 0:
+            return
+        victims = []
+        for key, length in conn.execute('SELECT key, length(key) + length(value) FROM cache ORDER BY accessed'):
+            victims.append((key,))
+            excess_entries -= 1
+            excess_bytes -= length
+            if excess_entries <= 0 and excess_bytes <= 0:
+                break
+        conn.executemany('DELETE FROM cache WHERE key = ?', victims)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        return bool(self._write(
+            self._connection(),
+            'INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, '
+            'accessed = excluded.accessed WHERE cache.expires <= ?',
+            (key, self._encode(value), self.get_backend_timeout(timeout), now, now),
+        ))
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute('SELECT value, expires, accessed FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return default
+        if now - row[2] > ACCESS_RESOLUTION:
+            conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not keys:
+            return {}
+        now = time.time()
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) AND (expires IS NULL OR expires > ?)',
+            [*keys, now],
+        )
+        return {keys[key]: self._decode(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires = self.get_backend_timeout(timeout)
+        self._write(self._connection(), UPSERT, (key, self._encode(value), expires, time.time()))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        conn = self._connection()
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        rows = [(self.make_and_validate_key(key, version=version), self._encode(value), expires, now)
+                for key, value in data.items()]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(UPSERT, rows)
+            self._cull(conn)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return bool(cursor.rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        now = time.time()
+        if delta in SQLITE_INT_RANGE:
+            # SQLite turns an integer sum past 64 bits into a REAL, so only
+            # values the result stays in range for are added in SQL.
+            rows = conn.execute(
+                "UPDATE cache SET value = value + ?, accessed = ? "
+                "WHERE key = ? AND typeof(value) = 'integer' AND value BETWEEN ? AND ? "
+                "AND (expires IS NULL OR expires > ?) RETURNING value",
+                (delta, now, key, SQLITE_INT_RANGE.start - min(delta, 0), SQLITE_INT_RANGE.stop - 1 - max(delta, 0), now),
+            ).fetchall()  # Reading every row finishes the statement and releases the write lock
+            if rows:
+                return rows[0][0]
+        # Not there, a pickled number (a float, a huge int), or a sum that
+        # doesn't fit in 64 bits: added in Python and pickled if need be.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._decode(row[0]) + delta
+            conn.execute('UPDATE cache SET value = ?, accessed = ? WHERE key = ?', (self._encode(value), now, key))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self._connection().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount)
+
+    def delete_many(self, keys, version=None):
+        keys = [(self.make_and_validate_key(key, version=version),) for key in keys]
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('DELETE FROM cache WHERE key = ?', keys)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
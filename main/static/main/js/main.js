@@ -194,6 +194,61 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
+    // CSRF tokens for pre-rendered pages
+    // Exported/cached HTML ships forms with an empty token; fetch one on submit.
+    document.querySelectorAll('form input[name="csrfmiddlewaretoken"]').forEach(input => {
+        const form = input.form;
+        form.addEventListener('submit', (event) => {
+            if (input.value) return;
+            event.preventDefault();
+            fetch('/csrf/', { credentials: 'same-origin' })
+                .then(response => response.json())
+                .then(data => {
+                    input.value = data.token;
+                    form.submit();
+                });
+        });
+    });
+
+    // Appointment availability
+    // Offer the free slots of the chosen day, fetched once from the availability endpoint.
+    const appointmentForm = document.querySelector('form[data-availability-url]');
+    if (appointmentForm) {
+        const dateInput = appointmentForm.querySelector('input[type="date"]');
+        const slotList = appointmentForm.querySelector('#appointment-slots');
+        const slotStatus = appointmentForm.querySelector('.slot-status');
+        let freeSlots = {};
+
+        const showSlots = () => {
+            const slots = freeSlots[dateInput.value];
+            slotList.innerHTML = '';
+            if (!dateInput.value || slots === undefined) {
+                slotStatus.textContent = '';
+                return;
+            }
+            slots.forEach(slot => {
+                const option = document.createElement('option');
+                option.value = slot;
+                slotList.appendChild(option);
+            });
+            slotStatus.textContent = slots.length
+                ? 'Available: ' + slots.join(', ')
+                : 'No free slots on this day, please pick another date.';
+        };
+
+        // The date picker's min/max span the booking window
+        const days = dateInput.min && dateInput.max
+            ? Math.round((Date.parse(dateInput.max) - Date.parse(dateInput.min)) / 86400000) + 1
+            : 14;
+        fetch(appointmentForm.dataset.availabilityUrl + '?days=' + days)
+            .then(response => response.json())
+            .then(data => {
+                freeSlots = data.days;
+                showSlots();
+            });
+        dateInput.addEventListener('change', showSlots);
+    }
+
     // Hamburger Menu Logic
     const hamburger = document.querySelector('.hamburger');
     const navLinks = document.querySelector('.nav-links');
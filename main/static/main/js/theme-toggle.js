@@ -21,16 +21,16 @@ function updateIcon(theme) {
     const toggleButton = document.getElementById('theme-toggle');
     if (!toggleButton) return;
 
-    const icon = toggleButton.querySelector('i');
+    // The icon is a <use> reference into the SVG sprite
+    const icon = toggleButton.querySelector('use');
     if (!icon) return;
+    const sprite = icon.getAttribute('href').split('#')[0];
 
     if (theme === 'dark') {
-        icon.classList.remove('fa-moon');
-        icon.classList.add('fa-sun');
+        icon.setAttribute('href', sprite + '#sun');
         toggleButton.setAttribute('aria-label', 'Switch to Light Mode');
     } else {
-        icon.classList.remove('fa-sun');
-        icon.classList.add('fa-moon');
+        icon.setAttribute('href', sprite + '#moon');
         toggleButton.setAttribute('aria-label', 'Switch to Dark Mode');
     }
 }
@@ -0,0 +1,44 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; only .gz siblings are written without it
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Content-hashed static files with precompressed ``.gz``/``.br`` siblings,
+    so nginx can serve them with ``gzip_static``/``brotli_static`` and
+    far-future ``immutable`` caching.
+    """
+    compressible_extensions = ('.css', '.js', '.svg', '.json', '.txt', '.xml', '.map', '.ico')
+    min_compress_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if name.endswith(self.compressible_extensions):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < self.min_compress_size:
+            return
+        variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data, quality=11)
+        for suffix, compressed in variants.items():
+            # Not worth keeping unless it actually saves bytes
+            if len(compressed) < len(data):
+                tmp = f'{path}{suffix}.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(compressed)
+                os.replace(tmp, path + suffix)
@@ -0,0 +1,87 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from main import versions
+from main.critical_css import for_page as critical_css_for_page
+from main.caching import CSRF_PLACEHOLDER, deploy_token, strip_csrf_tokens
+
+register = template.Library()
+
+
+@register.inclusion_tag('main/includes/picture.html')
+def picture(image, alt='', sizes='100vw', css_class='', loading='lazy', fetchpriority=''):
+    """Render a ``<picture>`` with AVIF/WebP/JPEG srcsets for ``image``.
+
+    ``image`` is a model's ``responsive_image``.
+    """
+    return {
+        'image': image,
+        'alt': alt,
+        'sizes': sizes,
+        'css_class': css_class,
+        'loading': loading,
+        'fetchpriority': fetchpriority,
+    }
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, name, labels):
+        self.nodelist = nodelist
+        self.name = name
+        self.labels = labels
+
+    def render(self, context):
+        if not settings.FRAGMENT_CACHE_ENABLED:
+            return self.nodelist.render(context)
+        labels = [label.resolve(context) for label in self.labels]
+        key = f'fragment:{self.name.resolve(context)}:{versions.get_version(*labels)}:{deploy_token()}'
+        content = cache.get(key)
+        if content is None:
+            content = strip_csrf_tokens(self.nodelist.render(context))
+            cache.set(key, content, settings.FRAGMENT_CACHE_TIMEOUT)
+        if CSRF_PLACEHOLDER in content:
+            content = content.replace(CSRF_PLACEHOLDER, str(context.get('csrf_token', '')))
+        return mark_safe(content)
+
+
+@register.tag
+def cachefragment(parser, token):
+    """Cache the enclosed template until one of the given models changes.
+
+    Usage::
+
+        {% cachefragment 'team-grid' 'main.teammember' %}
+            ...
+        {% endcachefragment %}
+
+    The first argument names the fragment, the rest are model labels whose
+    content versions key the cache entry; saving any of them in the admin
+    renders the fragment afresh. Fragments must only depend on those models
+    (CSRF tokens are filled in per request).
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name")
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CachedFragmentNode(nodelist, parser.compile_filter(bits[1]), [parser.compile_filter(bit) for bit in bits[2:]])
+
+
+@register.simple_tag
+def icon(name, css_class=''):
+    """An icon from the SVG sprite (main/icons/icons.svg), sized and coloured like text."""
+    return format_html(
+        '<svg class="icon{}" aria-hidden="true"><use href="{}#{}"></use></svg>',
+        f' {css_class}' if css_class else '', static('main/icons/icons.svg'), name,
+    )
+
+
+@register.simple_tag(takes_context=True)
+def critical_css(context):
+    """The page's above-the-fold CSS from ``manage.py build_critical_css``, or ''."""
+    match = getattr(context.get('request'), 'resolver_match', None)
+    return mark_safe(critical_css_for_page(match.url_name)) if match else ''
@@ -1,3 +1,1405 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import smtplib
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail, signing
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import IntegrityError, transaction
+from django.db.utils import ConnectionHandler
+from django.core.management import CommandError, call_command
+from django.template import Context, Template
+from django.test import Client, TestCase, override_settings
+from django.urls import path, reverse
+from django.utils import timezone as django_timezone
+from django.utils.http import http_date
+
+from . import async_views, caching, context_processors, critical_css, images, journal, slots, throttling, versions
+from .admin import ContactSubmissionAdmin
+from .caching import CSRF_PLACEHOLDER
+from .forms import AppointmentForm, NewsletterForm
+from .management.commands import build_image_derivatives, purge_edge_cache
+from .models import (
+    Appointment, ContactSubmission, ContentVersion, JournalCheckpoint, NewsletterCampaign, NewsletterSubscriber,
+    OutboundEmail, SEOPageSettings, SiteConfiguration, TeamMember,
+)
+from .sqlite_cache import SQLiteCache
+from .urls import urlpatterns as main_urlpatterns
+
+
+class VarDirTestCase(TestCase):
+    """
+    Points VAR_DIR and the files kept under it at a fresh temporary directory,
+    and renders static URLs without the collectstatic manifest.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.var_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.var_dir, ignore_errors=True)
+        overrides = override_settings(
+            VAR_DIR=self.var_dir,
+            CONTENT_VERSIONS_FILE=self.var_dir / 'content_versions.json',
+            CRITICAL_CSS_FILE=self.var_dir / 'critical_css.json',
+            THROTTLE_DB=self.var_dir / 'throttle.sqlite3',
+            CACHES={'default': {'BACKEND': 'main.sqlite_cache.SQLiteCache', 'LOCATION': self.var_dir / 'cache.sqlite3'}},
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+
+class JournalTests(VarDirTestCase):
+    contact = {'name': 'Ada', 'email': 'ada@example.com', 'subject': 'Hello', 'message': 'Hi there'}
+
+    def setUp(self):
+        super().setUp()
+        self.restart_flusher()
+
+    def restart_flusher(self):
+        # What a new flush_journal process starts with
+        journal._checkpoints = None
+
+    def segment(self):
+        return Path(journal._state['path'])
+
+    def test_each_record_is_inserted_once(self):
+        for i in range(3):
+            journal.append('subscribe', {'email': f'reader{i}@example.com'})
+        journal.append('contact', self.contact)
+
+        self.assertEqual(journal.flush(3), 3)
+        self.assertEqual(journal.flush(3), 1)
+        self.assertEqual(journal.flush(3), 0)
+        self.assertEqual(NewsletterSubscriber.objects.count(), 3)
+        self.assertEqual(ContactSubmission.objects.count(), 1)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_restart_after_commit_does_not_replay(self):
+        journal.append('contact', self.contact)
+        self.assertEqual(journal.flush(100), 1)
+
+        self.restart_flusher()
+        self.assertEqual(journal.flush(100), 0)
+        self.assertEqual(ContactSubmission.objects.count(), 1)
+        self.assertEqual(
+            JournalCheckpoint.objects.get(segment=self.segment().name).offset, self.segment().stat().st_size,
+        )
+
+    def test_crash_before_commit_replays_everything(self):
+        journal.append('subscribe', {'email': 'reader@example.com'})
+        journal.append('contact', self.contact)
+
+        with mock.patch.dict(journal.HANDLERS, {'contact': mock.Mock(side_effect=RuntimeError('crash'))}):
+            with self.assertRaises(RuntimeError):
+                journal.flush(100)
+        # The rows and the checkpoint went down together.
+        self.assertFalse(NewsletterSubscriber.objects.exists())
+        self.assertFalse(JournalCheckpoint.objects.exists())
+
+        self.restart_flusher()
+        self.assertEqual(journal.flush(100), 2)
+        self.assertEqual(NewsletterSubscriber.objects.count(), 1)
+        self.assertEqual(ContactSubmission.objects.count(), 1)
+
+    def test_torn_line_waits_for_its_newline(self):
+        journal.append('subscribe', {'email': 'first@example.com'})
+        with open(self.segment(), 'ab') as f:
+            f.write(b'{"kind":"subscribe","data":{"email":"sec')
+        self.assertEqual(journal.flush(100), 1)
+
+        with open(self.segment(), 'ab') as f:
+            f.write(b'ond@example.com"}}\n')
+        self.restart_flusher()
+        self.assertEqual(journal.flush(100), 1)
+        self.assertEqual(
+            sorted(NewsletterSubscriber.objects.values_list('email', flat=True)),
+            ['first@example.com', 'second@example.com'],
+        )
+
+    def test_bad_line_is_quarantined_and_skipped(self):
+        journal.append('subscribe', {'email': 'before@example.com'})
+        with open(self.segment(), 'ab') as f:
+            f.write(b'{"kind":"subscribe","data":\n')
+        journal.append('subscribe', {'email': 'after@example.com'})
+
+        with self.assertLogs('main.journal', 'ERROR'):
+            self.assertEqual(journal.flush(100), 2)
+        self.assertEqual(NewsletterSubscriber.objects.count(), 2)
+        quarantined = self.var_dir / 'journal' / 'quarantine' / self.segment().name
+        self.assertEqual(quarantined.read_bytes(), b'{"kind":"subscribe","data":\n')
+        self.assertEqual(journal.flush(100), 0)
+
+    def test_record_the_database_refuses_is_quarantined(self):
+        journal.append('contact', self.contact)
+        journal.append('contact', {**self.contact, 'name': None})
+        journal.append('subscribe', {'email': 'after@example.com'})
+        refused = self.segment().read_bytes().splitlines(keepends=True)[1]
+
+        with self.assertLogs('main.journal', 'ERROR') as logs:
+            self.assertEqual(journal.flush(100), 3)
+        self.assertIn('IntegrityError', logs.output[0])
+        self.assertEqual(ContactSubmission.objects.get().name, 'Ada')
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+        self.assertTrue(NewsletterSubscriber.objects.filter(email='after@example.com').exists())
+        quarantined = self.var_dir / 'journal' / 'quarantine' / self.segment().name
+        self.assertEqual(quarantined.read_bytes(), refused)
+
+        self.restart_flusher()
+        self.assertEqual(journal.flush(100), 0)
+
+
+@override_settings(
+    THROTTLE_ENABLED=True,
+    THROTTLE_LIMITS={'subscribe': {'ip': (3, 60), 'email': (2, 3600)}},
+    THROTTLE_TRUST_CF_HEADER=True,
+)
+class ThrottleTests(VarDirTestCase):
+    visitor = '203.0.113.5'
+
+    def subscribe(self, email, remote_addr=visitor, cf_ip=None):
+        headers = {'CF-Connecting-IP': cf_ip} if cf_ip else {}
+        return self.client.post(reverse('subscribe'), {'email': email}, REMOTE_ADDR=remote_addr, headers=headers)
+
+    def test_ip_burst_then_429(self):
+        statuses = [self.subscribe(f'reader{i}@example.com').status_code for i in range(4)]
+        self.assertEqual(statuses, [302, 302, 302, 429])
+        self.assertEqual(NewsletterSubscriber.objects.count(), 3)
+
+        response = self.subscribe('reader9@example.com')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        # Other clients have their own buckets.
+        self.assertEqual(self.subscribe('other@example.com', '198.51.100.7').status_code, 302)
+
+    def test_email_bucket_spans_addresses(self):
+        statuses = [self.subscribe('Reader@Example.com', f'198.51.100.{i}').status_code for i in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+
+    def test_gets_are_not_throttled(self):
+        for _ in range(5):
+            self.assertEqual(self.client.get(reverse('subscribe'), REMOTE_ADDR=self.visitor).status_code, 302)
+
+    def test_rejected_request_takes_no_tokens(self):
+        with mock.patch('main.throttling.time.time', return_value=1000.0):
+            self.assertEqual(throttling.take([('a', 1, 60)]), 0)
+            # 'b' would allow it, 'a' is empty: neither pays.
+            self.assertEqual(throttling.take([('b', 1, 60), ('a', 1, 60)]), 60)
+            self.assertEqual(throttling.take([('b', 1, 60)]), 0)
+
+    def test_bucket_refills_over_its_period(self):
+        with mock.patch('main.throttling.time.time', return_value=1000.0):
+            self.assertEqual(throttling.take([('a', 2, 60)]), 0)
+            self.assertEqual(throttling.take([('a', 2, 60)]), 0)
+            self.assertEqual(throttling.take([('a', 2, 60)]), 30)
+        with mock.patch('main.throttling.time.time', return_value=1030.0):
+            self.assertEqual(throttling.take([('a', 2, 60)]), 0)
+
+    def test_forged_cf_header_is_ignored(self):
+        for i in range(3):
+            self.subscribe(f'reader{i}@example.com', cf_ip=f'192.0.2.{i}')
+        response = self.subscribe('reader3@example.com', cf_ip='192.0.2.99')
+        self.assertEqual(response.status_code, 429)
+
+    def test_cf_header_from_trusted_proxy_is_used(self):
+        for i in range(4):
+            response = self.subscribe(f'reader{i}@example.com', '127.0.0.1', cf_ip=f'192.0.2.{i}')
+            self.assertEqual(response.status_code, 302)
+
+
+@mock.patch.object(ContactSubmissionAdmin, 'list_per_page', 2)
+class KeysetChangelistTests(VarDirTestCase):
+    url = reverse('admin:main_contactsubmission_changelist')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        # Two rows share a timestamp, so the primary key has to break the tie.
+        for i, minutes in enumerate([0, 1, 2, 2, 3]):
+            submission = ContactSubmission.objects.create(name=f'n{i}', email='a@example.com', subject=f's{i}', message='m')
+            ContactSubmission.objects.filter(pk=submission.pk).update(created_at=start + timedelta(minutes=minutes))
+        self.newest_first = list(ContactSubmission.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+
+    def page(self, params=None):
+        response = self.client.get(self.url, params or {})
+        self.assertEqual(response.status_code, 200)
+        rows = [obj.pk for obj in response.context_data['cl'].result_list]
+        older = response.context_data.get('keyset_older_url')
+        return rows, older and {key: values[0] for key, values in parse_qs(urlsplit(older).query).items()}
+
+    def test_walks_every_row_once_in_order(self):
+        seen, params = [], None
+        while True:
+            rows, params = self.page(params)
+            seen += rows
+            if params is None:
+                break
+        self.assertEqual(seen, self.newest_first)
+
+    def test_cursor_is_the_last_rows_sort_key(self):
+        rows, params = self.page()
+        last = ContactSubmission.objects.get(pk=rows[-1])
+        self.assertEqual(params['before'], f'{last.created_at.isoformat()}~{last.pk}')
+
+    def test_no_cursor_when_sorted_by_a_column(self):
+        rows, params = self.page({'o': '1'})
+        self.assertEqual(len(rows), 2)
+        self.assertIsNone(params)
+
+    def test_bad_cursors_are_rejected(self):
+        for cursor in ['not-a-date~1', '2026-01-01T00:00:00+00:00', '2026-01-01T00:00:00+00:00~x']:
+            response = self.client.get(self.url, {'before': cursor})
+            self.assertRedirects(response, f'{self.url}?e=1', fetch_redirect_response=False)
+
+
+class FileServingTests(VarDirTestCase):
+    content = bytes(range(100))
+
+    def setUp(self):
+        super().setUp()
+        for name in ('media', 'static'):
+            (self.var_dir / name).mkdir()
+        overrides = override_settings(
+            SERVE_FILES=True, SERVE_FILES_MAX_AGE=600,
+            MEDIA_ROOT=self.var_dir / 'media', STATIC_ROOT=self.var_dir / 'static',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.path = self.var_dir / 'media' / 'clip.bin'
+        self.path.write_bytes(self.content)
+        self.mtime = int(self.path.stat().st_mtime)
+
+    def get(self, url='/media/clip.bin', method='get', **headers):
+        return getattr(self.client, method)(url, headers=headers)
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_full_file_with_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Last-Modified'], http_date(self.mtime))
+        self.assertIn('max-age=600', response['Cache-Control'])
+        self.assertNotIn('Content-Disposition', response)
+
+    def test_revalidation_gets_304(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(If_None_Match=etag).status_code, 304)
+        self.assertEqual(self.get(If_Modified_Since=http_date(self.mtime)).status_code, 304)
+        self.assertEqual(self.get(If_None_Match='"stale"').status_code, 200)
+
+    def test_changed_file_gets_a_new_etag(self):
+        etag = self.get()['ETag']
+        self.path.write_bytes(self.content * 2)
+        response = self.get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content * 2)
+
+    def test_byte_ranges(self):
+        for header, start, end in [('bytes=10-19', 10, 19), ('bytes=95-', 95, 99), ('bytes=-5', 95, 99),
+                                   ('bytes=90-500', 90, 99)]:
+            with self.subTest(header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/100')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+                self.assertEqual(self.body(response), self.content[start:end + 1])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(Range='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    async def test_served_under_asgi(self):
+        response = await self.async_client.get('/media/clip.bin', headers={'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.content[10:20])
+        self.assertEqual((await self.async_client.get('/media/missing.bin')).status_code, 404)
+
+    def test_multiple_or_malformed_ranges_get_everything(self):
+        for header in ['bytes=0-1,5-6', 'bytes=x-y', 'items=0-1']:
+            with self.subTest(header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.body(response), self.content)
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(Range='bytes=0-9', If_Range=etag).status_code, 206)
+        self.assertEqual(self.get(Range='bytes=0-9', If_Range=http_date(self.mtime)).status_code, 206)
+        # The client's partial copy is of another version: send the whole file.
+        response = self.get(Range='bytes=0-9', If_Range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_head_has_headers_only(self):
+        response = self.get(method='head', Range='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response.content, b'')
+
+    def test_precompressed_variant(self):
+        css = b'body { color: red; }' * 50
+        path = self.var_dir / 'static' / 'site.css'
+        path.write_bytes(css)
+        with gzip.open(f'{path}.gz', 'wb') as f:
+            f.write(css)
+
+        response = self.get('/static/site.css', Accept_Encoding='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].endswith('-gzip"'))
+        self.assertEqual(gzip.decompress(self.body(response)), css)
+        # Ranges are of the identity encoding.
+        response = self.get('/static/site.css', Accept_Encoding='gzip', Range='bytes=0-3')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(self.body(response), css[:4])
+
+    def test_stale_variant_is_ignored(self):
+        path = self.var_dir / 'static' / 'site.css'
+        path.write_bytes(b'new' * 100)
+        with gzip.open(f'{path}.gz', 'wb') as f:
+            f.write(b'old' * 100)
+        os.utime(f'{path}.gz', (self.mtime - 60, self.mtime - 60))
+        response = self.get('/static/site.css', Accept_Encoding='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_only_files_under_the_roots(self):
+        (self.var_dir / 'secret.txt').write_bytes(b'secret')
+        self.assertEqual(self.get('/media/../secret.txt').status_code, 404)
+        self.assertEqual(self.get('/media/').status_code, 404)
+        self.assertEqual(self.get('/media/missing.bin').status_code, 404)
+        self.assertEqual(self.client.post('/media/clip.bin').status_code, 404)
+
+
+class SQLiteCacheTests(VarDirTestCase):
+    def make_cache(self, **options):
+        return SQLiteCache(self.var_dir / 'test-cache.sqlite3', {'OPTIONS': options})
+
+    def setUp(self):
+        super().setUp()
+        self.cache = self.make_cache()
+
+    def test_get_set_delete(self):
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertEqual(self.cache.get('missing', 'default'), 'default')
+        self.cache.set('number', 42)
+        self.cache.set('page', {'content': 'x' * 1000, 'content_type': 'text/html'})
+        self.assertEqual(self.cache.get('number'), 42)
+        self.assertEqual(self.cache.get('page')['content'], 'x' * 1000)
+        self.assertTrue(self.cache.has_key('page'))
+        self.assertTrue(self.cache.delete('page'))
+        self.assertFalse(self.cache.delete('page'))
+        self.assertIsNone(self.cache.get('page'))
+
+    def test_many_and_clear(self):
+        self.cache.set_many({'a': 1, 'b': [2], 'c': 'three'})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'missing']), {'a': 1, 'b': [2]})
+        self.cache.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'c': 'three'})
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('c'))
+
+    def test_expiry_add_and_touch(self):
+        with mock.patch('time.time', return_value=1000.0):
+            self.cache.set('key', 'old', 10)
+            self.assertFalse(self.cache.add('key', 'new'))
+            self.assertTrue(self.cache.add('other', 'value', 10))
+        with mock.patch('time.time', return_value=1005.0):
+            self.assertTrue(self.cache.touch('other', 100))
+        with mock.patch('time.time', return_value=1011.0):
+            self.assertIsNone(self.cache.get('key'))
+            self.assertFalse(self.cache.has_key('key'))
+            self.assertEqual(self.cache.get('other'), 'value')
+            self.assertTrue(self.cache.add('key', 'new'))
+            self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr_and_decr(self):
+        self.cache.set('count', 1)
+        self.assertEqual(self.cache.incr('count'), 2)
+        self.assertEqual(self.cache.incr('count', 10), 12)
+        self.assertEqual(self.cache.decr('count', 20), -8)
+        self.cache.set('ratio', 1.5)
+        self.assertEqual(self.cache.incr('ratio'), 2.5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        with mock.patch('time.time', return_value=1000.0):
+            self.cache.set('expiring', 1, 10)
+        with mock.patch('time.time', return_value=1011.0), self.assertRaises(ValueError):
+            self.cache.incr('expiring')
+
+    def test_incr_past_64_bits_stays_exact(self):
+        top = 2 ** 63 - 1
+        self.cache.set('count', top - 1)
+        self.assertEqual(self.cache.incr('count'), top)
+        self.assertEqual(self.cache.incr('count'), top + 1)
+        self.assertEqual(self.cache.get('count'), top + 1)
+        self.assertEqual(self.cache.decr('count', 2), top - 1)
+        self.cache.set('low', -top - 1)
+        self.assertEqual(self.cache.decr('low'), -top - 2)
+        self.cache.set('small', 1)
+        self.assertEqual(self.cache.incr('small', 2 ** 70), 2 ** 70 + 1)
+
+    def test_incr_is_atomic_across_threads(self):
+        self.cache.set('count', 0)
+
+        def work():
+            for _ in range(50):
+                self.cache.incr('count')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('count'), 200)
+
+    def test_shared_by_every_instance_of_the_file(self):
+        self.cache.set('key', 'value')
+        other = self.make_cache()
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(other.get('key')))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, ['value'])
+
+    def test_cull_evicts_least_recently_used(self):
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        now = time.time()
+        for i in range(10):
+            with mock.patch('time.time', return_value=now + i):
+                cache.set(f'key{i}', i)
+        # Read long enough after it was written to refresh its access time
+        with mock.patch('time.time', return_value=now + 100):
+            cache.get('key0')
+            cache.set('key10', 10)
+        kept = set(cache.get_many([f'key{i}' for i in range(11)]))
+        self.assertLessEqual(len(kept), 5)
+        self.assertIn('key0', kept)
+        self.assertIn('key10', kept)
+        self.assertNotIn('key1', kept)
+
+    def test_cull_by_size(self):
+        cache = self.make_cache(MAX_SIZE=10000, CULL_FREQUENCY=4)
+        for i in range(20):
+            cache.set(f'key{i}', b'x' * 1000)
+        stored = cache.get_many([f'key{i}' for i in range(20)])
+        self.assertLess(len(stored), 10)
+        self.assertIn('key19', stored)
+
+
+@override_settings(
+    PAGE_CACHE_ENABLED=True, FRAGMENT_CACHE_ENABLED=True, CONDITIONAL_GET_ENABLED=False,
+    EDGE_CACHE_ENABLED=False, THROTTLE_ENABLED=False,
+)
+class CsrfPlaceholderTests(VarDirTestCase):
+    token_input = re.compile(r'name="csrfmiddlewaretoken" value="([^"]*)"')
+
+    def visit(self, url='/'):
+        client = Client(enforce_csrf_checks=True)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        tokens = self.token_input.findall(response.content.decode())
+        self.assertTrue(tokens)
+        return client, response, tokens
+
+    def subscribe(self, client, token):
+        return client.post(reverse('subscribe'), {'email': 'reader@example.com', 'csrfmiddlewaretoken': token})
+
+    def test_cached_page_carries_each_visitors_token(self):
+        first, response, first_tokens = self.visit()
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        second, response, second_tokens = self.visit()
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+
+        for tokens in (first_tokens, second_tokens):
+            self.assertNotIn(CSRF_PLACEHOLDER, tokens)
+            self.assertNotIn('', tokens)
+        self.assertFalse(set(first_tokens) & set(second_tokens))
+        # Each token is good for its own visitor only.
+        self.assertEqual(self.subscribe(second, first_tokens[0]).status_code, 403)
+        self.assertEqual(self.subscribe(second, second_tokens[0]).status_code, 302)
+
+    def test_cache_stores_the_placeholder_not_a_token(self):
+        _, _, tokens = self.visit()
+        with sqlite3.connect(self.var_dir / 'cache.sqlite3') as conn:
+            values = [value for key, value in conn.execute('SELECT key, value FROM cache') if ':page:' in key]
+        self.assertEqual(len(values), 1)
+        self.assertIn(CSRF_PLACEHOLDER.encode(), values[0])
+        self.assertNotIn(tokens[0].encode(), values[0])
+
+    @override_settings(PAGE_CACHE_ENABLED=False)
+    def test_cached_fragment_carries_each_visitors_token(self):
+        self.visit('/about/')
+        client, response, tokens = self.visit('/about/')
+        self.assertNotIn(CSRF_PLACEHOLDER, response.content.decode())
+        self.assertEqual(self.subscribe(client, tokens[0]).status_code, 302)
+
+    def test_visitors_with_a_session_bypass_the_cache(self):
+        self.visit()
+        client = Client()
+        client.cookies['sessionid'] = 'abc'
+        self.assertNotIn('X-Page-Cache', client.get('/'))
+
+
+@override_settings(ALLOWED_HOSTS=['localhost', '127.0.0.1'])
+class BuildCriticalCssTests(VarDirTestCase):
+    def build(self, **options):
+        out = io.StringIO()
+        call_command('build_critical_css', host='thinkce.example', stdout=out, **options)
+        return out.getvalue()
+
+    def test_builds_for_a_host_outside_allowed_hosts(self):
+        self.build()
+        pages = critical_css.load()
+        self.assertEqual(set(pages), set(critical_css.PAGES))
+        self.assertEqual(settings.ALLOWED_HOSTS, ['localhost', '127.0.0.1'])
+
+    def test_home_covers_picture_and_fallback_slides(self):
+        # The database has no carousel items, so only VARIANTS render the pictures.
+        self.build()
+        css = critical_css.for_page('home')
+        self.assertIn('.carousel-slide.has-picture', css)
+        self.assertIn('.carousel-image', css)
+
+    def test_unchanged_sources_are_skipped(self):
+        self.build()
+        self.assertIn('up to date', self.build())
+
+
+@override_settings(ALLOWED_HOSTS=['localhost', '127.0.0.1'], EDGE_CACHE_ENABLED=False)
+class ExportStaticSiteTests(VarDirTestCase):
+    def export(self, *args):
+        out = io.StringIO()
+        call_command('export_static_site', *args, output=str(self.var_dir / 'public'), host='thinkce.example', stdout=out)
+        return out.getvalue()
+
+    def test_exports_every_page_for_a_host_outside_allowed_hosts(self):
+        self.export()
+        home = (self.var_dir / 'public' / 'index.html').read_text()
+        self.assertIn('<link rel="canonical" href="https://thinkce.example/">', home)
+        # Visitors fetch their own token; none is baked into the file.
+        self.assertIn('name="csrfmiddlewaretoken" value=""', home)
+        for page in ('about', 'services', 'companies', 'contact', 'appointment'):
+            self.assertTrue((self.var_dir / 'public' / page / 'index.html').exists(), page)
+        self.assertEqual(settings.ALLOWED_HOSTS, ['localhost', '127.0.0.1'])
+
+    def test_only_changed_pages_are_re_exported(self):
+        self.export()
+        self.assertNotIn('Exported', self.export())
+        self.assertEqual(self.export('--force').count('Exported'), 6)
+
+
+@override_settings(PAGE_CACHE_ENABLED=True, FRAGMENT_CACHE_ENABLED=True, CONDITIONAL_GET_ENABLED=False)
+class DeployTokenTests(VarDirTestCase):
+    def test_pages_and_fragments_cached_by_older_code_are_not_served(self):
+        self.assertEqual(self.client.get('/')['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get('/')['X-Page-Cache'], 'hit')
+        fragments = self.cache_keys(':fragment:')
+
+        with mock.patch.dict(caching._build_state, {'result': ('newdeploy', 0.0)}):
+            self.assertEqual(self.client.get('/')['X-Page-Cache'], 'miss')
+        self.assertEqual(len(self.cache_keys(':fragment:')), 2 * len(fragments))
+
+    def cache_keys(self, marker):
+        with sqlite3.connect(self.var_dir / 'cache.sqlite3') as conn:
+            return [key for key, in conn.execute('SELECT key FROM cache') if marker in key]
+
+
+class AsyncURLConf:
+    """main.urls as routed with ASYNC_VIEWS on (ASGI)."""
+    urlpatterns = [
+        path(str(pattern.pattern), getattr(async_views, pattern.name, pattern.callback), name=pattern.name)
+        for pattern in main_urlpatterns
+    ]
+
+
+# The async ORM raises SynchronousOnlyOperation for a query made on the event
+# loop, so a page that renders proves its view didn't make one.
+@override_settings(ROOT_URLCONF=AsyncURLConf, PAGE_CACHE_ENABLED=False, CONDITIONAL_GET_ENABLED=False)
+class AsyncViewsTests(VarDirTestCase):
+    def setUp(self):
+        super().setUp()
+        context_processors._chrome.update(version=None, data=None)
+        TeamMember.objects.create(name='Grace', role='Engineer')
+
+    async def test_pages_render_on_the_event_loop(self):
+        for url in ('/', '/about/', '/services/', '/companies/', '/contact/', '/appointment/'):
+            with self.subTest(url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+        self.assertContains(await self.async_client.get('/about/'), 'Grace')
+
+    async def test_contact_and_subscribe_write_with_the_async_orm(self):
+        contact = {'name': 'Ada', 'email': 'ada@example.com', 'subject': 'Hello', 'message': 'Hi there'}
+        response = await self.async_client.post('/contact/', contact, follow=True)
+        self.assertContains(response, 'Your message has been sent successfully')
+        self.assertEqual(await ContactSubmission.objects.acount(), 1)
+        self.assertEqual((await OutboundEmail.objects.aget()).recipients, settings.CONTACT_EMAIL)
+
+        response = await self.async_client.post('/subscribe/', {'email': 'reader@example.com'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(await NewsletterSubscriber.objects.filter(email='reader@example.com').aexists())
+
+    async def test_appointment_claims_a_slot(self):
+        day = django_timezone.localdate() + timedelta(days=1)
+        while not slots.slots_for(day):
+            day += timedelta(days=1)
+        time = slots.slots_for(day)[0]
+        availability = await self.async_client.get('/appointment/availability/', {'days': 9})
+        self.assertIn(time.strftime('%H:%M'), availability.json()['days'][day.isoformat()])
+
+        booking = {'name': 'Ada', 'email': 'ada@example.com', 'phone': '555', 'service': 'consulting',
+                   'date': day.isoformat(), 'time': time.strftime('%H:%M')}
+        self.assertEqual((await self.async_client.post('/appointment/', booking)).status_code, 302)
+        self.assertTrue(await Appointment.objects.filter(date=day, time=time).aexists())
+        response = await self.async_client.post('/appointment/', {**booking, 'name': 'Grace'})
+        self.assertContains(response, 'This time slot has already been booked.')
+
+
+class FlakyEmailBackend(BaseEmailBackend):
+    """
+    Rejects mail to rejected@example.com, drops the connection on mail to
+    the ``unreachable`` addresses and, while ``down``, can't connect at all.
+    """
+    down = False
+    unreachable = frozenset()
+
+    def open(self):
+        if self.down:
+            raise ConnectionRefusedError('Connection refused')
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'rejected@example.com' in message.to:
+                raise smtplib.SMTPRecipientsRefused({'rejected@example.com': (550, b'No such user')})
+            if self.unreachable & set(message.to):
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        mail.outbox.extend(messages)
+        return len(messages)
+
+
+@override_settings(EMAIL_BACKEND='main.tests.FlakyEmailBackend', OUTBOX_MAX_ATTEMPTS=3)
+class SendOutboxTests(TestCase):
+    def send(self):
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch('signal.signal'):  # Keep the test runner's handlers
+            call_command('send_outbox', once=True, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def enqueue(self, *recipients):
+        return [OutboundEmail.enqueue('Hello', 'Body', [recipient]) for recipient in recipients]
+
+    def assertDelay(self, email, seconds, since):
+        self.assertAlmostEqual((email.next_attempt_at - since).total_seconds(), seconds, delta=5)
+
+    def test_only_the_rejected_message_is_charged(self):
+        first, rejected, last = self.enqueue('a@example.com', 'rejected@example.com', 'b@example.com')
+        started = django_timezone.now()
+        self.send()
+
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com'], ['b@example.com']])
+        for email in (first, last):
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.STATUS_SENT, 1))
+            self.assertIsNotNone(email.sent_at)
+        rejected.refresh_from_db()
+        self.assertEqual((rejected.status, rejected.attempts), (OutboundEmail.STATUS_PENDING, 1))
+        self.assertTrue(rejected.last_error.startswith('SMTPRecipientsRefused'))
+        self.assertDelay(rejected, settings.OUTBOX_RETRY_DELAY, started)
+
+    def test_retries_back_off_then_give_up(self):
+        email, = self.enqueue('rejected@example.com')
+        for attempt in range(1, settings.OUTBOX_MAX_ATTEMPTS + 1):
+            OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=django_timezone.now())
+            started = django_timezone.now()
+            self.send()
+            email.refresh_from_db()
+            self.assertEqual(email.attempts, attempt)
+            if attempt < settings.OUTBOX_MAX_ATTEMPTS:
+                self.assertEqual(email.status, OutboundEmail.STATUS_PENDING)
+                self.assertDelay(email, settings.OUTBOX_RETRY_DELAY * 2 ** (attempt - 1), started)
+        self.assertEqual(email.status, OutboundEmail.STATUS_DEAD)
+        self.assertEqual(mail.outbox, [])
+
+    def test_outage_puts_off_the_batch_without_charging_it(self):
+        emails = self.enqueue('a@example.com', 'b@example.com', 'c@example.com')
+        started = django_timezone.now()
+        with mock.patch.object(FlakyEmailBackend, 'down', True):
+            _, err = self.send()
+
+        self.assertIn(f'SMTP server unavailable; retrying in {settings.OUTBOX_RETRY_DELAY}s', err)
+        attempts = []
+        for email in emails:
+            email.refresh_from_db()
+            self.assertEqual(email.status, OutboundEmail.STATUS_PENDING)
+            self.assertDelay(email, settings.OUTBOX_RETRY_DELAY, started)
+            attempts.append(email.attempts)
+        # Only the message that found the server down used up an attempt.
+        self.assertEqual(attempts, [1, 0, 0])
+
+        OutboundEmail.objects.update(next_attempt_at=django_timezone.now())
+        self.send()
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_prunes_old_sent_messages(self):
+        old = django_timezone.now() - timedelta(days=settings.OUTBOX_RETENTION_DAYS + 1)
+        expired, recent, dead = self.enqueue('a@example.com', 'b@example.com', 'c@example.com')
+        OutboundEmail.objects.filter(pk=expired.pk).update(status=OutboundEmail.STATUS_SENT, sent_at=old)
+        OutboundEmail.objects.filter(pk=recent.pk).update(status=OutboundEmail.STATUS_SENT, sent_at=django_timezone.now())
+        OutboundEmail.objects.filter(pk=dead.pk).update(status=OutboundEmail.STATUS_DEAD, next_attempt_at=old)
+
+        out, _ = self.send()
+        self.assertIn('Pruned 1 sent messages', out)
+        self.assertEqual(set(OutboundEmail.objects.values_list('pk', flat=True)), {recent.pk, dead.pk})
+        self.assertEqual(mail.outbox, [])
+
+
+class AppointmentNotificationTests(VarDirTestCase):
+    def test_booking_queues_the_notification(self):
+        day = django_timezone.localdate() + timedelta(days=1)
+        while not slots.slots_for(day):
+            day += timedelta(days=1)
+        booking = {'name': 'Ada', 'email': 'ada@example.com', 'phone': '555', 'service': 'consulting',
+                   'date': day.isoformat(), 'time': slots.slots_for(day)[0].strftime('%H:%M'), 'message': 'Hi'}
+        self.assertEqual(self.client.post(reverse('appointment'), booking).status_code, 302)
+
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.subject, email.body), Appointment.objects.get().notification())
+        self.assertEqual(email.recipients, settings.APPOINTMENT_EMAIL)
+        self.assertIn('Service: consulting', email.body)
+
+
+# Monday noon; the default business hours open 09:00-17:00 on weekdays.
+NOW = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+
+
+@mock.patch('django.utils.timezone.now', return_value=NOW)
+class AppointmentSlotTests(VarDirTestCase):
+    monday = NOW.date()
+    tuesday = monday + timedelta(days=1)
+
+    def book(self, day, time, name='Ada'):
+        return Appointment.objects.create(name=name, email='ada@example.com', phone='555', service='consulting',
+                                          date=day, time=time)
+
+    def form(self, day, time):
+        return AppointmentForm({'name': 'Grace', 'email': 'grace@example.com', 'phone': '555',
+                                'service': 'consulting', 'date': day.isoformat(), 'time': time})
+
+    def test_a_slot_takes_one_booking(self, now):
+        self.book(self.tuesday, datetime.strptime('09:00', '%H:%M').time())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.book(self.tuesday, datetime.strptime('09:00', '%H:%M').time(), name='Grace')
+
+    def test_form_accepts_only_free_slots_ahead(self, now):
+        self.book(self.tuesday, datetime.strptime('10:00', '%H:%M').time())
+        cases = [
+            (self.tuesday, '09:30', None),
+            (self.monday, '12:30', None),
+            (self.monday, '11:30', 'Please choose a time in the future.'),
+            (self.tuesday, '09:10', 'Please choose one of the available time slots.'),
+            (self.tuesday, '17:00', 'Please choose one of the available time slots.'),
+            (self.monday + timedelta(days=5), '10:00', 'Please choose one of the available time slots.'),  # Saturday
+            (self.monday + timedelta(days=settings.APPOINTMENT_BOOKING_DAYS), '10:00', 'days ahead'),
+            (self.tuesday, '10:00', 'This time slot has already been booked.'),
+        ]
+        for day, time, error in cases:
+            with self.subTest(day=day, time=time):
+                form = self.form(day, time)
+                if error is None:
+                    self.assertTrue(form.is_valid(), form.errors)
+                else:
+                    self.assertFalse(form.is_valid())
+                    self.assertIn(error, str(form.errors))
+
+    def test_availability_leaves_out_booked_and_started_slots(self, now):
+        self.book(self.tuesday, datetime.strptime('09:30', '%H:%M').time())
+        free = slots.availability(7)
+
+        self.assertEqual(list(free), [self.monday + timedelta(days=offset) for offset in range(7)])
+        self.assertEqual(free[self.monday][0].strftime('%H:%M'), '12:30')
+        self.assertEqual(len(free[self.tuesday]), len(slots.slots_for(self.tuesday)) - 1)
+        self.assertNotIn(datetime.strptime('09:30', '%H:%M').time(), free[self.tuesday])
+        self.assertEqual(free[self.monday + timedelta(days=5)], [])
+
+    def test_a_booking_refreshes_availability_but_no_content_version(self, now):
+        nine = datetime.strptime('09:00', '%H:%M').time()
+        self.assertIn(nine, slots.availability(2)[self.tuesday])
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = self.book(self.tuesday, nine)
+        self.assertNotIn(nine, slots.availability(2)[self.tuesday])
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertIn(nine, slots.availability(2)[self.tuesday])
+        self.assertEqual(versions.get_versions(), {})
+
+
+@override_settings(EDGE_CACHE_ENABLED=True, PAGE_CACHE_ENABLED=False, CONDITIONAL_GET_ENABLED=False)
+class EdgeCacheHeaderTests(VarDirTestCase):
+    def test_anonymous_pages_are_tagged_and_shareable(self):
+        for url_name in ('home', 'companies', 'contact'):
+            with self.subTest(url_name):
+                response = self.client.get(reverse(url_name))
+                self.assertEqual(response['Cache-Tag'], ','.join(caching.page_labels(url_name)))
+                directives = set(response['Cache-Control'].split(', '))
+                self.assertLessEqual(
+                    {'public', 'max-age=0', 'must-revalidate', f's-maxage={settings.EDGE_CACHE_TTLS[url_name]}'},
+                    directives,
+                )
+                self.assertNotIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+    def test_visitors_with_a_session_or_messages_get_no_edge_headers(self):
+        for cookie in (settings.SESSION_COOKIE_NAME, 'messages'):
+            with self.subTest(cookie):
+                self.client.cookies.clear()
+                self.client.cookies[cookie] = 'x'
+                response = self.client.get(reverse('contact'))
+                self.assertNotIn('Cache-Tag', response)
+                self.assertNotIn('s-maxage', response.get('Cache-Control', ''))
+
+
+class PurgeAPIStub(BaseHTTPRequestHandler):
+    """Records the purge calls it gets and answers like the Cloudflare API."""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.calls.append((self.path, self.headers['Authorization'], body))
+        payload = json.dumps({'success': self.server.success, 'errors': [] if self.server.success else ['nope']})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(payload.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PurgeEdgeCacheTests(VarDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), PurgeAPIStub)
+        self.server.calls, self.server.success = [], True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        overrides = override_settings(
+            EDGE_CACHE_ENABLED=True,
+            EDGE_PURGE_CLIENT='main.edge.CloudflarePurgeClient',
+            EDGE_PURGE_API_BASE=f'http://127.0.0.1:{self.server.server_port}/client/v4/',
+            CLOUDFLARE_ZONE_ID='zone', CLOUDFLARE_API_TOKEN='secret',
+            EDGE_PURGE_STATE_FILE=self.var_dir / 'edge_purged.json',
+            STATIC_EXPORT_DIR=self.var_dir / 'public',
+            EDGE_PURGE_DEBOUNCE=1.0, EDGE_PURGE_MAX_DELAY=30.0, EDGE_PURGE_BATCH_SIZE=2,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def purge(self, command='purge_edge_cache', **options):
+        out = io.StringIO()
+        with mock.patch('signal.signal'):  # Keep the test runner's handlers
+            call_command(command, interval=0.02, stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
+
+    def tags(self):
+        return [body['tags'] for path, auth, body in self.server.calls]
+
+    def test_changed_tags_are_purged_in_batches(self):
+        self.purge(once=True)  # Records what the edge can hold
+        versions.bump('main.company', 'main.stat', 'main.testimonial')
+
+        self.purge(once=True)
+        self.assertEqual(self.tags(), [['main.company', 'main.stat'], ['main.testimonial']])
+        path, auth, _ = self.server.calls[0]
+        self.assertEqual((path, auth), ('/client/v4/zones/zone/purge_cache', 'Bearer secret'))
+
+        self.purge(once=True)
+        self.assertEqual(len(self.server.calls), 2)
+
+    def test_purge_waits_until_edits_are_quiet(self):
+        command = purge_edge_cache.Command()
+        worker = threading.Thread(target=self.purge, args=[command])
+        worker.start()
+        self.addCleanup(worker.join)
+        self.addCleanup(setattr, command, 'stopping', True)
+        while not (self.var_dir / 'edge_purged.json').exists():
+            time.sleep(0.01)
+
+        versions.bump('main.company')
+        time.sleep(0.3)
+        versions.bump('main.testimonial')
+        time.sleep(0.5)
+        self.assertEqual(self.server.calls, [])  # Edited 0.5s ago, debounce is 1s
+
+        deadline = time.monotonic() + 5
+        while not self.server.calls and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.tags(), [['main.company', 'main.testimonial']])
+
+    def test_rejected_purge_is_kept_for_a_retry(self):
+        self.purge(once=True)
+        versions.bump('main.company')
+        self.server.success = False
+        with self.assertRaisesMessage(CommandError, 'Purge of main.company failed'):
+            self.purge(once=True)
+
+        self.server.success = True
+        self.purge(once=True)
+        self.assertEqual(self.tags(), [['main.company'], ['main.company']])
+
+
+@override_settings(EMAIL_BACKEND='main.tests.FlakyEmailBackend', NEWSLETTER_SEND_RATE=0,
+                   NEWSLETTER_MAX_CONNECTION_ERRORS=3, NEWSLETTER_RETRY_DELAY=0, SITE_URL='https://thinkce.example')
+class SendCampaignTests(VarDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.campaign = NewsletterCampaign.objects.create(subject='News', body='Hello')
+        self.subscribers = [
+            NewsletterSubscriber.objects.create(email=email)
+            for email in ('a@example.com', 'rejected@example.com', 'b@example.com', 'c@example.com')
+        ]
+
+    def send(self, *args):
+        out = io.StringIO()
+        try:
+            call_command('send_campaign', self.campaign.pk, *args, batch_size=2, stdout=out, stderr=io.StringIO())
+        finally:
+            self.campaign.refresh_from_db()
+        return out.getvalue()
+
+    def recipients(self):
+        return [address for message in mail.outbox for address in message.to]
+
+    def test_sends_to_every_subscriber_once(self):
+        self.send()
+        self.assertEqual(self.recipients(), ['a@example.com', 'b@example.com', 'c@example.com'])
+        self.assertEqual(self.campaign.status, NewsletterCampaign.STATUS_COMPLETED)
+        self.assertEqual((self.campaign.sent_count, self.campaign.failed_count), (3, 1))
+        with self.assertRaisesMessage(CommandError, 'has already been sent'):
+            self.send()
+
+    def test_a_campaign_being_sent_is_not_claimed_twice(self):
+        NewsletterCampaign.objects.filter(pk=self.campaign.pk).update(status=NewsletterCampaign.STATUS_SENDING)
+        with self.assertRaisesMessage(CommandError, 'is being sent by another run'):
+            self.send()
+        self.assertEqual(mail.outbox, [])
+
+        self.send('--force')
+        self.assertEqual(self.campaign.status, NewsletterCampaign.STATUS_COMPLETED)
+
+    def test_pauses_on_an_outage_and_resumes_from_the_checkpoint(self):
+        with mock.patch.object(FlakyEmailBackend, 'unreachable', {'b@example.com'}):
+            with self.assertRaisesMessage(CommandError, 'rerun to resume with b@example.com'):
+                self.send()
+        self.assertEqual(self.campaign.status, NewsletterCampaign.STATUS_PAUSED)
+        self.assertEqual(self.campaign.last_subscriber_id, self.subscribers[1].pk)
+        self.assertEqual((self.campaign.sent_count, self.campaign.failed_count), (1, 1))
+
+        self.assertIn(f'Resuming "News" after subscriber #{self.subscribers[1].pk}', self.send())
+        self.assertEqual(self.recipients(), ['a@example.com', 'b@example.com', 'c@example.com'])
+        self.assertEqual(self.campaign.status, NewsletterCampaign.STATUS_COMPLETED)
+        self.assertEqual((self.campaign.sent_count, self.campaign.failed_count), (3, 1))
+
+    def test_messages_carry_a_one_click_unsubscribe_link(self):
+        self.send()
+        message = mail.outbox[0]
+        url = message.extra_headers['List-Unsubscribe'].strip('<>')
+        self.assertEqual(message.extra_headers['List-Unsubscribe-Post'], 'List-Unsubscribe=One-Click')
+        self.assertIn(url, message.body)
+        self.assertTrue(url.startswith('https://thinkce.example/unsubscribe/'))
+
+        # Mail clients POST to the link without a CSRF token.
+        client = Client(enforce_csrf_checks=True)
+        self.assertEqual(client.post(urlsplit(url).path).status_code, 200)
+        self.assertFalse(NewsletterSubscriber.objects.filter(email='a@example.com').exists())
+
+
+class UnsubscribeTests(VarDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.subscriber = NewsletterSubscriber.objects.create(email='reader@example.com')
+        self.token = NewsletterSubscriber.unsubscribe_token(self.subscriber.pk)
+
+    def url(self, token):
+        return reverse('unsubscribe', args=[token])
+
+    def test_get_only_asks_for_confirmation(self):
+        response = self.client.get(self.url(self.token))
+        self.assertContains(response, 'Stop sending the ThinkCE newsletter to reader@example.com?')
+        self.assertTrue(NewsletterSubscriber.objects.exists())
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_post_unsubscribes(self):
+        response = self.client.post(self.url(self.token))
+        self.assertContains(response, 'You have been unsubscribed')
+        self.assertFalse(NewsletterSubscriber.objects.exists())
+        # The link keeps working afterwards, with nothing left to remove.
+        self.assertContains(self.client.get(self.url(self.token)), 'This address is not subscribed')
+
+    def test_bad_tokens_unsubscribe_no_one(self):
+        other = NewsletterSubscriber.objects.create(email='other@example.com')
+        forged = signing.dumps(other.pk, salt='another.salt')
+        for token in (self.token[:-1] + ('A' if self.token[-1] != 'A' else 'B'), forged, 'garbage'):
+            with self.subTest(token):
+                self.assertContains(self.client.get(self.url(token)), 'This address is not subscribed')
+                self.client.post(self.url(token))
+                self.assertEqual(NewsletterSubscriber.objects.count(), 2)
+
+
+@override_settings(IMAGE_DERIVATIVE_WIDTHS=[100, 200])
+class ImageDerivativeTests(VarDirTestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(MEDIA_ROOT=self.var_dir / 'media')
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        images._manifests.clear()
+        self.addCleanup(images._manifests.clear)
+
+    def upload(self, name):
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 150), 'teal').save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def build(self):
+        command = build_image_derivatives.Command(stdout=io.StringIO(), stderr=io.StringIO())
+        command.version = None
+        command.build_new()
+
+    def derivatives(self):
+        return sorted(str(path.relative_to(self.var_dir / 'media' / images.DERIVATIVE_DIR))
+                      for path in (self.var_dir / 'media' / images.DERIVATIVE_DIR).rglob('*') if path.is_file())
+
+    def test_saving_leaves_the_build_to_the_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            member = TeamMember.objects.create(name='Grace', role='Engineer', image=self.upload('grace.png'))
+        self.assertIsNone(images.get_manifest(member.image.name))
+        self.assertFalse(member.responsive_image.sources)  # The original is served meanwhile
+
+        before = versions.get_version('main.teammember')
+        self.build()
+        self.assertEqual(images.get_manifest(member.image.name)['widths'], [100, 200])
+        self.assertNotEqual(versions.get_version('main.teammember'), before)  # Pages re-render with srcset
+
+    def test_replaced_and_deleted_images_lose_their_derivatives(self):
+        member = TeamMember.objects.create(name='Grace', role='Engineer', image=self.upload('grace.png'))
+        self.build()
+        old = self.derivatives()
+        self.assertIn('team/grace.json', old)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            member.image = self.upload('grace2.png')
+            member.save()
+        self.build()
+        self.assertEqual(self.derivatives(), [name.replace('grace', 'grace2') for name in old])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            member.delete()
+        self.assertEqual(self.derivatives(), [])
+
+    def test_derivatives_still_in_use_are_kept(self):
+        member = TeamMember.objects.create(name='Grace', role='Engineer', image=self.upload('grace.png'))
+        TeamMember.objects.create(name='Ada', role='Engineer', image=member.image.name)
+        self.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            member.delete()
+        self.assertIn('team/grace.json', self.derivatives())
+
+
+@override_settings(CONDITIONAL_GET_ENABLED=True, PAGE_CACHE_ENABLED=False, ALLOWED_HOSTS=['testserver', 'other.example'])
+class ConditionalPageTests(VarDirTestCase):
+    def test_unchanged_pages_get_304(self):
+        response = self.client.get('/')
+        self.assertIn('max-age=0', response['Cache-Control'])
+        self.assertIn('must-revalidate', response['Cache-Control'])
+        self.assertEqual(self.client.get('/', headers={'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertEqual(self.client.get('/', headers={'If-Modified-Since': response['Last-Modified']}).status_code, 304)
+
+    def test_a_content_change_invalidates_the_validators(self):
+        response = self.client.get('/')
+        with mock.patch('time.time', return_value=time.time() + 60):
+            versions.bump('main.testimonial')
+
+        changed = self.client.get('/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual(self.client.get('/', headers={'If-Modified-Since': response['Last-Modified']}).status_code, 200)
+        # Pages that don't render the model keep their tag.
+        services = self.client.get(reverse('services'))
+        versions.bump('main.company')
+        self.assertEqual(self.client.get(reverse('services'))['ETag'], services['ETag'])
+
+    def test_no_validators_with_a_session_or_messages(self):
+        etag = self.client.get('/')['ETag']
+        for cookie in (settings.SESSION_COOKIE_NAME, 'messages'):
+            with self.subTest(cookie):
+                self.client.cookies.clear()
+                self.client.cookies[cookie] = 'x'
+                response = self.client.get('/', headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('ETag', response)
+                self.assertNotIn('Last-Modified', response)
+
+    def test_sitemap_tag_depends_on_the_host(self):
+        response = self.client.get('/sitemap.xml')
+        other = self.client.get('/sitemap.xml', headers={'Host': 'other.example'})
+        self.assertNotEqual(response['ETag'], other['ETag'])
+        self.assertIn(b'http://other.example/', other.content)
+        self.assertEqual(
+            self.client.get('/sitemap.xml', headers={'Host': 'other.example', 'If-None-Match': response['ETag']}).status_code,
+            200,
+        )
+        self.assertEqual(self.client.get('/sitemap.xml', headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+
+class RenderCounter:
+    def __init__(self):
+        self.renders = 0
+
+    def __str__(self):
+        self.renders += 1
+        return str(self.renders)
+
+
+@override_settings(FRAGMENT_CACHE_ENABLED=True)
+class CachedFragmentTests(VarDirTestCase):
+    template = Template(
+        "{% load main_tags %}"
+        "{% cachefragment 'companies' 'main.company' %}{{ companies }}{% csrf_token %}{% endcachefragment %}|"
+        "{% cachefragment 'stats' 'main.stat' %}{{ stats }}{% endcachefragment %}"
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.companies, self.stats = RenderCounter(), RenderCounter()
+
+    def render(self, csrf_token='token'):
+        return self.template.render(Context({'companies': self.companies, 'stats': self.stats, 'csrf_token': csrf_token}))
+
+    def test_a_fragment_is_reused_until_its_model_changes(self):
+        first = self.render()
+        self.assertEqual(self.render(), first)
+        self.assertEqual((self.companies.renders, self.stats.renders), (1, 1))
+
+        versions.bump('main.company')
+        self.render()
+        self.assertEqual((self.companies.renders, self.stats.renders), (2, 1))
+
+    def test_csrf_tokens_are_filled_per_request(self):
+        self.assertIn('value="first"', self.render('first'))
+        second = self.render('second')
+        self.assertIn('value="second"', second)
+        self.assertNotIn('first', second)
+        self.assertEqual(self.companies.renders, 1)
+
+
+@override_settings(CONTENT_VERSIONS_BACKEND='database', CONTENT_VERSIONS_MAX_DELAY=0.2)
+class DatabaseVersionsTests(VarDirTestCase):
+    """
+    The backend against a database file of its own, which threads reach
+    through connections of their own, as gunicorn workers would.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.connections = ConnectionHandler({
+            'default': {**settings.DATABASES['default'], 'NAME': str(self.var_dir / 'db.sqlite3')},
+        })
+        patcher = mock.patch('main.versions.connections', self.connections)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with self.connections['default'].schema_editor() as editor:
+            editor.create_model(ContentVersion)
+        self.addCleanup(self.connections.close_all)
+        self.addCleanup(self.close_reader)
+
+    def close_reader(self):
+        state = versions._local.__dict__.pop('state', None)
+        if state is not None:
+            state['conn'].close()
+
+    def in_threads(self, *functions):
+        errors = []
+
+        def run(function):
+            try:
+                function()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                self.connections.close_all()
+                self.close_reader()
+
+        threads = [threading.Thread(target=run, args=[function]) for function in functions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_first_bumps_from_two_connections_both_count(self):
+        labels = [f'main.model{i}' for i in range(20)]
+        barrier = threading.Barrier(2)
+
+        def bump_all():
+            for label in labels:
+                barrier.wait()
+                versions.bump(label)
+
+        self.in_threads(bump_all, bump_all)
+        self.assertEqual({entry['version'] for entry in versions.get_versions().values()}, {2})
+        self.assertEqual(len(versions.get_versions()), len(labels))
+
+    def test_other_connections_see_a_bump_within_the_max_delay(self):
+        read, bumped, seen = threading.Event(), threading.Event(), []
+
+        def watch():
+            self.assertEqual(versions.get_version('main.company'), '0')
+            read.set()
+            bumped.wait()
+            started = time.monotonic()
+            while versions.get_version('main.company') != '1' and time.monotonic() - started < 5:
+                time.sleep(0.01)
+            seen.append(time.monotonic() - started)
+
+        def bump():
+            read.wait()
+            versions.bump('main.company')
+            bumped.set()
+
+        self.in_threads(watch, bump)
+        self.assertLessEqual(seen[0], settings.CONTENT_VERSIONS_MAX_DELAY + 0.1)
+
+
+class ImportSubscribersTests(VarDirTestCase):
+    rows = [
+        'email', ' Ada@Example.COM ', 'ada@example.com', 'grace@example.com', 'GRACE@EXAMPLE.COM',
+        'not-an-address', '   ', 'x' * 250 + '@example.com', 'reader@example.com',
+    ]
+
+    def import_file(self, name='subscribers.csv', rows=None):
+        path = self.var_dir / name
+        path.write_text('\n'.join(rows or self.rows) + '\n')
+        out = io.StringIO()
+        call_command('import_subscribers', str(path), chunk_size=2, stdout=out)
+        return out.getvalue()
+
+    def test_addresses_are_deduplicated_the_way_the_signup_form_stores_them(self):
+        form = NewsletterForm({'email': ' Reader@Example.com '})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        out = self.import_file()
+        self.assertIn('8 processed: 2 inserted, 3 duplicate, 3 invalid', out)
+        self.assertEqual(
+            sorted(NewsletterSubscriber.objects.values_list('email', flat=True)),
+            ['ada@example.com', 'grace@example.com', 'reader@example.com'],
+        )
+        self.assertFalse(NewsletterForm({'email': 'ADA@example.com'}).is_valid())
+
+    def test_reimporting_changes_nothing(self):
+        self.import_file()
+        emails = list(NewsletterSubscriber.objects.order_by('pk').values_list('pk', 'email'))
+        self.assertIn('8 processed: 0 inserted, 5 duplicate, 3 invalid', self.import_file())
+        self.assertEqual(list(NewsletterSubscriber.objects.order_by('pk').values_list('pk', 'email')), emails)
+
+    def test_jsonl_rows_that_do_not_parse_are_invalid(self):
+        out = self.import_file('subscribers.jsonl', ['{"email": "Ada@Example.com"}', '{"email": 5', '[1, 2]', '{}'])
+        self.assertIn('4 processed: 1 inserted, 0 duplicate, 3 invalid', out)
+        self.assertEqual(NewsletterSubscriber.objects.get().email, 'ada@example.com')
+
+
+@override_settings(PAGE_CACHE_ENABLED=False, CONDITIONAL_GET_ENABLED=False, FRAGMENT_CACHE_ENABLED=False)
+class SiteChromeTests(VarDirTestCase):
+    def setUp(self):
+        super().setUp()
+        context_processors._chrome.update(version=None, data=None)
+
+    def edit(self, model, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return model.objects.create(**fields)
+
+    def test_chrome_is_queried_once_per_content_version(self):
+        with self.assertNumQueries(4):
+            context_processors.get_site_chrome()
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                context_processors.get_site_chrome()
+
+        self.edit(SiteConfiguration, site_name='Think Again')
+        with self.assertNumQueries(4):
+            self.assertEqual(context_processors.get_site_chrome()['site_config'].site_name, 'Think Again')
+
+    def test_pages_show_admin_edits_straight_away(self):
+        self.assertContains(self.client.get(reverse('about')), '<title>About Us - ThinkCE LLC</title>')
+        self.edit(SEOPageSettings, page='about', title='Meet the team', meta_description='Who we are')
+        response = self.client.get(reverse('about'))
+        self.assertContains(response, '<title>Meet the team</title>')
+        self.assertContains(response, 'content="Who we are"')
+
+
+class SubscriberExportTests(VarDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        NewsletterSubscriber.objects.bulk_create(
+            NewsletterSubscriber(email=f'reader{i:04}@example.com') for i in range(2500)
+        )
+        self.emails = list(NewsletterSubscriber.objects.order_by('pk').values_list('email', flat=True))
+
+    def export(self, fmt):
+        response = self.client.get(reverse(f'admin:main_newslettersubscriber_export_{fmt}'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return [chunk.decode() for chunk in response.streaming_content]
+
+    def test_csv_is_streamed_in_batches(self):
+        chunks = self.export('csv')
+        self.assertEqual(len(chunks), 3)  # The header and 2500 rows, 1000 lines a chunk
+        rows = list(csv.reader(io.StringIO(''.join(chunks))))
+        self.assertEqual(rows[0], ['email', 'created_at'])
+        self.assertEqual([row[0] for row in rows[1:]], self.emails)
+
+    def test_jsonl_has_one_object_per_subscriber(self):
+        lines = ''.join(self.export('jsonl')).splitlines()
+        self.assertEqual([json.loads(line)['email'] for line in lines], self.emails)
+
+    def test_exports_need_admin_access(self):
+        self.client.logout()
+        response = self.client.get(reverse('admin:main_newslettersubscriber_export_csv'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_an_export_imports_back_into_an_empty_list(self):
+        path = self.var_dir / 'subscribers.csv'
+        path.write_text(''.join(self.export('csv')))
+        NewsletterSubscriber.objects.all().delete()
+
+        out = io.StringIO()
+        call_command('import_subscribers', str(path), stdout=out)
+        self.assertIn('2500 processed: 2500 inserted, 0 duplicate, 0 invalid', out.getvalue())
+        self.assertEqual(sorted(NewsletterSubscriber.objects.values_list('email', flat=True)), self.emails)
@@ -0,0 +1,150 @@
+"""
+Token-bucket throttling for the public form endpoints.
+
+Each POST to a throttled view takes a token from a bucket per client IP and
+one per submitted email address; the buckets refill continuously at
+``burst / period`` tokens per second as configured in ``THROTTLE_LIMITS``.
+When any bucket is empty the request is answered with a 429 before the form
+is even looked at. Buckets live in a small SQLite file under ``VAR_DIR``
+(separate from the site database, so throttling never competes for its
+write lock) and are shared by every worker on the host.
+"""
+import hashlib
+import ipaddress
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+
+PRUNE_INTERVAL = 60  # seconds between sweeps of buckets that have refilled
+
+_local = threading.local()
+
+
+def _connection():
+    path = str(settings.THROTTLE_DB)
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.key == (os.getpid(), path):
+        return conn
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Losing a few buckets in a crash is harmless, so skip fsyncs.
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS bucket ('
+        ' key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS bucket_full_at ON bucket (full_at)')
+    _local.conn, _local.key, _local.pruned = conn, (os.getpid(), path), 0.0
+    return conn
+
+
+def take(buckets):
+    """
+    Take one token from each ``(key, burst, period)`` bucket.
+
+    Either every bucket pays or none does. Returns 0 when the request may
+    proceed, otherwise the number of seconds until it would be allowed.
+    """
+    conn = _connection()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        updates, wait = [], 0.0
+        for key, burst, period in buckets:
+            rate = burst / period
+            row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+            updates.append((key, tokens - 1, now, now + (burst - tokens + 1) / rate))
+        if not wait:
+            conn.executemany('INSERT OR REPLACE INTO bucket VALUES (?, ?, ?, ?)', updates)
+        if now - _local.pruned > PRUNE_INTERVAL:
+            # A full bucket is the same as no bucket.
+            conn.execute('DELETE FROM bucket WHERE full_at < ?', (now,))
+            _local.pruned = now
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return wait
+
+
+_trusted = {'setting': None, 'networks': ()}
+
+
+def _is_trusted_proxy(address):
+    if _trusted['setting'] is not settings.THROTTLE_TRUSTED_PROXIES:
+        _trusted['networks'] = tuple(ipaddress.ip_network(net) for net in settings.THROTTLE_TRUSTED_PROXIES)
+        _trusted['setting'] = settings.THROTTLE_TRUSTED_PROXIES
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _trusted['networks'])
+
+
+def client_ip(request):
+    # Behind Cloudflare every request arrives from nginx (or Cloudflare
+    # itself); the visitor's address is in CF-Connecting-IP. Anyone reaching
+    # gunicorn directly could set that header, so it only counts when the
+    # connection comes from a trusted proxy.
+    remote = request.META.get('REMOTE_ADDR', '')
+    forwarded = request.META.get('HTTP_CF_CONNECTING_IP')
+    if settings.THROTTLE_TRUST_CF_HEADER and forwarded and _is_trusted_proxy(remote):
+        return forwarded.strip()
+    return remote
+
+
+def request_buckets(scope, request):
+    limits = settings.THROTTLE_LIMITS[scope]
+    buckets = []
+    if 'ip' in limits:
+        buckets.append((f'{scope}:ip:{client_ip(request)}', *limits['ip']))
+    email = request.POST.get('email', '').strip().lower()
+    if 'email' in limits and email:
+        digest = hashlib.sha256(email.encode()).hexdigest()[:32]
+        buckets.append((f'{scope}:email:{digest}', *limits['email']))
+    return buckets
+
+
+def _throttled(wait):
+    minutes = max(1, math.ceil(wait / 60))
+    response = HttpResponse(
+        f'Too many requests. Please try again in {minutes} minute{"s" if minutes > 1 else ""}.',
+        status=429, content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def throttle(scope):
+    """Rate-limit POSTs to the decorated view with ``THROTTLE_LIMITS[scope]``."""
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _wrapped(request, *args, **kwargs):
+                if settings.THROTTLE_ENABLED and request.method == 'POST':
+                    wait = await sync_to_async(take)(request_buckets(scope, request))
+                    if wait:
+                        return _throttled(wait)
+                return await view_func(request, *args, **kwargs)
+            return _wrapped
+
+        @wraps(view_func)
+        def _wrapped(request, *args, **kwargs):
+            if settings.THROTTLE_ENABLED and request.method == 'POST':
+                wait = take(request_buckets(scope, request))
+                if wait:
+                    return _throttled(wait)
+            return view_func(request, *args, **kwargs)
+        return _wrapped
+    return decorator
@@ -1,12 +1,23 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Async views only pay off on ASGI workers (see main.async_views).
+if settings.ASYNC_VIEWS:
+    from . import async_views as public_views
+else:
+    public_views = views
+
 urlpatterns = [
-    path('', views.home, name='home'),
-    path('about/', views.about, name='about'),
-    path('services/', views.services, name='services'),
-    path('companies/', views.companies, name='companies'),
-    path('appointment/', views.appointment, name='appointment'),
-    path('contact/', views.contact, name='contact'),
-    path('subscribe/', views.subscribe, name='subscribe'),
+    path('', public_views.home, name='home'),
+    path('about/', public_views.about, name='about'),
+    path('services/', public_views.services, name='services'),
+    path('companies/', public_views.companies, name='companies'),
+    path('appointment/', public_views.appointment, name='appointment'),
+    path('appointment/availability/', public_views.appointment_availability, name='appointment_availability'),
+    path('contact/', public_views.contact, name='contact'),
+    path('subscribe/', public_views.subscribe, name='subscribe'),
+    path('unsubscribe/<str:token>/', views.unsubscribe, name='unsubscribe'),
+    path('csrf/', views.csrf_token, name='csrf_token'),
+    path('metrics', views.prometheus_metrics, name='prometheus_metrics'),
 ]
@@ -0,0 +1,164 @@
+"""
+Content version counters shared by every worker.
+
+Each model that feeds a cached part of the site has a generation counter,
+bumped whenever a row is saved or deleted (see main.signals). Every cache
+key derived from a counter changes with it, so cached pages, fragments and
+the like can live for a long time and still reflect admin edits as soon as
+a worker sees the new counter. Where the counters live is set by
+``CONTENT_VERSIONS_BACKEND``:
+
+``file``
+    One small JSON file under ``VAR_DIR``, replaced atomically on every
+    bump. Readers only need an ``os.stat()`` per request to find out whether
+    anything changed. Shared by the workers of one host.
+
+``database``
+    The ``ContentVersion`` table in the site database, for workers that
+    don't share a ``VAR_DIR``. Readers keep their own SQLite connection and
+    re-read the table only when ``PRAGMA data_version`` says another
+    connection has committed since the last look, and look at most once
+    per ``CONTENT_VERSIONS_MAX_DELAY`` seconds.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows dev machines
+    fcntl = None
+
+_state = {'stamp': None, 'versions': {}}
+_local = threading.local()
+
+
+def _path():
+    return str(settings.CONTENT_VERSIONS_FILE)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+@contextmanager
+def _locked(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.lock', 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _file_versions():
+    path = _path()
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {}
+    stamp = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+    if stamp != _state['stamp']:
+        _state['versions'] = _read(path)
+        _state['stamp'] = stamp
+    return _state['versions']
+
+
+def _file_bump(labels, now):
+    path = _path()
+    with _locked(path):
+        versions = _read(path)
+        for label in labels:
+            entry = versions.setdefault(label, {'version': 0})
+            entry['version'] += 1
+            entry['updated'] = now
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(versions, f)
+        os.replace(tmp, path)
+
+
+def _database_versions():
+    # A connection of our own: data_version only moves for commits made by
+    # other connections, and Django's may be closed between requests. Being
+    # plain sqlite3 it also works from async views.
+    path = str(connections[DEFAULT_DB_ALIAS].settings_dict['NAME'])
+    state = getattr(_local, 'state', None)
+    if state is None or state['key'] != (os.getpid(), path):
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, uri=True)  # as Django connects
+        state = _local.state = {'key': (os.getpid(), path), 'conn': conn, 'checked': 0.0,
+                                'data_version': None, 'versions': {}}
+    now = time.monotonic()
+    if now - state['checked'] < settings.CONTENT_VERSIONS_MAX_DELAY:
+        return state['versions']
+    state['checked'] = now
+    data_version = state['conn'].execute('PRAGMA data_version').fetchone()[0]
+    if data_version != state['data_version']:
+        from .models import ContentVersion
+        try:
+            rows = state['conn'].execute(
+                f'SELECT label, version, updated FROM {ContentVersion._meta.db_table}'
+            ).fetchall()
+        except sqlite3.OperationalError:  # Not migrated yet
+            rows = []
+        state['versions'] = {label: {'version': version, 'updated': updated} for label, version, updated in rows}
+        state['data_version'] = data_version
+    return state['versions']
+
+
+def _database_bump(labels, now):
+    from .models import ContentVersion
+    # One upsert per label: an UPDATE-then-INSERT lets two first bumps of a
+    # label race into an IntegrityError on its unique constraint.
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {ContentVersion._meta.db_table} (label, version, updated) VALUES (%s, 1, %s) '
+            f'ON CONFLICT (label) DO UPDATE SET version = version + 1, updated = excluded.updated',
+            [(label, now) for label in labels],
+        )
+    # Let this thread see its own bump straight away.
+    state = getattr(_local, 'state', None)
+    if state is not None:
+        state['checked'] = 0.0
+
+
+BACKENDS = {
+    'file': (_file_versions, _file_bump),
+    'database': (_database_versions, _database_bump),
+}
+
+
+def get_versions():
+    """Return ``{label: {'version': int, 'updated': float}}`` for all models."""
+    return BACKENDS[settings.CONTENT_VERSIONS_BACKEND][0]()
+
+
+def get_version(*labels):
+    """Return a cache-key friendly token combining the given model counters."""
+    versions = get_versions()
+    return '.'.join(str(versions.get(label, {}).get('version', 0)) for label in labels)
+
+
+def last_updated(*labels):
+    """Return the latest bump time (epoch seconds) of the given models, or None."""
+    versions = get_versions()
+    times = [versions[label]['updated'] for label in labels if label in versions]
+    return max(times, default=None)
+
+
+def bump(*labels):
+    """Increment the counters of the given model labels in every worker."""
+    BACKENDS[settings.CONTENT_VERSIONS_BACKEND][1](labels, time.time())
@@ -1,91 +1,223 @@
+import hmac
+from datetime import datetime, timezone
+
 from django.shortcuts import render, redirect
-from django.contrib import messages
-from django.core.mail import send_mail
+from django.contrib import admin, messages
 from django.conf import settings
+from django.contrib.sitemaps.views import sitemap
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from . import journal, metrics, slots, versions
+from .caching import cache_public_page, conditional_page
+from .edge import edge_cache
+from .sitemaps import StaticViewSitemap
+from .throttling import throttle
 from .forms import ContactForm, AppointmentForm, NewsletterForm
-from .models import Company, Testimonial, TeamMember, Stat, HeroCarouselItem
+from .models import Company, Testimonial, TeamMember, Stat, HeroCarouselItem, OutboundEmail, NewsletterSubscriber
+
+# The public views are sync, for WSGI workers. main.async_views has async
+# versions built on the same helpers, routed when ASYNC_VIEWS is on (ASGI).
+
+def home_context():
+    limit = settings.PUBLIC_LIST_LIMIT
+    return {
+        'testimonials': Testimonial.objects.order_by('-pk')[:limit],  # the newest
+        'team_members': TeamMember.objects.all()[:limit],
+        'carousel_items': HeroCarouselItem.objects.filter(is_active=True),
+    }
+
+def about_context():
+    return {'team_members': TeamMember.objects.all()[:settings.PUBLIC_LIST_LIMIT]}
+
+def companies_context():
+    return {'companies': Company.objects.all()}
 
+@edge_cache('home')
+@conditional_page
+@cache_public_page
 def home(request):
-    testimonials = Testimonial.objects.all()
-    team_members = TeamMember.objects.all()
-    carousel_items = HeroCarouselItem.objects.filter(is_active=True)
-    return render(request, 'main/home.html', {
-        'testimonials': testimonials, 
-        'team_members': team_members,
-        'carousel_items': carousel_items
-    })
+    return render(request, 'main/home.html', home_context())
 
+@edge_cache('companies')
+@conditional_page
+@cache_public_page
 def companies(request):
-    companies_list = Company.objects.all()
-    return render(request, 'main/companies.html', {'companies': companies_list})
+    return render(request, 'main/companies.html', companies_context())
 
+@edge_cache('services')
+@conditional_page
+@cache_public_page
 def services(request):
     return render(request, 'main/services.html')
 
+@edge_cache('about')
+@conditional_page
+@cache_public_page
 def about(request):
-    team_members = TeamMember.objects.all()
-    return render(request, 'main/about.html', {'team_members': team_members})
+    return render(request, 'main/about.html', about_context())
+
+# Notifications are only queued here; send_outbox delivers them.
+
+def submit_contact(form):
+    if not form.is_valid():
+        return False
+    if settings.WRITE_BUFFER_ENABLED:
+        journal.append('contact', form.cleaned_data)
+        return True
+    with transaction.atomic():
+        submission = form.save()
+
+        # Queue Email Notification to contact@thinkce.org (sent by send_outbox)
+        OutboundEmail.enqueue(*submission.notification(), [settings.CONTACT_EMAIL])
+    return True
 
+@edge_cache('contact')
+@throttle('contact')
 def contact(request):
     if request.method == 'POST':
         form = ContactForm(request.POST)
-        if form.is_valid():
-            submission = form.save()
-            
-            # Send Email Notification to contact@thinkce.org
-            subject = f"New Contact Submission: {submission.subject}"
-            message = f"From: {submission.name}\nEmail: {submission.email}\n\nMessage:\n{submission.message}"
-            try:
-                send_mail(
-                    subject, 
-                    message, 
-                    settings.DEFAULT_FROM_EMAIL, 
-                    [settings.CONTACT_EMAIL]
-                )
-                messages.success(request, 'Thank you! Your message has been sent successfully.')
-            except Exception as e:
-                print(f"Contact Email Error: {e}") 
-                messages.error(request, 'Message saved, but email notification failed.')
-            
+        if submit_contact(form):
+            messages.success(request, 'Thank you! Your message has been sent successfully.')
             return redirect('contact')
     else:
         form = ContactForm()
 
     return render(request, 'main/contact.html', {'form': form})
 
+def submit_appointment(form):
+    if not form.is_valid():
+        return False
+    try:
+        with transaction.atomic():
+            appt = form.save()
+
+            # Queue Email Notification to appointment@thinkce.org (sent by send_outbox)
+            OutboundEmail.enqueue(*appt.notification(), [settings.APPOINTMENT_EMAIL])
+    except IntegrityError:
+        # Another client took the slot between validation and save
+        form.add_error('time', 'This time slot has already been booked.')
+        return False
+    return True
+
+@edge_cache('appointment')
+@throttle('appointment')
 def appointment(request):
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
-        if form.is_valid():
-            appt = form.save()
-            
-            # Send Email Notification to appointment@thinkce.org
-            subject = f"New Appointment Request: {appt.name}"
-            message = f"Client: {appt.name}\nEmail: {appt.email}\nPhone: {appt.phone}\nService: {appt.service}\nDate: {appt.date}\nTime: {appt.time}\n\nNotes:\n{appt.message}"
-            try:
-                send_mail(
-                    subject, 
-                    message, 
-                    settings.DEFAULT_FROM_EMAIL, 
-                    [settings.APPOINTMENT_EMAIL]
-                )
-                messages.success(request, 'Appointment request received! We will confirm shortly.')
-            except Exception as e:
-                print(f"Appointment Email Error: {e}") 
-                messages.warning(request, 'Appointment saved, but email notification failed.')
-            
+        if submit_appointment(form):
+            messages.success(request, 'Appointment request received! We will confirm shortly.')
             return redirect('appointment')
     else:
         form = AppointmentForm()
     
     return render(request, 'main/appointment.html', {'form': form})
 
+def availability_days(request):
+    try:
+        days = int(request.GET.get('days', 14))
+    except ValueError:
+        days = 14
+    return max(1, min(days, settings.APPOINTMENT_BOOKING_DAYS))
+
+def availability_json(free):
+    return JsonResponse({
+        'slot_minutes': settings.APPOINTMENT_SLOT_MINUTES,
+        'days': {day.isoformat(): [time.strftime('%H:%M') for time in times] for day, times in free.items()},
+    })
+
+def appointment_availability(request):
+    """Free appointment slots for the next ``days`` days (JSON)."""
+    return availability_json(slots.availability(availability_days(request)))
+
+def save_subscriber(form):
+    if not form.is_valid():
+        return False
+    if settings.WRITE_BUFFER_ENABLED:
+        journal.append('subscribe', form.cleaned_data)
+        return True
+    try:
+        with transaction.atomic():
+            form.save()
+    except IntegrityError:
+        return False  # A concurrent request registered the same address
+    return True
+
+def subscribe_message(request, ok):
+    if ok:
+        messages.success(request, 'Successfully subscribed to our newsletter!')
+    else:
+        messages.error(request, 'Subscription failed. Email might already be registered.')
+
+@throttle('subscribe')
 def subscribe(request):
     if request.method == 'POST':
-        form = NewsletterForm(request.POST)
-        if form.is_valid():
-            form.save()
-            messages.success(request, 'Successfully subscribed to our newsletter!')
-        else:
-            messages.error(request, 'Subscription failed. Email might already be registered.')
+        subscribe_message(request, save_subscriber(NewsletterForm(request.POST)))
     return redirect(request.META.get('HTTP_REFERER', 'home'))
+
+# The token in the link is the authentication, and mail clients doing a
+# one-click unsubscribe (RFC 8058) POST without a CSRF token. A GET only asks
+# for confirmation, so link scanners don't unsubscribe anyone.
+@never_cache
+@csrf_exempt
+def unsubscribe(request, token):
+    subscriber = NewsletterSubscriber.from_unsubscribe_token(token)
+    done = request.method == 'POST'
+    if done and subscriber is not None:
+        subscriber.delete()
+    return render(request, 'main/unsubscribe.html', {'subscriber': subscriber, 'done': done})
+
+SITEMAP_LABELS = StaticViewSitemap().labels()
+
+
+def _sitemap_etag(request):
+    # The URLs in it are absolute, so each host gets its own copy.
+    return f'sitemap-{versions.get_version(*SITEMAP_LABELS)}-{request.scheme}-{request.get_host()}'
+
+
+def _sitemap_last_modified(request):
+    updated = versions.last_updated(*SITEMAP_LABELS)
+    return datetime.fromtimestamp(updated, tz=timezone.utc) if updated is not None else None
+
+
+@edge_cache('sitemap', *SITEMAP_LABELS)
+@condition(etag_func=_sitemap_etag, last_modified_func=_sitemap_last_modified)
+def sitemap_xml(request):
+    """sitemap.xml, rendered once per content version; crawlers revalidate with a 304."""
+    key = f'sitemap:{_sitemap_etag(request)}'
+    content = cache.get(key) if settings.PAGE_CACHE_ENABLED else None
+    if content is None:
+        response = sitemap(request, {'static': StaticViewSitemap}, template_name='main/sitemap.xml')
+        content = response.render().content
+        if settings.PAGE_CACHE_ENABLED:
+            cache.set(key, content, settings.PAGE_CACHE_TIMEOUT)
+    return HttpResponse(content, content_type='application/xml')
+
+
+@never_cache
+def csrf_token(request):
+    """Hand out a CSRF token to forms on pre-rendered/edge-cached pages."""
+    return JsonResponse({'token': get_token(request)})
+
+
+def metrics_dashboard(request):
+    """Admin page summarising the request histograms of all workers."""
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Performance metrics',
+        'rows': metrics.summary(),
+    }
+    return render(request, 'admin/main/metrics.html', context)
+
+
+def prometheus_metrics(request):
+    """Prometheus text exposition; needs METRICS_TOKEN as a bearer token or a staff login."""
+    token = settings.METRICS_TOKEN
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not (token and hmac.compare_digest(supplied, token)) and not request.user.is_staff:
+        raise Http404
+    return HttpResponse(metrics.prometheus_text(), content_type='text/plain; version=0.0.4')
@@ -12,5 +12,10 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'thinkcesite.settings')
+# Route the async public views (main.async_views), and close database
+# connections after each request: persistent connections belong to the
+# threads async code hands work to, which come and go.
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -54,6 +54,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main.middleware.FileServingMiddleware',
+    'main.middleware.ServerTimingMiddleware',
+    'main.middleware.PreloadHintsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,7 +70,7 @@ ROOT_URLCONF = 'thinkcesite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'main.template_backend.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -83,14 +86,38 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'thinkcesite.wsgi.application'
 
+# Flash messages live in a cookie only, never the session, so a page render
+# (including the async views' renders on the event loop) doesn't query
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# SQLite is tuned for a few gunicorn workers sharing one file: WAL lets
+# readers run alongside the single writer, write transactions start with
+# BEGIN IMMEDIATE so concurrent submissions queue on busy_timeout instead of
+# failing with "database is locked", and connections are kept per worker.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),  # ms
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -20000,  # KiB
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
     }
 }
 
@@ -133,6 +160,17 @@ STATIC_URL = 'static/'
 
 STATIC_ROOT = BASE_DIR / 'static'
 
+# collectstatic writes content-hashed copies, a manifest for {% static %}
+# and precompressed .gz/.br siblings (see main/storage.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'main.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Email Configuration (Production-Ready)
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'mail.thinkce.org')
@@ -147,6 +185,42 @@ DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', f'ThinkCE <{EMAIL_HOST
 CONTACT_EMAIL = os.environ.get('CONTACT_EMAIL', 'contact@thinkce.org')
 APPOINTMENT_EMAIL = os.environ.get('APPOINTMENT_EMAIL', 'appointment@thinkce.org')
 
+# Bookable appointment slots (see main/slots.py). Opening hours per weekday,
+# Monday = 0; days left out are closed.
+APPOINTMENT_BUSINESS_HOURS = {
+    0: ('09:00', '17:00'),
+    1: ('09:00', '17:00'),
+    2: ('09:00', '17:00'),
+    3: ('09:00', '17:00'),
+    4: ('09:00', '17:00'),
+}
+APPOINTMENT_SLOT_MINUTES = int(os.environ.get('APPOINTMENT_SLOT_MINUTES', 30))
+APPOINTMENT_BOOKING_DAYS = int(os.environ.get('APPOINTMENT_BOOKING_DAYS', 60))  # how far ahead clients can book
+APPOINTMENT_AVAILABILITY_CACHE_TIMEOUT = 3600
+
+# Email Outbox (drained by `manage.py send_outbox`)
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 30))
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_POLL_INTERVAL = 2.0
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_RETRY_DELAY = 60  # seconds, doubled after every failed attempt
+OUTBOX_MAX_RETRY_DELAY = 6 * 3600
+# Sent messages are deleted by send_outbox after this many days
+OUTBOX_RETENTION_DAYS = int(os.environ.get('OUTBOX_RETENTION_DAYS', 30))
+
+# Admin changelists reuse row counts for this many seconds (main/paginators.py)
+CHANGELIST_COUNT_CACHE_TIMEOUT = 300
+
+# Newsletter campaigns (sent by `manage.py send_campaign`)
+NEWSLETTER_SEND_RATE = float(os.environ.get('NEWSLETTER_SEND_RATE', 5))  # messages per second
+# A run pauses (checkpointed, status "paused") after this many connection
+# errors in a row, waiting NEWSLETTER_RETRY_DELAY seconds, doubled each time,
+# between them; rerun send_campaign once the SMTP server is back.
+NEWSLETTER_MAX_CONNECTION_ERRORS = int(os.environ.get('NEWSLETTER_MAX_CONNECTION_ERRORS', 5))
+NEWSLETTER_RETRY_DELAY = float(os.environ.get('NEWSLETTER_RETRY_DELAY', 5))
+# Absolute base of the links in emails (unsubscribe)
+SITE_URL = os.environ.get('SITE_URL', 'https://thinkce.org')
+
 # Unfold Configuration
 UNFOLD = {
     "SITE_TITLE": "ThinkCE Admin",
@@ -158,6 +232,139 @@ UNFOLD = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Serve STATIC_ROOT and MEDIA_ROOT from Django itself (main/file_serving.py),
+# e.g. in a container without nginx; behind nginx those requests never get here.
+# Hashed static files are immutable; everything else is cached this long.
+SERVE_FILES = os.environ.get('SERVE_FILES', 'True') == 'True'
+SERVE_FILES_MAX_AGE = int(os.environ.get('SERVE_FILES_MAX_AGE', 3600))
+
+# Widths of the resized derivatives built for uploaded images (see main/images.py)
+IMAGE_DERIVATIVE_WIDTHS = [480, 960, 1600]
+
+# Runtime state shared by the gunicorn workers (content versions, etc.)
+VAR_DIR = Path(os.environ.get('DJANGO_VAR_DIR', BASE_DIR / 'var'))
+CONTENT_VERSIONS_FILE = VAR_DIR / 'content_versions.json'
+# 'file' (CONTENT_VERSIONS_FILE, one host) or 'database' (the ContentVersion
+# table, for workers that share the database but not VAR_DIR; admin edits
+# show up within CONTENT_VERSIONS_MAX_DELAY seconds), see main/versions.py
+CONTENT_VERSIONS_BACKEND = os.environ.get('CONTENT_VERSIONS_BACKEND', 'file')
+CONTENT_VERSIONS_MAX_DELAY = float(os.environ.get('CONTENT_VERSIONS_MAX_DELAY', 0.1))
+
+# One cache for all the workers on the host (see main/sqlite_cache.py), so a
+# page or fragment rendered by one is served by every other; least recently
+# used entries are evicted beyond MAX_SIZE bytes
+CACHES = {
+    'default': {
+        'BACKEND': 'main.sqlite_cache.SQLiteCache',
+        'LOCATION': VAR_DIR / 'cache.sqlite3',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_SIZE': int(os.environ.get('CACHE_MAX_SIZE', 64 * 1024 * 1024)),
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+# Most rows a public page renders from one table (testimonials, team members),
+# so page size and render time stay bounded however long the tables grow
+PUBLIC_LIST_LIMIT = int(os.environ.get('PUBLIC_LIST_LIMIT', 50))
+
+# Route the async versions of the public views (main/async_views.py). On for
+# ASGI (thinkcesite/asgi.py sets it); under WSGI async views only add overhead.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+
+# Full-page cache for anonymous GETs of the public views (see main/caching.py)
+PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', str(not DEBUG)) == 'True'
+PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 3600))
+# ETag/Last-Modified on the same pages, from content versions and the deployed
+# templates, so revalidations get a 304 without rendering (main/caching.py)
+CONDITIONAL_GET_ENABLED = os.environ.get('CONDITIONAL_GET_ENABLED', str(not DEBUG)) == 'True'
+
+# Cloudflare edge caching (see main/edge.py): anonymous responses are marked
+# shareable for EDGE_CACHE_TTLS seconds and tagged with their models;
+# `manage.py purge_edge_cache` purges the tags of edited models
+EDGE_CACHE_ENABLED = os.environ.get('EDGE_CACHE_ENABLED', 'False') == 'True'
+EDGE_CACHE_TTLS = {
+    'home': 24 * 3600,
+    'about': 24 * 3600,
+    'services': 24 * 3600,
+    'companies': 24 * 3600,
+    'contact': 24 * 3600,
+    'appointment': 3600,  # the date picker starts at today
+    'sitemap': 24 * 3600,
+}
+EDGE_PURGE_CLIENT = os.environ.get('EDGE_PURGE_CLIENT', 'main.edge.CloudflarePurgeClient')
+EDGE_PURGE_API_BASE = os.environ.get('EDGE_PURGE_API_BASE', 'https://api.cloudflare.com/client/v4')
+CLOUDFLARE_ZONE_ID = os.environ.get('CLOUDFLARE_ZONE_ID', '')
+CLOUDFLARE_API_TOKEN = os.environ.get('CLOUDFLARE_API_TOKEN', '')
+EDGE_PURGE_TIMEOUT = 10  # seconds per API call
+EDGE_PURGE_DEBOUNCE = 2.0  # seconds without further edits before purging
+EDGE_PURGE_MAX_DELAY = 30.0  # purge anyway once an edit has waited this long
+EDGE_PURGE_BATCH_SIZE = 30  # tags per API call
+EDGE_PURGE_STATE_FILE = VAR_DIR / 'edge_purged.json'
+
+# {% cachefragment %} blocks, keyed on content versions; they still apply to
+# pages the page cache can't serve (flash messages, logged-in staff, POSTs)
+FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', str(not DEBUG)) == 'True'
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 24 * 3600))
+
+# Above-the-fold CSS inlined into each page's <head> (see main/critical_css.py),
+# written by `manage.py build_critical_css`; pages fall back to a plain
+# stylesheet link until it has run
+CRITICAL_CSS_FILE = VAR_DIR / 'critical_css.json'
+
+# Send each public page's Link: rel=preload headers (see main/preload.py) as
+# a 103 Early Hints response too, when gunicorn offers wsgi.early_hints. That
+# takes an HTTP/1.1 request, so behind nginx only 1.29+ with
+# proxy_http_version 1.1 and early_hints (deploy.sh sets both when it can)
+PRELOAD_EARLY_HINTS = os.environ.get('PRELOAD_EARLY_HINTS', 'True') == 'True'
+
+# Token-bucket throttling of the form POSTs (see main/throttling.py). Each
+# limit is (burst, period in seconds): `burst` submissions at once, refilling
+# evenly over `period`.
+THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', 'True') == 'True'
+THROTTLE_DB = VAR_DIR / 'throttle.sqlite3'
+# Key on CF-Connecting-IP instead of REMOTE_ADDR, but only for requests that
+# come from THROTTLE_TRUSTED_PROXIES; anyone else could forge it. deploy.sh
+# turns it on for gunicorn behind nginx.
+THROTTLE_TRUST_CF_HEADER = os.environ.get('THROTTLE_TRUST_CF_HEADER', 'False') == 'True'
+# The local nginx (which only admits Cloudflare) and Cloudflare's published
+# ranges (https://www.cloudflare.com/ips/), for when Cloudflare connects directly
+THROTTLE_TRUSTED_PROXIES = [
+    '127.0.0.0/8', '::1/128',
+    '173.245.48.0/20', '103.21.244.0/22', '103.22.200.0/22', '103.31.4.0/22', '141.101.64.0/18',
+    '108.162.192.0/18', '190.93.240.0/20', '188.114.96.0/20', '197.234.240.0/22', '198.41.128.0/17',
+    '162.158.0.0/15', '104.16.0.0/13', '104.24.0.0/14', '172.64.0.0/13', '131.0.72.0/22',
+    '2400:cb00::/32', '2606:4700::/32', '2803:f800::/32', '2405:b500::/32', '2405:8100::/32',
+    '2a06:98c0::/29', '2c0f:f248::/32',
+]
+THROTTLE_LIMITS = {
+    'contact': {'ip': (5, 600), 'email': (3, 3600)},
+    'appointment': {'ip': (5, 600), 'email': (3, 3600)},
+    'subscribe': {'ip': (10, 3600), 'email': (2, 3600)},
+}
+
+# Group-commit write buffer (see main/journal.py): contact and subscribe
+# submissions are journaled under VAR_DIR/journal and inserted in batches by
+# `manage.py flush_journal`, which must be running when this is enabled.
+WRITE_BUFFER_ENABLED = os.environ.get('WRITE_BUFFER_ENABLED', 'False') == 'True'
+WRITE_BUFFER_FSYNC = os.environ.get('WRITE_BUFFER_FSYNC', 'False') == 'True'
+WRITE_BUFFER_FLUSH_INTERVAL = 0.005  # seconds the flusher waits for more rows
+WRITE_BUFFER_BATCH_SIZE = 500
+WRITE_BUFFER_SEGMENT_SECONDS = 60
+
+# Request metrics (see main/metrics.py): Server-Timing header and per-worker
+# histograms aggregated for the admin dashboard and the Prometheus endpoint.
+# The header shows anyone how long each page's queries take (and how that
+# changes with the input), so it is only on in development by default.
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', str(DEBUG)) == 'True'
+METRICS_FLUSH_INTERVAL = 1.0  # seconds
+METRICS_RETENTION = 24 * 3600  # drop reports of workers silent for this long
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Publish directory written by `manage.py export_static_site` and served by nginx
+STATIC_EXPORT_DIR = Path(os.environ.get('STATIC_EXPORT_DIR', BASE_DIR / 'public'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
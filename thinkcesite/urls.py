@@ -16,37 +16,17 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
-from django.contrib.sitemaps.views import sitemap
-from django.contrib.sitemaps import Sitemap
-from django.urls import reverse
 from django.http import HttpResponse
-
-class StaticViewSitemap(Sitemap):
-    priority = 0.5
-    changefreq = 'daily'
-
-    def items(self):
-        return ['home', 'about', 'services', 'companies', 'contact', 'appointment']
-
-    def location(self, item):
-        return reverse(item)
-
-sitemaps = {
-    'static': StaticViewSitemap,
-}
+from main.views import metrics_dashboard, sitemap_xml
 
 def robots_txt(request):
     content = "User-agent: *\nDisallow:\nSitemap: {}/sitemap.xml".format(request.scheme + "://" + request.get_host())
     return HttpResponse(content, content_type="text/plain")
 
 urlpatterns = [
+    path('admin/metrics/', admin.site.admin_view(metrics_dashboard), name='admin_metrics'),
     path('admin/', admin.site.urls),
     path('', include('main.urls')),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    path('sitemap.xml', sitemap_xml, name='django.contrib.sitemaps.views.sitemap'),
     path('robots.txt', robots_txt),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)